@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Connection rate benchmark for create_server(accept_batch=...).
+
+Client processes open and immediately close many short-lived connections
+against a gbulb server, once per accept_batch value, and the number of
+connections accepted per second is printed for each run.
+
+    python3 examples/bench-accept.py [CONNECTIONS [CLIENTS [BATCH ...]]]
+"""
+
+import multiprocessing
+import socket
+import sys
+import time
+
+import asyncio
+import gbulb
+
+
+class CountingProtocol(asyncio.Protocol):
+
+    accepted = 0
+
+    def connection_made(self, transport):
+        CountingProtocol.accepted += 1
+        transport.close()
+
+
+def client(port, count, start):
+    start.wait()
+    for i in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.close()
+
+
+@asyncio.coroutine
+def wait_for(count):
+    while CountingProtocol.accepted < count:
+        yield from asyncio.sleep(0.01)
+
+
+def run(loop, connections, clients, accept_batch):
+    CountingProtocol.accepted = 0
+    server = loop.run_until_complete(loop.create_server(
+        CountingProtocol, '127.0.0.1', 0, backlog=1024,
+        accept_batch=accept_batch))
+    port = server.sockets[0].getsockname()[1]
+
+    start = multiprocessing.Event()
+    per_client = connections // clients
+    procs = [multiprocessing.Process(target=client,
+                                     args=(port, per_client, start))
+             for i in range(clients)]
+    for proc in procs:
+        proc.start()
+
+    t0 = time.perf_counter()
+    start.set()
+    loop.run_until_complete(wait_for(per_client * clients))
+    elapsed = time.perf_counter() - t0
+
+    for proc in procs:
+        proc.join()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    return per_client * clients / elapsed
+
+
+def main(argv):
+    connections = int(argv[1]) if len(argv) > 1 else 20000
+    clients = int(argv[2]) if len(argv) > 2 else 8
+    batches = [int(arg) for arg in argv[3:]] or [1, 16, 64]
+
+    asyncio.set_event_loop_policy(gbulb.GLibEventLoopPolicy())
+    loop = asyncio.get_event_loop()
+    for accept_batch in batches:
+        rate = run(loop, connections, clients, accept_batch)
+        print('accept_batch=%-4d %10.0f connections/s' % (accept_batch, rate))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
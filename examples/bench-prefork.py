@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Request rate of a prefork echo server against its number of workers.
+
+For each worker count, a server is started with gbulb.run_prefork() and
+client processes send small requests over persistent connections for a
+few seconds; the aggregate number of requests per second is printed.
+
+    python3 examples/bench-prefork.py [SECONDS [CLIENTS [WORKERS ...]]]
+"""
+
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+import asyncio
+import gbulb
+
+PORT = 8907
+REQUEST = b'x' * 64
+
+
+class EchoProtocol(asyncio.Protocol):
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.transport.write(data)
+
+
+def serve(workers):
+    gbulb.run_prefork(EchoProtocol, '127.0.0.1', PORT, workers=workers,
+                      backlog=1024)
+
+
+def client(duration, start, results):
+    start.wait()
+    sock = socket.create_connection(('127.0.0.1', PORT))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, True)
+    count = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        sock.sendall(REQUEST)
+        received = 0
+        while received < len(REQUEST):
+            received += len(sock.recv(65536))
+        count += 1
+    sock.close()
+    results.put(count)
+
+
+def wait_listening():
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', PORT)).close()
+            return
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+
+
+def run(duration, clients, workers):
+    server = multiprocessing.Process(target=serve, args=(workers,))
+    server.start()
+    wait_listening()
+    # Leave every worker the time to bind its socket.
+    time.sleep(0.5)
+
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=client,
+                                     args=(duration, start, results))
+             for i in range(clients)]
+    for proc in procs:
+        proc.start()
+    start.set()
+    total = sum(results.get() for proc in procs)
+    for proc in procs:
+        proc.join()
+
+    os.kill(server.pid, signal.SIGTERM)
+    server.join()
+    return total / duration
+
+
+def main(argv):
+    duration = float(argv[1]) if len(argv) > 1 else 5.0
+    clients = int(argv[2]) if len(argv) > 2 else 4 * (os.cpu_count() or 1)
+    workers = [int(arg) for arg in argv[3:]]
+    if not workers:
+        workers = [1]
+        while workers[-1] * 2 <= (os.cpu_count() or 1):
+            workers.append(workers[-1] * 2)
+
+    for count in workers:
+        rate = run(duration, clients, count)
+        print('workers=%-3d %10.0f requests/s' % (count, rate))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
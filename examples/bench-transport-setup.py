@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Per-connection cost of creating a socket transport.
+
+The transport is created over a socketpair, once without looking up the
+socket addresses (they are fetched lazily by get_extra_info()) and once
+querying sockname and peername, and the cost per connection is printed.
+
+    python3 examples/bench-transport-setup.py [NUMBER]
+"""
+
+import socket
+import sys
+import timeit
+
+import asyncio
+from gbulb import selector_events
+
+
+class Loop:
+    # Just what _SelectorSocketTransport.__init__() needs.
+
+    def add_reader(self, *args):
+        pass
+
+    call_soon = add_reader
+
+
+def main(argv):
+    number = int(argv[1]) if len(argv) > 1 else 2000
+
+    loop = Loop()
+    protocol = asyncio.Protocol()
+    rsock, wsock = socket.socketpair()
+    make = selector_events._SelectorSocketTransport
+
+    def setup():
+        make(loop, rsock, protocol, extra={'peername': ''})
+
+    def setup_and_query():
+        tr = make(loop, rsock, protocol)
+        tr.get_extra_info('sockname')
+        tr.get_extra_info('peername')
+
+    try:
+        lazy = min(timeit.repeat(setup, number=number, repeat=3))
+        eager = min(timeit.repeat(setup_and_query, number=number, repeat=3))
+    finally:
+        rsock.close()
+        wsock.close()
+    print('setup: %.2f us/connection, with address lookups: '
+          '%.2f us/connection' % (lazy / number * 1e6, eager / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
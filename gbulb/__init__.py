@@ -1,2 +1,7 @@
+from .gio import *
 from .glib_events import *
-
+from .prefork import *
+from .resolver import *
+from .signals import *
+from .streams import *
+from .workers import *
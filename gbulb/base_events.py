@@ -16,6 +16,9 @@ to modify the meaning of the API call itself.
 
 import collections
 import concurrent.futures
+import functools
+import inspect
+import itertools
 #import heapq
 import logging
 import socket
@@ -23,12 +26,13 @@ import subprocess
 import time
 import os
 import sys
+import traceback
 
 from asyncio import events
 from asyncio import futures
 from asyncio import tasks
 from asyncio.log import logger
-from asyncio.base_events import Server
+from asyncio import base_events
 
 
 __all__ = ['BaseEventLoop']
@@ -37,6 +41,9 @@ __all__ = ['BaseEventLoop']
 # Argument for default thread pool executor creation.
 _MAX_WORKERS = 5
 
+# Threads of the executor running the blocking calls of file transports.
+_FILE_IO_WORKERS = 4
+
 
 #class _StopError(BaseException):
 #    """Raised to stop the event loop."""
@@ -89,14 +96,91 @@ _MAX_WORKERS = 5
 #        yield from waiter
 
 
+def _interleave_addrinfos(addrinfos, first_address_family_count=1):
+    """Interleave a list of getaddrinfo() results by address family.
+
+    The first first_address_family_count entries of the first family are
+    kept in front (RFC 8305, section 4).
+    """
+    by_family = collections.OrderedDict()
+    for addrinfo in addrinfos:
+        by_family.setdefault(addrinfo[0], []).append(addrinfo)
+    lists = list(by_family.values())
+
+    reordered = []
+    if first_address_family_count > 1:
+        reordered.extend(lists[0][:first_address_family_count - 1])
+        del lists[0][:first_address_family_count - 1]
+    reordered.extend(
+        addrinfo
+        for addrinfo in itertools.chain.from_iterable(
+            itertools.zip_longest(*lists))
+        if addrinfo is not None)
+    return reordered
+
+
+def _format_handle(handle):
+    cb = handle._callback
+    if inspect.ismethod(cb) and isinstance(cb.__self__, tasks.Task):
+        # format the task
+        return repr(cb.__self__)
+    else:
+        return str(handle)
+
+
+def _handle_origin(handle):
+    # Return a label and the traceback of where the code run by handle was
+    # created: the coroutine of a task (coroutine wrappers only exist with
+    # PYTHONASYNCIODEBUG set), the task, or else the handle itself.
+    cb = handle._callback
+    if inspect.ismethod(cb) and isinstance(cb.__self__, tasks.Task):
+        task = cb.__self__
+        tb = getattr(task._coro, '_source_traceback', None)
+        if tb:
+            return 'Coroutine created at', tb
+        if task._source_traceback:
+            return 'Task created at', task._source_traceback
+    return 'Handle created at', getattr(handle, '_source_traceback', None)
+
+
+class Server(base_events.Server):
+
+    def __init__(self, loop, sockets):
+        super().__init__(loop, sockets)
+        self._handshake_limiter = None
+        self._worker_pool = None
+
+    def close(self):
+        super().close()
+        if self._handshake_limiter is not None:
+            # Not attached to the server yet: close() is the last chance.
+            self._handshake_limiter.close()
+
+    def get_handshake_stats(self):
+        """Return a dict of SSL handshake statistics, or None.
+
+        None is returned when the server does not use SSL.
+        """
+        if self._handshake_limiter is None:
+            return None
+        return self._handshake_limiter.get_stats()
+
+
 class BaseEventLoop(events.AbstractEventLoop):
 
     def __init__(self):
 #        self._ready = collections.deque()
 #        self._scheduled = []
         self._default_executor = None
+        self._file_executor = None
+        self._resolver_cache = None
         self._internal_fds = 0
 #        self._running = False
+        self._debug = (not sys.flags.ignore_environment
+                       and bool(os.environ.get('PYTHONASYNCIODEBUG')))
+        # In debug mode, if the execution of a callback or a step of a task
+        # exceed this duration in seconds, the slow callback/task is logged.
+        self.slow_callback_duration = 0.1
 
     def create_task(self, coro):
         """Schedule a coroutine object.
@@ -115,10 +199,15 @@ class BaseEventLoop(events.AbstractEventLoop):
 
     def _make_ssl_transport(self, rawsock, protocol, sslcontext, waiter, *,
                             server_side=False, server_hostname=None,
-                            extra=None, server=None):
+                            extra=None, server=None, session_key=None,
+                            handshake_timeout=None, handshake_callback=None):
         """Create SSL transport."""
         raise NotImplementedError
 
+    def _make_handshake_limiter(self, max_concurrent=None, timeout=None):
+        """Create the SSL handshake limiter of a server."""
+        raise NotImplementedError
+
     def _make_datagram_transport(self, sock, protocol,
                                  address=None, extra=None):
         """Create datagram transport."""
@@ -134,6 +223,16 @@ class BaseEventLoop(events.AbstractEventLoop):
         """Create write pipe transport."""
         raise NotImplementedError
 
+    def _make_read_file_transport(self, file, protocol, waiter=None,
+                                  extra=None, **kwargs):
+        """Create read file transport."""
+        raise NotImplementedError
+
+    def _make_write_file_transport(self, file, protocol, waiter=None,
+                                   extra=None, **kwargs):
+        """Create write file transport."""
+        raise NotImplementedError
+
     @tasks.coroutine
     def _make_subprocess_transport(self, protocol, args, shell,
                                    stdin, stdout, stderr, bufsize,
@@ -208,6 +307,10 @@ class BaseEventLoop(events.AbstractEventLoop):
         if executor is not None:
             self._default_executor = None
             executor.shutdown(wait=False)
+        executor = self._file_executor
+        if executor is not None:
+            self._file_executor = None
+            executor.shutdown(wait=False)
 
 #    def is_running(self):
 #        """Returns running status of event loop."""
@@ -277,24 +380,151 @@ class BaseEventLoop(events.AbstractEventLoop):
                 self._default_executor = executor
         return futures.wrap_future(executor.submit(callback, *args), loop=self)
 
+    def _run_file_io(self, callback, *args):
+        # File transports use their own bounded executor so that slow disks
+        # do not starve run_in_executor() users, and the other way round.
+        executor = self._file_executor
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(_FILE_IO_WORKERS)
+            self._file_executor = executor
+        return self.run_in_executor(executor, callback, *args)
+
     def set_default_executor(self, executor):
         self._default_executor = executor
 
     def getaddrinfo(self, host, port, *,
                     family=0, type=0, proto=0, flags=0):
+        cache = self._resolver_cache
+        if cache is None:
+            return self._getaddrinfo(host, port, family, type, proto, flags)
+        return cache.lookup(
+            self, (host, port, family, type, proto, flags),
+            functools.partial(self._getaddrinfo,
+                              host, port, family, type, proto, flags))
+
+    def _getaddrinfo(self, host, port, family, type, proto, flags):
         return self.run_in_executor(None, socket.getaddrinfo,
                                     host, port, family, type, proto, flags)
 
+    def set_resolver_cache(self, cache):
+        """Set the ResolverCache used by getaddrinfo().
+
+        None (the default) disables caching.
+        """
+        self._resolver_cache = cache
+
+    def get_resolver_cache(self):
+        return self._resolver_cache
+
+    def get_resolver_stats(self):
+        """Return the statistics of the resolver cache, or None."""
+        if self._resolver_cache is None:
+            return None
+        return self._resolver_cache.get_stats()
+
     def getnameinfo(self, sockaddr, flags=0):
         return self.run_in_executor(None, socket.getnameinfo, sockaddr, flags)
 
+    @tasks.coroutine
+    def _connect_sock(self, exceptions, addr_info, laddr_infos=None):
+        """Create a socket for addr_info, bind it and connect it.
+
+        Return the connected socket, or None after adding the errors to
+        exceptions.
+        """
+        family, type, proto, cname, address = addr_info
+        sock = None
+        try:
+            sock = socket.socket(family=family, type=type, proto=proto)
+            sock.setblocking(False)
+            if laddr_infos is not None:
+                for _, _, _, _, laddr in laddr_infos:
+                    try:
+                        sock.bind(laddr)
+                        break
+                    except OSError as exc:
+                        exc = OSError(
+                            exc.errno, 'error while '
+                            'attempting to bind on address '
+                            '{!r}: {}'.format(
+                                laddr, exc.strerror.lower()))
+                        exceptions.append(exc)
+                else:
+                    sock.close()
+                    return None
+            yield from self.sock_connect(sock, address)
+            return sock
+        except OSError as exc:
+            if sock is not None:
+                sock.close()
+            exceptions.append(exc)
+            return None
+        except:
+            # Cancelled: the connect may still be waiting for the socket
+            # to become writable.
+            if sock is not None:
+                self.remove_writer(sock.fileno())
+                sock.close()
+            raise
+
+    @tasks.coroutine
+    def _staggered_connect(self, exceptions, infos, laddr_infos, delay):
+        """Connect to the first address of infos which answers.
+
+        A new attempt is started every delay seconds, or as soon as the
+        running ones have failed (RFC 8305).  The attempts still running
+        when one succeeds are cancelled.  Return (sock, address), or
+        (None, None) if every attempt failed.
+        """
+        infos = collections.deque(infos)
+        attempts = {}  # task -> address
+        winner = None
+        try:
+            while winner is None:
+                if infos:
+                    info = infos.popleft()
+                    attempt = tasks.async(
+                        self._connect_sock(exceptions, info, laddr_infos),
+                        loop=self)
+                    attempts[attempt] = info[4]
+                running = [attempt for attempt in attempts
+                           if not attempt.done()]
+                if not running:
+                    if infos:
+                        continue
+                    break
+                done, _ = yield from tasks.wait(
+                    running, timeout=delay if infos else None,
+                    return_when=tasks.FIRST_COMPLETED, loop=self)
+                for attempt in done:
+                    if attempt.result() is not None and winner is None:
+                        winner = attempt
+        finally:
+            for attempt in attempts:
+                if attempt is winner:
+                    continue
+                if not attempt.done():
+                    attempt.cancel()
+                elif (not attempt.cancelled() and
+                        attempt.exception() is None and
+                        attempt.result() is not None):
+                    # Connected at the same time as the winner.
+                    attempt.result().close()
+        if winner is None:
+            return None, None
+        return winner.result(), attempts[winner]
+
     @tasks.coroutine
     def create_connection(self, protocol_factory, host=None, port=None, *,
                           ssl=None, family=0, proto=0, flags=0, sock=None,
-                          local_addr=None, server_hostname=None):
+                          local_addr=None, server_hostname=None,
+                          happy_eyeballs_delay=None, interleave=None):
         """XXX"""
         if server_hostname is not None and not ssl:
             raise ValueError('server_hostname is only meaningful with ssl')
+        if happy_eyeballs_delay is not None and interleave is None:
+            # RFC 8305 recommends interleaving the address families.
+            interleave = 1
 
         if server_hostname is None and ssl:
             # Use host as default for server_hostname.  It is an error
@@ -312,6 +542,7 @@ class BaseEventLoop(events.AbstractEventLoop):
                                  'when using ssl without a host')
             server_hostname = host
 
+        peername = None
         if host is not None or port is not None:
             if sock is not None:
                 raise ValueError(
@@ -334,40 +565,28 @@ class BaseEventLoop(events.AbstractEventLoop):
             infos = f1.result()
             if not infos:
                 raise OSError('getaddrinfo() returned empty list')
+            laddr_infos = None
             if f2 is not None:
                 laddr_infos = f2.result()
                 if not laddr_infos:
                     raise OSError('getaddrinfo() returned empty list')
 
+            if interleave:
+                infos = _interleave_addrinfos(infos, interleave)
+
             exceptions = []
-            for family, type, proto, cname, address in infos:
-                try:
-                    sock = socket.socket(family=family, type=type, proto=proto)
-                    sock.setblocking(False)
-                    if f2 is not None:
-                        for _, _, _, _, laddr in laddr_infos:
-                            try:
-                                sock.bind(laddr)
-                                break
-                            except OSError as exc:
-                                exc = OSError(
-                                    exc.errno, 'error while '
-                                    'attempting to bind on address '
-                                    '{!r}: {}'.format(
-                                        laddr, exc.strerror.lower()))
-                                exceptions.append(exc)
-                        else:
-                            sock.close()
-                            sock = None
-                            continue
-                    yield from self.sock_connect(sock, address)
-                except OSError as exc:
+            if happy_eyeballs_delay is None:
+                # Try the addresses one after the other.
+                for info in infos:
+                    sock = yield from self._connect_sock(
+                        exceptions, info, laddr_infos)
                     if sock is not None:
-                        sock.close()
-                    exceptions.append(exc)
-                else:
-                    break
+                        peername = info[4]
+                        break
             else:
+                sock, peername = yield from self._staggered_connect(
+                    exceptions, infos, laddr_infos, happy_eyeballs_delay)
+            if sock is None:
                 if len(exceptions) == 1:
                     raise exceptions[0]
                 else:
@@ -385,16 +604,28 @@ class BaseEventLoop(events.AbstractEventLoop):
                 'host and port was not specified and no sock specified')
 
         sock.setblocking(False)
+        # The transport would otherwise ask the socket for the address we
+        # have just connected to.
+        extra = {'peername': peername} if peername is not None else None
 
         protocol = protocol_factory()
         waiter = futures.Future(loop=self)
         if ssl:
             sslcontext = None if isinstance(ssl, bool) else ssl
+            if port is None:
+                try:
+                    port = sock.getpeername()[1]
+                except (OSError, IndexError, TypeError):
+                    pass
+            # Key of the TLS session to resume (completed with the context).
+            session_key = (server_hostname, port) if server_hostname else None
             transport = self._make_ssl_transport(
                 sock, protocol, sslcontext, waiter,
-                server_side=False, server_hostname=server_hostname)
+                server_side=False, server_hostname=server_hostname,
+                extra=extra, session_key=session_key)
         else:
-            transport = self._make_socket_transport(sock, protocol, waiter)
+            transport = self._make_socket_transport(sock, protocol, waiter,
+                                                    extra=extra)
 
         yield from waiter
         return transport, protocol
@@ -475,10 +706,36 @@ class BaseEventLoop(events.AbstractEventLoop):
                       sock=None,
                       backlog=100,
                       ssl=None,
-                      reuse_address=None):
+                      reuse_address=None,
+                      reuse_port=None,
+                      ssl_handshake_timeout=None,
+                      max_concurrent_handshakes=None,
+                      accept_batch=1,
+                      worker_pool=None):
         """XXX"""
         if isinstance(ssl, bool):
             raise TypeError('ssl argument must be an SSLContext or None')
+        if worker_pool is not None and (ssl_handshake_timeout is not None or
+                                        max_concurrent_handshakes is not None):
+            raise ValueError('SSL handshake limits are not supported '
+                             'with a worker_pool')
+        if accept_batch < 1:
+            raise ValueError('accept_batch should be at least 1, got %r'
+                             % (accept_batch,))
+        if ssl is None:
+            if ssl_handshake_timeout is not None:
+                raise ValueError(
+                    'ssl_handshake_timeout is only meaningful with ssl')
+            if max_concurrent_handshakes is not None:
+                raise ValueError(
+                    'max_concurrent_handshakes is only meaningful with ssl')
+        if ssl_handshake_timeout is not None and ssl_handshake_timeout <= 0:
+            raise ValueError('ssl_handshake_timeout should be a positive '
+                             'number, got %r' % (ssl_handshake_timeout,))
+        if max_concurrent_handshakes is not None and \
+                max_concurrent_handshakes < 1:
+            raise ValueError('max_concurrent_handshakes should be at least 1, '
+                             'got %r' % (max_concurrent_handshakes,))
         if host is not None or port is not None:
             if sock is not None:
                 raise ValueError(
@@ -487,6 +744,9 @@ class BaseEventLoop(events.AbstractEventLoop):
             AF_INET6 = getattr(socket, 'AF_INET6', 0)
             if reuse_address is None:
                 reuse_address = os.name == 'posix' and sys.platform != 'cygwin'
+            if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+                raise ValueError(
+                    'reuse_port not supported by socket module')
             sockets = []
             if host == '':
                 host = None
@@ -510,6 +770,12 @@ class BaseEventLoop(events.AbstractEventLoop):
                     if reuse_address:
                         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR,
                                         True)
+                    if reuse_port:
+                        # Several processes may then listen on the same
+                        # address, the kernel balancing connections among
+                        # them.
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT,
+                                        True)
                     # Disable IPv4/IPv6 dual stack support (enabled by
                     # default on Linux) which makes a single socket
                     # listen on both address families.
@@ -535,10 +801,15 @@ class BaseEventLoop(events.AbstractEventLoop):
             sockets = [sock]
 
         server = Server(self, sockets)
+        server._worker_pool = worker_pool
+        if ssl is not None and worker_pool is None:
+            server._handshake_limiter = self._make_handshake_limiter(
+                max_concurrent_handshakes, ssl_handshake_timeout)
         for sock in sockets:
             sock.listen(backlog)
             sock.setblocking(False)
-            self._start_serving(protocol_factory, sock, ssl, server)
+            self._start_serving(protocol_factory, sock, ssl, server,
+                                accept_batch)
         return server
 
     @tasks.coroutine
@@ -557,6 +828,42 @@ class BaseEventLoop(events.AbstractEventLoop):
         yield from waiter
         return transport, protocol
 
+    @tasks.coroutine
+    def connect_read_file(self, protocol_factory, file, *, offset=0,
+                          chunk_size=256 * 1024, use_mmap=False):
+        """Read the regular file object file into a protocol.
+
+        The file is read from offset in chunks of chunk_size bytes (rounded
+        up to whole pages), by threads of a small executor dedicated to file
+        I/O; the next chunk is read while the protocol handles the current
+        one.  With use_mmap, the file is mapped read-only and the chunks
+        are copied out of the mapping instead of read with pread().  The
+        transport closes the file.
+        """
+        protocol = protocol_factory()
+        waiter = futures.Future(loop=self)
+        transport = self._make_read_file_transport(
+            file, protocol, waiter, offset=offset, chunk_size=chunk_size,
+            use_mmap=use_mmap)
+        yield from waiter
+        return transport, protocol
+
+    @tasks.coroutine
+    def connect_write_file(self, protocol_factory, file, *, offset=None):
+        """Write a protocol into the regular file object file.
+
+        Writing starts at offset, the current position of the file by
+        default.  Buffered data is written with pwrite() by threads of the
+        executor dedicated to file I/O, coalescing small writes; write
+        flow control applies as for sockets.  The transport closes the file.
+        """
+        protocol = protocol_factory()
+        waiter = futures.Future(loop=self)
+        transport = self._make_write_file_transport(file, protocol, waiter,
+                                                    offset=offset)
+        yield from waiter
+        return transport, protocol
+
     @tasks.coroutine
     def subprocess_shell(self, protocol_factory, cmd, *, stdin=subprocess.PIPE,
                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
@@ -675,5 +982,32 @@ class BaseEventLoop(events.AbstractEventLoop):
 #                handle._run()
 #        handle = None  # Needed to break cycles when an exception occurs.
 
+    def _run_handle_debug(self, handle):
+        # Run handle, logging it if it blocked the loop for too long.
+        t0 = self.time()
+        try:
+            handle._run()
+        finally:
+            dt = self.time() - t0
+            if dt >= self.slow_callback_duration:
+                label, tb = _handle_origin(handle)
+                if tb:
+                    logger.warning('Executing %s took %.3f seconds\n'
+                                   '%s (most recent call last):\n%s',
+                                   _format_handle(handle), dt, label,
+                                   ''.join(traceback.format_list(tb)).rstrip())
+                else:
+                    logger.warning('Executing %s took %.3f seconds',
+                                   _format_handle(handle), dt)
+
     def get_debug(self):
-        return False
+        return self._debug
+
+    def set_debug(self, enabled):
+        """Enable or disable the debug mode.
+
+        In debug mode the creation traceback of each handle and task is
+        recorded, and callbacks running longer than slow_callback_duration
+        seconds are logged with the place they were scheduled from.
+        """
+        self._debug = bool(enabled)
@@ -0,0 +1,348 @@
+"""Integration of GIO asynchronous operations with the event loops."""
+
+__all__ = ['wrap_async', 'call_async']
+
+from asyncio import constants
+from asyncio import events
+from asyncio import futures
+from asyncio import transports
+from asyncio.log import logger
+from gi.repository import GLib, Gio
+
+from . import selector_events
+
+
+class _GioStreamTransport(selector_events._FlowControlMixin,
+                          transports.Transport):
+    """Transport over a Gio.InputStream, Gio.OutputStream or Gio.IOStream.
+
+    GIO refuses a second operation on a stream while one is pending, so
+    there is at most one read in flight; the next read is started before the
+    data of the previous one is handed to the protocol.  Writes are
+    coalesced into one write_bytes_async() call at a time.
+    """
+
+    max_size = 256 * 1024  # max bytes we ask for in one read
+
+    def __init__(self, loop, stream, protocol, waiter=None, extra=None):
+        super().__init__(extra)
+        self._extra['stream'] = stream
+        if isinstance(stream, Gio.IOStream):
+            self._input = stream.get_input_stream()
+            self._output = stream.get_output_stream()
+        elif isinstance(stream, Gio.InputStream):
+            self._input = stream
+            self._output = None
+        elif isinstance(stream, Gio.OutputStream):
+            self._input = None
+            self._output = stream
+        else:
+            raise TypeError('a Gio.InputStream, Gio.OutputStream or '
+                            'Gio.IOStream is required, got %r' % (stream,))
+        self._loop = loop
+        self._stream = stream
+        self._protocol = protocol
+        # Reads are cancelled by close(), writes only by abort().
+        self._read_cancellable = Gio.Cancellable()
+        self._write_cancellable = Gio.Cancellable()
+        self._reading = False    # Set while a read is in flight.
+        self._paused = False
+        self._held = None        # Data read while paused.
+        self._buffer = []
+        self._buffer_size = 0
+        self._writing = 0        # Size of the write in flight.
+        self._conn_lost = 0
+        self._eof = False        # Set by write_eof().
+        self._closing = False    # Set by close() or when the input ends.
+        self._closed = False     # Set once the stream is being closed.
+        self._close_exc = None   # Passed to connection_lost().
+        self._loop.call_soon(self._protocol.connection_made, self)
+        if self._input is not None:
+            self._loop.call_soon(self._read_more)
+        if waiter is not None:
+            self._loop.call_soon(waiter.set_result, None)
+
+    # Reading.
+
+    def _read_more(self):
+        if (self._reading or self._paused or self._closing or
+                self._input is None):
+            return
+        self._reading = True
+        self._loop._start_gio(
+            self._input.read_bytes_async, self.max_size,
+            GLib.PRIORITY_DEFAULT, self._read_cancellable,
+            callback=self._read_done, user_data=None)
+
+    def _read_done(self, stream, result, user_data):
+        self._reading = False
+        try:
+            data = stream.read_bytes_finish(result)
+        except GLib.Error as exc:
+            if self._closing:
+                # Cancelled by close() or abort().
+                self._maybe_close()
+            else:
+                self._fatal_error(OSError(exc.message))
+            return
+        if self._closing:
+            self._maybe_close()
+            return
+        # PyGObject copies the contents of the GBytes into a bytes object
+        # anyway: hand that one out as is.
+        data = data.get_data()
+        if not data:
+            self._input = None
+            keep_open = self._protocol.eof_received()
+            if not keep_open or self._output is None:
+                self.close()
+            return
+        if self._paused:
+            self._held = data
+            return
+        self._read_more()
+        self._protocol.data_received(data)
+
+    def pause_reading(self):
+        if self._closing:
+            raise RuntimeError('Cannot pause_reading() when closing')
+        if self._paused:
+            raise RuntimeError('Already paused')
+        self._paused = True
+
+    def resume_reading(self):
+        if not self._paused:
+            raise RuntimeError('Not paused')
+        self._paused = False
+        self._loop.call_soon(self._resume)
+
+    def _resume(self):
+        if self._paused or self._closing:
+            return
+        data, self._held = self._held, None
+        self._read_more()
+        if data is not None:
+            self._protocol.data_received(data)
+
+    # Writing.
+
+    def get_write_buffer_size(self):
+        return self._buffer_size + self._writing
+
+    def write(self, data):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError('data argument must be byte-ish (%r)',
+                            type(data))
+        if self._output is None:
+            raise RuntimeError('the stream is not writable')
+        if self._eof:
+            raise RuntimeError('Cannot call write() after write_eof()')
+        if not data:
+            return
+
+        if self._conn_lost or self._closed:
+            if self._conn_lost >= constants.LOG_THRESHOLD_FOR_CONNLOST_WRITES:
+                logger.warning('write_bytes_async() raised exception.')
+            self._conn_lost += 1
+            return
+
+        self._buffer.append(bytes(data))
+        self._buffer_size += len(data)
+        self._write_more()
+        self._maybe_pause_protocol()
+
+    def _write_more(self):
+        if self._writing or not self._buffer:
+            return
+        if len(self._buffer) == 1:
+            data = self._buffer[0]
+        else:
+            data = b''.join(self._buffer)
+        self._buffer.clear()
+        self._buffer_size = 0
+        self._writing = len(data)
+        self._loop._start_gio(
+            self._output.write_bytes_async, GLib.Bytes.new(data),
+            GLib.PRIORITY_DEFAULT, self._write_cancellable,
+            callback=self._write_done, user_data=data)
+
+    def _write_done(self, stream, result, data):
+        self._writing = 0
+        try:
+            n = stream.write_bytes_finish(result)
+        except GLib.Error as exc:
+            self._conn_lost += 1
+            self._buffer.clear()
+            self._buffer_size = 0
+            if self._closing:
+                # Cancelled by abort(), or failed while closing.
+                self._maybe_close()
+            else:
+                self._fatal_error(OSError(exc.message))
+            return
+        if n < len(data):
+            # Partial write: the rest goes first.
+            self._buffer.insert(0, data[n:])
+            self._buffer_size += len(data) - n
+        self._write_more()
+        self._maybe_resume_protocol()  # May append to buffer.
+        if not self._writing:
+            if self._closing:
+                self._maybe_close()
+            elif self._eof:
+                self._shutdown_output()
+
+    def can_write_eof(self):
+        # Only the output half of an IOStream can be closed on its own.
+        return isinstance(self._stream, Gio.IOStream)
+
+    def write_eof(self):
+        if self._eof:
+            return
+        if not self.can_write_eof():
+            raise RuntimeError('cannot write EOF on a one-way stream')
+        self._eof = True
+        if not self._writing:
+            self._shutdown_output()
+
+    def _shutdown_output(self):
+        # Close the output half of an IOStream, reading goes on.
+        self._loop._start_gio(self._output.close_async, GLib.PRIORITY_DEFAULT,
+                              None, callback=self._output_closed,
+                              user_data=None)
+
+    def _output_closed(self, stream, result, user_data):
+        try:
+            stream.close_finish(result)
+        except GLib.Error as exc:
+            logger.debug('%r: closing the output stream failed: %s',
+                         self, exc.message)
+
+    # Closing.
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._paused = False
+        self._held = None
+        if self._reading:
+            # There is no other way to stop waiting for data.
+            self._read_cancellable.cancel()
+        self._maybe_close()
+
+    def abort(self):
+        self._buffer.clear()
+        self._buffer_size = 0
+        self.close()
+        if self._writing:
+            self._write_cancellable.cancel()
+
+    def _fatal_error(self, exc):
+        # should be called by exception handler only
+        logger.exception('Fatal error for %s', self)
+        if self._close_exc is None:
+            self._close_exc = exc
+        self.abort()
+
+    def _maybe_close(self):
+        # Close the stream once no operation is pending on it any more.
+        if self._closed or self._reading or self._writing or self._buffer:
+            return
+        self._closed = True
+        self._loop._start_gio(self._stream.close_async, GLib.PRIORITY_DEFAULT,
+                              None, callback=self._stream_closed,
+                              user_data=self._close_exc)
+
+    def _stream_closed(self, stream, result, exc):
+        try:
+            stream.close_finish(result)
+        except GLib.Error as close_exc:
+            logger.debug('%r: closing the stream failed: %s',
+                         self, close_exc.message)
+        self._call_connection_lost(exc)
+
+    def _call_connection_lost(self, exc):
+        try:
+            self._protocol.connection_lost(exc)
+        finally:
+            self._stream = None
+            self._input = None
+            self._output = None
+            self._protocol = None
+            self._loop = None
+
+
+# (class, method name) -> wrapper, see wrap_async().
+_wrappers = {}
+
+
+def wrap_async(cls, name):
+    """Return a function running the asynchronous operation name of cls.
+
+    The function calls cls.<name>_async() and cls.<name>_finish(), the
+    usual GIO pair, and is cached for each class and name.  Its signature is
+    f(obj, *args, loop=None, cancellable=None), args being the arguments of
+    the _async() method up to the cancellable.  It returns a future for the
+    value of the _finish() method, which raises GLib.Error on failure.
+
+    The operation is completed directly in the main context of the loop.
+    Cancelling the future cancels the operation through a Gio.Cancellable,
+    cancellable if one is given.
+    """
+    key = (cls, name)
+    try:
+        return _wrappers[key]
+    except KeyError:
+        pass
+    start = getattr(cls, name + '_async')
+    finish = getattr(cls, name + '_finish')
+
+    def call(obj, *args, loop=None, cancellable=None):
+        if loop is None:
+            loop = events.get_event_loop()
+        if cancellable is None:
+            cancellable = Gio.Cancellable()
+        future = futures.Future(loop=loop)
+
+        def callback(source, result, *user_data):
+            try:
+                value = finish(source, result)
+            except GLib.Error as exc:
+                if future.cancelled():
+                    pass
+                elif exc.matches(Gio.io_error_quark(),
+                                 Gio.IOErrorEnum.CANCELLED):
+                    # cancellable was cancelled by its owner.
+                    future.cancel()
+                else:
+                    future.set_exception(exc)
+            else:
+                if not future.cancelled():
+                    future.set_result(value)
+
+        def cancel(future):
+            if future.cancelled():
+                cancellable.cancel()
+
+        future.add_done_callback(cancel)
+        loop._start_gio(start, obj, *args, cancellable=cancellable,
+                        callback=callback)
+        return future
+
+    call.__name__ = name
+    call.__qualname__ = '%s.%s' % (cls.__name__, name)
+    _wrappers[key] = call
+    return call
+
+
+def call_async(obj, name, *args, loop=None, cancellable=None):
+    """Run the asynchronous operation name of obj.
+
+    Shorthand for wrap_async(type(obj), name)(obj, *args, ...), e.g.:
+
+        ok, contents, etag = yield from gbulb.call_async(
+            Gio.File.new_for_path(path), 'load_contents')
+    """
+    return wrap_async(type(obj), name)(obj, *args, loop=loop,
+                                       cancellable=cancellable)
@@ -12,13 +12,17 @@ from asyncio import futures
 from asyncio import tasks
 from asyncio.log import logger
 
+from . import gio
+from . import monitor
 from . import unix_events
+from .signals import wait_signal
 
 import threading
 import signal
 import weakref
 import collections
 import os
+import time
 
 class GLibChildWatcher(unix_events.AbstractChildWatcher):
     def __init__(self):
@@ -77,7 +81,17 @@ class GLibChildWatcher(unix_events.AbstractChildWatcher):
         callback(pid, returncode, *args)
 
 
+def _executor_queue(executor):
+    # Number of calls waiting for a thread of a ThreadPoolExecutor.
+    queue = getattr(executor, '_work_queue', None)
+    return queue.qsize() if queue is not None else 0
+
+
 class GLibHandle(events.Handle):
+    # Trace event recorded when the source fires, see loop.start_trace().
+    _trace_name = 'timer'
+    _trace_args = None
+
     def __init__(self, loop, source, repeat, callback, args):
         super().__init__(callback, args, loop)
 
@@ -92,6 +106,8 @@ class GLibHandle(events.Handle):
     def cancel(self):
         super().cancel()
         self._source.destroy()
+        if not self._repeat and self in self._loop._handlers:
+            self._loop._timers_cancelled += 1
         self._loop._handlers.discard(self)
 
     def _run(self):
@@ -99,6 +115,10 @@ class GLibHandle(events.Handle):
         super()._run()
 
     def _callback(self):
+        tracer = self._loop._tracer
+        if tracer is not None:
+            tracer.instant('glib', self._trace_name, self._trace_args)
+
         if not self._ready:
             self._ready = True
             self._loop._ready.append(self)
@@ -106,6 +126,7 @@ class GLibHandle(events.Handle):
         self._loop._dispatch()
 
         if not self._repeat:
+            self._loop._timers_fired += 1
             self._loop._handlers.discard(self)
         return self._repeat
 
@@ -225,10 +246,26 @@ class BaseGLibEventLoop(unix_events.SelectorEventLoop):
         self._chldhandlers = {}
         self._handlers = set()
         self._ready   = collections.deque()
+        self._flush_queue = []
+        self._resolver = None
         self._wakeup  = None
         self._will_dispatch = False
         self._loop_implem = None
         self._interrupted = False
+        self._lag_monitor = None
+        self._queued_at = None   # When the oldest call_soon() handle was
+                                 # queued, only set by the lag monitor.
+        self._poll_timer = None
+        self._tracer = None
+        self._gio_pending = 0   # GIO operations started by _start_gio().
+        # Counters reported by get_stats().
+        self._dispatches = 0
+        self._callbacks_run = 0
+        self._timers_scheduled = 0
+        self._timers_cancelled = 0
+        self._timers_fired = 0
+        self._fd_registrations = 0
+        self._threadsafe_calls = 0
 
         super().__init__()
 
@@ -247,15 +284,73 @@ class BaseGLibEventLoop(unix_events.SelectorEventLoop):
 
         self._will_dispatch = True
 
+        poll_timer = self._poll_timer
+        tracer = self._tracer
+        if poll_timer is not None or tracer is not None:
+            t0 = time.monotonic()
+
+        if self._lag_monitor is not None and self._queued_at is not None:
+            self._lag_monitor.ready_wait(self.time() - self._queued_at)
+            self._queued_at = None
+
         ntodo = len(self._ready)
-        for i in range(ntodo):
-            handle = self._ready.popleft()
-            if not handle._cancelled:
-                handle._run()
+        self._dispatches += 1
+        self._callbacks_run += ntodo
+        if self._debug or tracer is not None:
+            for i in range(ntodo):
+                handle = self._ready.popleft()
+                if handle._cancelled:
+                    self._callbacks_run -= 1
+                else:
+                    self._run_handle_instrumented(handle)
+        else:
+            for i in range(ntodo):
+                handle = self._ready.popleft()
+                if handle._cancelled:
+                    self._callbacks_run -= 1
+                else:
+                    handle._run()
+        handle = None  # Needed to break cycles when an exception occurs.
+
+        # Send the data written by auto-corked transports during this pass.
+        while self._flush_queue:
+            queue = self._flush_queue
+            self._flush_queue = []
+            for transport in queue:
+                transport._flush()
 
         self._schedule_dispatch()
         self._will_dispatch = False
 
+        if poll_timer is not None or tracer is not None:
+            t1 = time.monotonic()
+            if poll_timer is not None:
+                poll_timer.dispatched(t1 - t0)
+            if tracer is not None:
+                tracer.complete('loop', 'dispatch', t0, t1,
+                                {'callbacks': ntodo})
+
+    def _run_handle_instrumented(self, handle):
+        tracer = self._tracer
+        if tracer is None:
+            self._run_handle_debug(handle)
+            return
+        callback = handle._callback
+        t0 = time.monotonic()
+        try:
+            if self._debug:
+                self._run_handle_debug(handle)
+            else:
+                handle._run()
+        finally:
+            tracer.callback(callback, t0, time.monotonic())
+
+    def _defer_flush(self, transport):
+        if not self._will_dispatch:
+            return False
+        self._flush_queue.append(transport)
+        return True
+
     def _schedule_dispatch(self):
         if not self._ready or self._wakeup is not None:
             return
@@ -366,6 +461,10 @@ class BaseGLibEventLoop(unix_events.SelectorEventLoop):
             s.cancel()
 
         self._ready.clear() 
+        self._flush_queue.clear()
+        self.stop_lag_monitor()
+        self.stop_poll_timing()
+        self.stop_trace()
 
         self._default_sigint_handler.detach(self)
 
@@ -374,6 +473,8 @@ class BaseGLibEventLoop(unix_events.SelectorEventLoop):
     # Methods scheduling callbacks.  All these return Handles.
     def call_soon(self, callback, *args):
         h = events.Handle(callback, args, self)
+        if self._lag_monitor is not None and self._queued_at is None:
+            self._queued_at = self.time()
         self._ready.append(h)
         if not self._will_dispatch:
             self._schedule_dispatch()
@@ -384,6 +485,7 @@ class BaseGLibEventLoop(unix_events.SelectorEventLoop):
         if delay <= 0:
             return self.call_soon(callback, *args)
         else:
+            self._timers_scheduled += 1
             return GLibHandle(
                 self,
                 GLib.Timeout(delay*1000 if delay > 0 else 0),
@@ -393,9 +495,189 @@ class BaseGLibEventLoop(unix_events.SelectorEventLoop):
     def call_at(self, when, callback, *args):
         return self.call_later(when - self.time(), callback, *args)
 
+    def call_soon_threadsafe(self, callback, *args):
+        # Not atomic, the count may be slightly off with many threads.
+        self._threadsafe_calls += 1
+        tracer = self._tracer
+        if tracer is not None:
+            tracer.instant('thread', 'call_soon_threadsafe',
+                           {'callback': monitor._callback_name(callback)})
+        return super().call_soon_threadsafe(callback, *args)
+
     def time(self):
         return GLib.get_monotonic_time() / 1000000
 
+    # Instrumentation.
+
+    def start_lag_monitor(self, interval=0.1, window=1024):
+        """Measure how late the loop runs its callbacks.
+
+        A timer fires every interval seconds and records how late it fires;
+        each dispatch pass records how long its oldest call_soon() callback
+        waited.  Percentiles over the last window samples of each are
+        reported by get_stats().  A running monitor is restarted.
+        """
+        self.stop_lag_monitor()
+        self._lag_monitor = monitor._LagMonitor(self, interval, window)
+
+    def stop_lag_monitor(self):
+        if self._lag_monitor is not None:
+            self._lag_monitor.close()
+            self._lag_monitor = None
+            self._queued_at = None
+
+    def start_poll_timing(self):
+        """Account for the time spent in each iteration of the context.
+
+        A poll function timing each poll is installed on the GLib context
+        of the loop with g_main_context_set_poll_func(), through ctypes.
+        get_stats()['poll'] then gives the number of iterations, the total
+        time spent polling and in the callbacks of the loop, the wakeups
+        by cause ('fd', 'timeout' or 'error') and log2 histograms of the
+        time spent polling, the number of fds polled, the time spent in the
+        callbacks of the loop and the rest of each iteration (bucket i of
+        the *_us histograms counts the durations below 2**i microseconds).
+
+        RuntimeError is raised if another loop times the same context.
+        """
+        if self._poll_timer is None:
+            self._poll_timer = monitor._PollTimer(self)
+
+    def stop_poll_timing(self):
+        """Restore the poll function of the GLib context."""
+        if self._poll_timer is not None:
+            self._poll_timer.close()
+            self._poll_timer = None
+
+    def start_trace(self, size=65536):
+        """Record trace events of the loop in a ring buffer.
+
+        The last size events are kept: dispatch passes and the callbacks
+        they run with their durations, timers firing, file descriptors
+        becoming ready, signals and call_soon_threadsafe() submissions.
+        Write them out with dump_trace().  A running trace is restarted.
+        """
+        self._tracer = monitor._Tracer(size)
+
+    def stop_trace(self):
+        """Stop recording trace events and drop the recorded ones."""
+        self._tracer = None
+
+    def dump_trace(self, path):
+        """Write the recorded trace events to path as Chrome Trace Event
+        JSON, which chrome://tracing and Perfetto can load.
+
+        The recording goes on.  E.g. to dump the trace on SIGUSR2:
+
+            loop.add_signal_handler(signal.SIGUSR2, loop.dump_trace, path)
+        """
+        if self._tracer is None:
+            raise RuntimeError('no trace is recorded, call start_trace()')
+        self._tracer.dump(path)
+
+    def get_stats(self):
+        """Return a dict of statistics of the loop.
+
+        The gauges are the number of registered readers, writers, signal
+        handlers and GLib handles (timers included), callbacks in the ready
+        queue, pending GIO operations started on the context of the loop,
+        GLib sources the loop attached (one counted for each pending GIO
+        operation, whose sources GIO attaches itself), and tasks waiting for
+        a thread in the default and file executors.  The counters, since the
+        creation of the loop, are the dispatch passes, the callbacks run,
+        the timers scheduled, cancelled and fired, the calls to add_reader()
+        and add_writer(), and the calls to call_soon_threadsafe().
+
+        timer_lag and ready_wait, in seconds, are only measured while the
+        lag monitor runs, and poll while poll timing is on; they are None
+        otherwise.
+        """
+        stats = {
+            'readers': len(self._readers),
+            'writers': len(self._writers),
+            'signal_handlers': len(self._sighandlers),
+            'handlers': len(self._handlers),
+            'ready': len(self._ready),
+            'gio_pending': self._gio_pending,
+            'sources': (len(self._handlers) + (self._wakeup is not None) +
+                        (self._lag_monitor is not None) + self._gio_pending),
+            'executor_queue': (_executor_queue(self._default_executor) +
+                               _executor_queue(self._file_executor)),
+            'dispatches': self._dispatches,
+            'callbacks_run': self._callbacks_run,
+            'timers_scheduled': self._timers_scheduled,
+            'timers_cancelled': self._timers_cancelled,
+            'timers_fired': self._timers_fired,
+            'fd_registrations': self._fd_registrations,
+            'threadsafe_calls': self._threadsafe_calls,
+            'timer_lag': None,
+            'ready_wait': None,
+            'poll': None,
+        }
+        if self._lag_monitor is not None:
+            stats.update(self._lag_monitor.get_stats())
+        if self._poll_timer is not None:
+            stats['poll'] = self._poll_timer.get_stats()
+        return stats
+
+    # Name resolution.
+
+    def set_resolver(self, resolver):
+        """Resolve names with resolver (e.g. a gbulb.GioResolver).
+
+        None (the default) resolves names with socket.getaddrinfo() and
+        socket.getnameinfo() in the default executor.
+        """
+        self._resolver = resolver
+
+    def _getaddrinfo(self, host, port, family, type, proto, flags):
+        if self._resolver is None:
+            return super()._getaddrinfo(host, port, family, type, proto,
+                                        flags)
+        return self._resolver.getaddrinfo(self, host, port, family, type,
+                                          proto, flags)
+
+    def getnameinfo(self, sockaddr, flags=0):
+        if self._resolver is None:
+            return super().getnameinfo(sockaddr, flags)
+        return self._resolver.getnameinfo(self, sockaddr, flags)
+
+    # GIO.
+
+    def _start_gio(self, start, *args, callback, **kwargs):
+        # GIO completes an asynchronous operation in the thread-default
+        # main context of the thread which started it: make it ours.  The
+        # operation is counted in get_stats() until callback is called.
+        def done(*results):
+            self._gio_pending -= 1
+            callback(*results)
+
+        context = self._context
+        context.push_thread_default()
+        self._gio_pending += 1
+        try:
+            return start(*args, callback=done, **kwargs)
+        except BaseException:
+            self._gio_pending -= 1
+            raise
+        finally:
+            context.pop_thread_default()
+
+    @tasks.coroutine
+    def connect_gio_stream(self, protocol_factory, stream):
+        """Connect a protocol to a Gio.InputStream, Gio.OutputStream or
+        Gio.IOStream.
+
+        The transport reads with read_bytes_async() and writes with
+        write_bytes_async() on the main context of the loop.  Closing the
+        transport closes the stream.
+        """
+        protocol = protocol_factory()
+        waiter = futures.Future(loop=self)
+        transport = gio._GioStreamTransport(self, stream, protocol, waiter)
+        yield from waiter
+        return transport, protocol
+
     # Methods for interacting with threads.
 
 #	def call_soon_threadsafe(self, callback, *args):
@@ -513,7 +795,11 @@ class BaseGLibEventLoop(unix_events.SelectorEventLoop):
         s = GLib.unix_fd_source_new(fd, GLib.IO_IN)
 
         assert fd not in self._readers
-        self._readers[fd] = GLibHandle(self, s, True, callback, args)
+        h = GLibHandle(self, s, True, callback, args)
+        h._trace_name = 'readable'
+        h._trace_args = {'fd': fd}
+        self._readers[fd] = h
+        self._fd_registrations += 1
 
     def remove_reader(self, fd):
         if not isinstance(fd, int):
@@ -535,7 +821,11 @@ class BaseGLibEventLoop(unix_events.SelectorEventLoop):
         s = GLib.unix_fd_source_new(fd, GLib.IO_OUT)
 
         assert fd not in self._writers
-        self._writers[fd] = GLibHandle(self, s, True, callback, args)
+        h = GLibHandle(self, s, True, callback, args)
+        h._trace_name = 'writable'
+        h._trace_args = {'fd': fd}
+        self._writers[fd] = h
+        self._fd_registrations += 1
 
     def remove_writer(self, fd):
         if not isinstance(fd, int):
@@ -576,7 +866,10 @@ class BaseGLibEventLoop(unix_events.SelectorEventLoop):
                 raise ValueError("signal not supported")
 
         assert sig not in self._sighandlers
-        self._sighandlers[sig] = GLibHandle(self, s, True, callback, args)
+        h = GLibHandle(self, s, True, callback, args)
+        h._trace_name = 'signal'
+        h._trace_args = {'signal': sig}
+        self._sighandlers[sig] = h
 
     def remove_signal_handler(self, sig):
         self._check_signal(sig)
@@ -735,23 +1028,6 @@ class GApplicationEventLoopPolicy(GLibEventLoopPolicy):
     def __init__(self, *, full=False, threads=True):
         super().__init__ (default=True, full=full, threads=threads)
 
-class wait_signal (futures.Future):
-    def __init__(self, obj, name, *, loop=None):
-        super().__init__(loop=loop)
-        self._obj = obj
-        #FIXME: use  a weakref ?
-        self._hnd = obj.connect(name, self._signal_callback)
-    
-    def _signal_callback(self, *k):
-        self._obj.disconnect(self._hnd)
-        self.set_result(k)
-
-    def cancel(self):
-        super().cancel()
-        if self._obj:
-            self._obj.disconnect(self._hnd)
-            self._obj = None
-
 def get_default_loop(self):
     return asyncio.get_event_loop_policy().get_default_loop()
 
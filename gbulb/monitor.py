@@ -0,0 +1,331 @@
+"""Instrumentation of the GLib event loops.
+
+Nothing here runs unless it is enabled on a loop, e.g. with
+loop.start_lag_monitor(); the results are read with loop.get_stats().
+"""
+
+import array
+import ctypes
+import ctypes.util
+import json
+import os
+import threading
+import time
+
+from asyncio import tasks
+from gi.repository import GLib
+
+
+class _SampleWindow:
+    """The last size samples, in a buffer allocated once.
+
+    Adding a sample stores a float in place; the percentiles are only
+    computed (on a sorted copy) when the statistics are read.
+    """
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError('size should be at least 1, got %r' % (size,))
+        self._samples = array.array('d', bytes(8 * size))
+        self._size = size
+        self._next = 0     # Index of the next sample to overwrite.
+        self._count = 0    # Number of samples added since the start.
+
+    def add(self, value):
+        self._samples[self._next] = value
+        self._next += 1
+        if self._next == self._size:
+            self._next = 0
+        self._count += 1
+
+    def get_stats(self):
+        """Return a dict of the percentiles of the samples in the window,
+        their maximum, and the number of samples taken since the start."""
+        n = min(self._count, self._size)
+        if not n:
+            return {'count': 0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+        values = sorted(self._samples[:n])
+        return {
+            'count': self._count,
+            # Nearest-rank percentiles.
+            'p50': values[(n * 50 + 99) // 100 - 1],
+            'p99': values[(n * 99 + 99) // 100 - 1],
+            'max': values[-1],
+        }
+
+
+class _LagMonitor:
+    """Measure how late a GLib loop runs, see loop.start_lag_monitor().
+
+    A GLib timeout fires every interval seconds: GLib schedules the next
+    expiration from the time of the current dispatch, and the difference
+    between that expected time and the actual time of the next dispatch is
+    the timer lag.  The loop reports the time the oldest call_soon() handle
+    of each dispatch pass spent in the ready queue with ready_wait().
+    """
+
+    def __init__(self, loop, interval, window):
+        if interval <= 0:
+            raise ValueError('interval should be positive, got %r'
+                             % (interval,))
+        self._interval = int(interval * 1000000)
+        self._timer_lag = _SampleWindow(window)
+        self._ready_wait = _SampleWindow(window)
+        self._source = GLib.Timeout(max(1, int(interval * 1000)))
+        self._source.set_callback(self.__class__._tick, self)
+        self._source.attach(loop._context)
+        self._expected = GLib.get_monotonic_time() + self._interval
+
+    def _tick(self):
+        now = GLib.get_monotonic_time()
+        lag = now - self._expected
+        self._timer_lag.add(lag / 1000000 if lag > 0 else 0.0)
+        self._expected = self._source.get_time() + self._interval
+        return True
+
+    def ready_wait(self, wait):
+        self._ready_wait.add(wait)
+
+    def close(self):
+        self._source.destroy()
+
+    def get_stats(self):
+        return {'timer_lag': self._timer_lag.get_stats(),
+                'ready_wait': self._ready_wait.get_stats()}
+
+
+class _GPollFD(ctypes.Structure):
+    _fields_ = [('fd', ctypes.c_int),
+                ('events', ctypes.c_ushort),
+                ('revents', ctypes.c_ushort)]
+
+
+_GPollFunc = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(_GPollFD),
+                              ctypes.c_uint, ctypes.c_int)
+
+_libglib = None
+
+
+def _load_libglib():
+    # PyGObject does not expose g_main_context_set_poll_func(): call it
+    # through ctypes.
+    global _libglib
+    if _libglib is None:
+        name = ctypes.util.find_library('glib-2.0') or 'libglib-2.0.so.0'
+        try:
+            lib = ctypes.CDLL(name)
+        except OSError as exc:
+            raise RuntimeError('cannot load the GLib library: %s' % exc)
+        lib.g_main_context_ref_thread_default.restype = ctypes.c_void_p
+        lib.g_main_context_ref_thread_default.argtypes = []
+        lib.g_main_context_unref.restype = None
+        lib.g_main_context_unref.argtypes = [ctypes.c_void_p]
+        lib.g_main_context_get_poll_func.restype = ctypes.c_void_p
+        lib.g_main_context_get_poll_func.argtypes = [ctypes.c_void_p]
+        lib.g_main_context_set_poll_func.restype = None
+        lib.g_main_context_set_poll_func.argtypes = [ctypes.c_void_p,
+                                                     _GPollFunc]
+        _libglib = lib
+    return _libglib
+
+
+def _ref_context(lib, context):
+    # A new reference to the GMainContext wrapped by context, as a pointer:
+    # unlike g_main_context_get_thread_default(), this does not return NULL
+    # for the global default context.
+    context.push_thread_default()
+    try:
+        return lib.g_main_context_ref_thread_default()
+    finally:
+        context.pop_thread_default()
+
+
+# Bucket i of a histogram counts the values v with v.bit_length() == i,
+# i.e. 2**(i-1) <= v < 2**i; the last bucket takes everything larger.
+_BUCKETS = 32
+
+
+def _histogram_add(histogram, value):
+    i = value.bit_length()
+    histogram[i if i < _BUCKETS else _BUCKETS - 1] += 1
+
+
+# GMainContext pointer -> the _PollTimer installed on it.
+_poll_timers = {}
+
+
+class _PollTimer:
+    """Time the iterations of a GLib main context, see
+    loop.start_poll_timing().
+
+    A poll function wrapping the one of the context measures every poll.
+    The time between the end of a poll and the start of the next one is
+    spent by GLib checking and dispatching the sources of the context; the
+    loop reports the part of it spent in its own _dispatch() with
+    dispatched().  Durations are counted in microseconds into log2
+    histograms.
+
+    A context has a single poll function: a second timer is refused on a
+    context already timed, possibly by another loop, as restoring the
+    functions out of order would install a freed one.
+    """
+
+    def __init__(self, loop):
+        self._lib = lib = _load_libglib()
+        self._context = _ref_context(lib, loop._context)
+        if self._context in _poll_timers:
+            lib.g_main_context_unref(self._context)
+            raise RuntimeError('the poll function of the GLib context of '
+                               'the loop is already timed')
+        self._original = _GPollFunc(
+            lib.g_main_context_get_poll_func(self._context))
+        # Keep a reference to the C callback as long as it is installed.
+        self._poll_func = _GPollFunc(self._poll)
+
+        self._poll_hist = [0] * _BUCKETS      # Time in poll.
+        self._fds_hist = [0] * _BUCKETS       # Number of fds polled.
+        self._dispatch_hist = [0] * _BUCKETS  # Time in loop._dispatch().
+        self._other_hist = [0] * _BUCKETS     # Rest of each iteration.
+        self._wakeups = {'fd': 0, 'timeout': 0, 'error': 0}
+        self._iterations = 0
+        self._poll_time = 0.0
+        self._dispatch_time = 0.0
+        self._iteration_dispatch = 0.0   # _dispatch() time since last poll.
+        self._poll_end = None
+
+        lib.g_main_context_set_poll_func(self._context, self._poll_func)
+        _poll_timers[self._context] = self
+
+    def _poll(self, fds, nfds, timeout):
+        start = time.monotonic()
+        if self._poll_end is not None:
+            # The previous iteration is over.
+            dispatch = self._iteration_dispatch
+            other = start - self._poll_end - dispatch
+            _histogram_add(self._dispatch_hist, int(dispatch * 1000000))
+            _histogram_add(self._other_hist,
+                           int(other * 1000000) if other > 0 else 0)
+            self._iteration_dispatch = 0.0
+        n = self._original(fds, nfds, timeout)
+        end = self._poll_end = time.monotonic()
+        self._iterations += 1
+        self._poll_time += end - start
+        _histogram_add(self._poll_hist, int((end - start) * 1000000))
+        _histogram_add(self._fds_hist, nfds)
+        if n > 0:
+            self._wakeups['fd'] += 1
+        elif n == 0:
+            self._wakeups['timeout'] += 1
+        else:
+            self._wakeups['error'] += 1
+        return n
+
+    def dispatched(self, duration):
+        self._iteration_dispatch += duration
+        self._dispatch_time += duration
+
+    def close(self):
+        self._lib.g_main_context_set_poll_func(self._context, self._original)
+        del _poll_timers[self._context]
+        self._lib.g_main_context_unref(self._context)
+
+    def get_stats(self):
+        return {
+            'iterations': self._iterations,
+            'poll_time': self._poll_time,
+            'dispatch_time': self._dispatch_time,
+            'wakeups': dict(self._wakeups),
+            'poll_us': list(self._poll_hist),
+            'fds': list(self._fds_hist),
+            'dispatch_us': list(self._dispatch_hist),
+            'other_us': list(self._other_hist),
+        }
+
+
+def _callback_name(callback):
+    # A short name for the trace events of a callback.
+    owner = getattr(callback, '__self__', None)
+    if isinstance(owner, tasks.Task):
+        coro = owner._coro
+        return 'Task %s' % getattr(coro, '__qualname__',
+                                   getattr(coro, '__name__', '?'))
+    name = getattr(callback, '__qualname__', None)
+    if name is None:
+        func = getattr(callback, 'func', None)   # functools.partial
+        if func is not None:
+            return _callback_name(func)
+        return type(callback).__qualname__
+    return name
+
+
+class _Tracer:
+    """Record trace events in a ring buffer, see loop.start_trace().
+
+    The fields of the events are kept in lists allocated once, the oldest
+    event being overwritten when the buffer is full.  Events may be added
+    from other threads (call_soon_threadsafe()) without a lock: two threads
+    racing for a slot may lose one of the events.
+    """
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError('size should be at least 1, got %r' % (size,))
+        self._size = size
+        self._categories = [None] * size
+        self._names = [None] * size
+        self._starts = [0.0] * size
+        self._durations = [None] * size   # None for instant events.
+        self._threads = [0] * size
+        self._args = [None] * size
+        self._next = 0
+        self._count = 0
+
+    def _add(self, category, name, start, duration, args):
+        i = self._next
+        self._next = i + 1 if i + 1 < self._size else 0
+        self._count += 1
+        self._categories[i] = category
+        self._names[i] = name
+        self._starts[i] = start
+        self._durations[i] = duration
+        self._threads[i] = threading.get_ident()
+        self._args[i] = args
+
+    def complete(self, category, name, start, end, args=None):
+        """Add an event which lasted from start to end (time.monotonic())."""
+        self._add(category, name, start, end - start, args)
+
+    def instant(self, category, name, args=None):
+        self._add(category, name, time.monotonic(), None, args)
+
+    def callback(self, callback, start, end):
+        self._add('callback', _callback_name(callback), start, end - start,
+                  None)
+
+    def get_events(self):
+        """Return the events in the buffer, oldest first, in the Chrome
+        Trace Event format."""
+        n = min(self._count, self._size)
+        first = (self._next - n) % self._size
+        pid = os.getpid()
+        events = []
+        for j in range(n):
+            i = (first + j) % self._size
+            event = {'cat': self._categories[i], 'name': self._names[i],
+                     'ts': self._starts[i] * 1000000, 'pid': pid,
+                     'tid': self._threads[i]}
+            if self._durations[i] is None:
+                event['ph'] = 'i'
+                event['s'] = 't'
+            else:
+                event['ph'] = 'X'
+                event['dur'] = self._durations[i] * 1000000
+            if self._args[i] is not None:
+                event['args'] = self._args[i]
+            events.append(event)
+        return events
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.get_events(),
+                       'displayTimeUnit': 'ms'}, f)
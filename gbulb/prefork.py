@@ -0,0 +1,149 @@
+"""Prefork servers.
+
+Several worker processes, each one running its own GLib event loop, accept
+connections on a single address shared with SO_REUSEPORT.  The kernel
+balances the incoming connections among the workers.
+"""
+
+__all__ = ['PreforkSupervisor', 'run_prefork']
+
+import os
+import signal
+import time
+
+import asyncio
+from asyncio.log import logger
+
+from . import glib_events
+
+
+class PreforkSupervisor:
+    """Fork worker processes and restart them when they die.
+
+    target(index) is called in each worker, index being the slot of the
+    worker in range(workers), and the worker exits when it returns.  A worker
+    which dies is restarted in the same slot; if it lived less than
+    min_uptime seconds, the restart is delayed by restart_delay seconds so
+    that a worker failing at startup does not make the supervisor spin.
+
+    The workers are forked by run(), which must be called before any GLib
+    main context is used in the supervisor process.
+    """
+
+    def __init__(self, target, workers=None, *,
+                 restart_delay=1.0, min_uptime=1.0):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError('workers should be at least 1, got %r'
+                             % (workers,))
+        self._target = target
+        self._workers = workers
+        self._restart_delay = restart_delay
+        self._min_uptime = min_uptime
+        self._pids = {}  # pid -> (slot index, start time)
+        self._stopping = False
+        self.restarts = 0
+
+    def get_pids(self):
+        """Return the pids of the running workers."""
+        return list(self._pids)
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                # Ctrl-C reaches the whole process group: let the supervisor
+                # turn it into a SIGTERM for every worker.
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                self._target(index)
+                status = 0
+            except BaseException:
+                logger.exception('Prefork worker %d failed', index)
+            finally:
+                os._exit(status)
+        self._pids[pid] = (index, time.monotonic())
+        return pid
+
+    def run(self):
+        """Start the workers and supervise them.
+
+        Return once stop() was called, or SIGTERM or SIGINT received, and
+        every worker has exited.
+        """
+        previous = {}
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous[sig] = signal.signal(sig, self._on_signal)
+        try:
+            for index in range(self._workers):
+                self._spawn(index)
+            while self._pids:
+                try:
+                    pid, status = os.wait()
+                except InterruptedError:
+                    continue
+                except ChildProcessError:
+                    break
+                try:
+                    index, started = self._pids.pop(pid)
+                except KeyError:
+                    continue
+                if self._stopping:
+                    continue
+                logger.warning('Prefork worker %d (pid %d) exited with '
+                               'status %#x, restarting', index, pid, status)
+                if time.monotonic() - started < self._min_uptime:
+                    time.sleep(self._restart_delay)
+                    if self._stopping:
+                        continue
+                self.restarts += 1
+                self._spawn(index)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+    def _on_signal(self, signum, frame):
+        self.stop()
+
+    def stop(self, sig=signal.SIGTERM):
+        """Stop supervising and send sig to the workers."""
+        self._stopping = True
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+
+def run_prefork(protocol_factory, host=None, port=None, *,
+                workers=None, reuse_port=True, **kwargs):
+    """Serve protocol_factory on host and port from several processes.
+
+    Each worker process runs its own GLib event loop and listens with
+    create_server(protocol_factory, host, port, reuse_port=True, **kwargs).
+    Workers shut down gracefully on SIGTERM.  This function returns once
+    the supervisor has been stopped (see PreforkSupervisor.run()).
+    """
+    if not port:
+        raise ValueError('run_prefork() needs a fixed port, the workers '
+                         'would each bind a different one')
+    if not reuse_port:
+        raise ValueError('run_prefork() needs reuse_port, the workers '
+                         'all bind the same port')
+
+    def worker(index):
+        asyncio.set_event_loop_policy(glib_events.GLibEventLoopPolicy())
+        loop = asyncio.get_event_loop()
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        server = loop.run_until_complete(loop.create_server(
+            protocol_factory, host, port, reuse_port=True, **kwargs))
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+    PreforkSupervisor(worker, workers).run()
@@ -0,0 +1,314 @@
+"""Name resolution helpers for the event loops."""
+
+__all__ = ['ResolverCache', 'GioResolver']
+
+import collections
+import functools
+import socket
+
+from asyncio import futures
+from gi.repository import GLib, Gio
+
+
+class _Lookup:
+    # A resolution in progress and the futures of the callers waiting for it.
+
+    def __init__(self, future):
+        self.future = future
+        self.waiters = set()
+
+
+class ResolverCache:
+    """Cache of getaddrinfo() results, see loop.set_resolver_cache().
+
+    Results are kept for ttl seconds and resolution failures
+    (socket.gaierror) for negative_ttl seconds.  At most maxsize entries are
+    kept, the least recently used ones are evicted first.  Identical lookups
+    made while a resolution is in progress share it; each caller still gets
+    its own future, and the resolution is only cancelled once every caller
+    has cancelled.
+    """
+
+    def __init__(self, ttl=60.0, negative_ttl=5.0, maxsize=1024):
+        if ttl < 0 or negative_ttl < 0:
+            raise ValueError('ttl and negative_ttl should not be negative')
+        if maxsize < 1:
+            raise ValueError('maxsize should be at least 1, got %r'
+                             % (maxsize,))
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._maxsize = maxsize
+        self._entries = collections.OrderedDict()  # key -> (expiry, result,
+                                                   #         error args)
+        self._in_flight = {}  # key -> _Lookup
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Forget the cached entries (lookups in progress are kept)."""
+        self._entries.clear()
+
+    def lookup(self, loop, key, resolve):
+        """Return a future for the result of the lookup identified by key.
+
+        resolve() is called to start a resolution when there is neither a
+        valid cache entry nor a resolution in progress for key; it must
+        return a future.
+        """
+        waiter = futures.Future(loop=loop)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expiry, result, error = entry
+            if expiry > loop.time():
+                self._entries.move_to_end(key)
+                if error is None:
+                    self._hits += 1
+                    waiter.set_result(list(result))
+                else:
+                    # A new exception each time: a raised exception keeps
+                    # the frames it went through in its traceback.
+                    self._negative_hits += 1
+                    waiter.set_exception(socket.gaierror(*error))
+                return waiter
+            del self._entries[key]
+
+        lookup = self._in_flight.get(key)
+        if lookup is None or lookup.future.cancelled():
+            self._misses += 1
+            lookup = _Lookup(resolve())
+            self._in_flight[key] = lookup
+            lookup.future.add_done_callback(
+                functools.partial(self._resolved, loop, key, lookup))
+        else:
+            self._coalesced += 1
+        lookup.waiters.add(waiter)
+        waiter.add_done_callback(
+            functools.partial(self._waiter_done, lookup))
+        return waiter
+
+    def _waiter_done(self, lookup, waiter):
+        if not waiter.cancelled():
+            return
+        lookup.waiters.discard(waiter)
+        if not lookup.waiters and not lookup.future.done():
+            lookup.future.cancel()
+
+    def _resolved(self, loop, key, lookup, future):
+        if self._in_flight.get(key) is lookup:
+            del self._in_flight[key]
+        waiters = lookup.waiters
+        lookup.waiters = set()
+
+        if future.cancelled():
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.cancel()
+            return
+
+        exc = future.exception()
+        if exc is None:
+            result = future.result()
+            self._store(loop, key, result, None)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(list(result))
+        else:
+            if isinstance(exc, socket.gaierror):
+                self._store(loop, key, None, exc)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+
+    def _store(self, loop, key, result, exc):
+        ttl = self._ttl if exc is None else self._negative_ttl
+        if not ttl:
+            return
+        # (errno, strerror), kept as args for gaierrors built otherwise.
+        error = None if exc is None else exc.args
+        entries = self._entries
+        entries[key] = (loop.time() + ttl, result, error)
+        entries.move_to_end(key)
+        while len(entries) > self._maxsize:
+            entries.popitem(last=False)
+            self._evictions += 1
+
+    def get_stats(self):
+        """Return a dict of counters: cache hits (positive and negative),
+        misses (resolutions started), lookups coalesced with a resolution in
+        progress, evictions, and the resulting hit rate."""
+        answered = self._hits + self._negative_hits + self._coalesced
+        total = answered + self._misses
+        return {
+            'size': len(self._entries),
+            'in_flight': len(self._in_flight),
+            'hits': self._hits,
+            'negative_hits': self._negative_hits,
+            'misses': self._misses,
+            'coalesced': self._coalesced,
+            'evictions': self._evictions,
+            'hit_rate': answered / total if total else 0.0,
+        }
+
+
+def _gaierror(exc):
+    # Map a GResolverError to the socket.gaierror getaddrinfo() would raise.
+    quark = Gio.resolver_error_quark()
+    if exc.matches(quark, Gio.ResolverError.NOT_FOUND):
+        return socket.gaierror(socket.EAI_NONAME, exc.message)
+    if exc.matches(quark, Gio.ResolverError.TEMPORARY_FAILURE):
+        return socket.gaierror(socket.EAI_AGAIN, exc.message)
+    return socket.gaierror(socket.EAI_FAIL, exc.message)
+
+
+_SOCKET_TYPES = {
+    socket.SOCK_STREAM: socket.IPPROTO_TCP,
+    socket.SOCK_DGRAM: socket.IPPROTO_UDP,
+}
+
+
+class GioResolver:
+    """getaddrinfo() and getnameinfo() on top of a GResolver.
+
+    Lookups run inside the GLib main context instead of occupying threads of
+    the default executor; cancelling the returned future cancels the lookup
+    through a Gio.Cancellable.  resolver defaults to
+    Gio.Resolver.get_default(); any object providing lookup_by_name_async(),
+    lookup_by_name_finish(), lookup_by_address_async() and
+    lookup_by_address_finish() will do.
+
+    Lookups GResolver cannot answer like getaddrinfo() (no host, service
+    names, AI_CANONNAME) go to the default executor.  Install it with
+    loop.set_resolver().
+    """
+
+    def __init__(self, resolver=None):
+        if resolver is None:
+            resolver = Gio.Resolver.get_default()
+        self._resolver = resolver
+
+    def getaddrinfo(self, loop, host, port, family=0, type=0, proto=0,
+                    flags=0):
+        if isinstance(host, bytes):
+            host = host.decode('idna')
+        if isinstance(port, str) and port.isdigit():
+            port = int(port)
+        if (not host or not (port is None or isinstance(port, int)) or
+                (type and type not in _SOCKET_TYPES) or
+                flags & socket.AI_CANONNAME):
+            return loop.run_in_executor(None, socket.getaddrinfo, host, port,
+                                        family, type, proto, flags)
+
+        waiter = futures.Future(loop=loop)
+        if Gio.InetAddress.new_from_string(host) is not None:
+            # Numeric address: no lookup to do.
+            try:
+                waiter.set_result(socket.getaddrinfo(
+                    host, port, family, type, proto,
+                    flags | socket.AI_NUMERICHOST))
+            except OSError as exc:
+                waiter.set_exception(exc)
+            return waiter
+        if flags & socket.AI_NUMERICHOST:
+            waiter.set_exception(socket.gaierror(
+                socket.EAI_NONAME, 'Name or service not known'))
+            return waiter
+
+        def done(addresses):
+            return self._addrinfos(addresses, port or 0, family, type, proto)
+
+        self._lookup(loop, waiter, done, self._resolver.lookup_by_name_async,
+                     self._resolver.lookup_by_name_finish, host)
+        return waiter
+
+    def _addrinfos(self, addresses, port, family, type, proto):
+        infos = []
+        for address in addresses:
+            if address.get_family() == Gio.SocketFamily.IPV6:
+                af = socket.AF_INET6
+                sockaddr = (address.to_string(), port, 0, 0)
+            else:
+                af = socket.AF_INET
+                sockaddr = (address.to_string(), port)
+            if family and family != af:
+                continue
+            for socktype, sockproto in _SOCKET_TYPES.items():
+                if type and type != socktype:
+                    continue
+                if proto and proto != sockproto:
+                    continue
+                infos.append((af, socktype, sockproto, '', sockaddr))
+        if not infos:
+            raise socket.gaierror(
+                getattr(socket, 'EAI_ADDRFAMILY', socket.EAI_NONAME),
+                'Address family for hostname not supported')
+        return infos
+
+    def getnameinfo(self, loop, sockaddr, flags=0):
+        host, port = sockaddr[:2]
+        waiter = futures.Future(loop=loop)
+        address = Gio.InetAddress.new_from_string(host)
+        if address is None:
+            # Not numeric: let getnameinfo() raise the appropriate error.
+            return loop.run_in_executor(None, socket.getnameinfo,
+                                        sockaddr, flags)
+        if flags & socket.NI_NUMERICSERV:
+            service = str(port)
+        else:
+            try:
+                service = socket.getservbyport(
+                    port, 'udp' if flags & socket.NI_DGRAM else 'tcp')
+            except OSError:
+                service = str(port)
+        if flags & socket.NI_NUMERICHOST:
+            waiter.set_result((host, service))
+            return waiter
+
+        def done(name):
+            return name, service
+
+        def failed(exc):
+            if flags & socket.NI_NAMEREQD:
+                raise exc
+            return host, service
+
+        self._lookup(loop, waiter, done,
+                     self._resolver.lookup_by_address_async,
+                     self._resolver.lookup_by_address_finish, address,
+                     failed)
+        return waiter
+
+    def _lookup(self, loop, waiter, done, start, finish, arg, failed=None):
+        cancellable = Gio.Cancellable()
+
+        def callback(source, result, user_data):
+            if waiter.cancelled():
+                return
+            try:
+                try:
+                    value = finish(result)
+                except GLib.Error as exc:
+                    if failed is None:
+                        raise _gaierror(exc)
+                    value = failed(_gaierror(exc))
+                else:
+                    value = done(value)
+            except Exception as exc:
+                waiter.set_exception(exc)
+            else:
+                waiter.set_result(value)
+
+        def cancel(waiter):
+            if waiter.cancelled():
+                cancellable.cancel()
+
+        waiter.add_done_callback(cancel)
+        # The lookup completes in the context of the loop, which is not
+        # necessarily the default one.
+        loop._start_gio(start, arg, cancellable, callback=callback,
+                        user_data=None)
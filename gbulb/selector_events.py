@@ -8,6 +8,7 @@ __all__ = ['BaseSelectorEventLoop']
 
 import collections
 import errno
+import functools
 import socket
 try:
     import ssl
@@ -15,6 +16,7 @@ except ImportError:  # pragma: no cover
     ssl = None
 
 from . import base_events
+from . import sslproto
 from asyncio import constants
 from asyncio import events
 from asyncio import futures
@@ -31,6 +33,8 @@ class BaseSelectorEventLoop(base_events.BaseEventLoop):
 
     def __init__(self, selector=None):
         super().__init__()
+        self._ssl_session_cache = sslproto.SSLSessionCache()
+        self._default_ssl_contexts = {}
 
 #        if selector is None:
 #            selector = selectors.DefaultSelector()
@@ -45,10 +49,45 @@ class BaseSelectorEventLoop(base_events.BaseEventLoop):
 
     def _make_ssl_transport(self, rawsock, protocol, sslcontext, waiter, *,
                             server_side=False, server_hostname=None,
-                            extra=None, server=None):
-        return _SelectorSslTransport(
-            self, rawsock, protocol, sslcontext, waiter,
-            server_side, server_hostname, extra, server)
+                            extra=None, server=None, session_key=None,
+                            handshake_timeout=None, handshake_callback=None):
+        if not sslproto._is_sslproto_available():
+            return _SelectorSslTransport(
+                self, rawsock, protocol, sslcontext, waiter,
+                server_side, server_hostname, extra, server)
+
+        if not sslcontext and not server_side:
+            # Share the default context between connections, TLS sessions
+            # can only be resumed with the context that created them.
+            check_hostname = bool(server_hostname)
+            sslcontext = self._default_ssl_contexts.get(check_hostname)
+            if sslcontext is None:
+                sslcontext = sslproto._create_transport_context(
+                    server_side, server_hostname)
+                self._default_ssl_contexts[check_hostname] = sslcontext
+        if session_key is not None:
+            # (server_hostname, port) -> (server_hostname, port, sslcontext)
+            session_key += (sslcontext,)
+
+        # TLS is handled in memory by SSLProtocol, on top of a plain socket
+        # transport.
+        ssl_protocol = sslproto.SSLProtocol(
+            self, protocol, sslcontext, waiter,
+            server_side, server_hostname,
+            session_cache=self._ssl_session_cache, session_key=session_key,
+            handshake_timeout=handshake_timeout,
+            handshake_callback=handshake_callback)
+        _SelectorSocketTransport(self, rawsock, ssl_protocol,
+                                 extra=extra, server=server)
+        return ssl_protocol._app_transport
+
+    def _make_handshake_limiter(self, max_concurrent=None, timeout=None):
+        if not sslproto._is_sslproto_available():
+            if max_concurrent is not None or timeout is not None:
+                raise RuntimeError('SSL handshake limits require '
+                                   'ssl.MemoryBIO (Python 3.5+)')
+            return None
+        return _SSLHandshakeLimiter(self, max_concurrent, timeout)
 
     def _make_datagram_transport(self, sock, protocol,
                                  address=None, extra=None):
@@ -62,6 +101,15 @@ class BaseSelectorEventLoop(base_events.BaseEventLoop):
 #            self._selector = None
             super().close()
 
+    def get_ssl_session_stats(self):
+        """Return the TLS session resumption counters of the loop.
+
+        The returned dict holds the number of cached client sessions
+        ('sessions') and the number of resumed ('*_hits') and full
+        ('*_misses') handshakes on the client and server sides.
+        """
+        return self._ssl_session_cache.get_stats()
+
     def _socketpair(self):
         raise NotImplementedError
 
@@ -94,42 +142,60 @@ class BaseSelectorEventLoop(base_events.BaseEventLoop):
             pass
 
     def _start_serving(self, protocol_factory, sock,
-                       sslcontext=None, server=None):
+                       sslcontext=None, server=None, accept_batch=1):
         self.add_reader(sock.fileno(), self._accept_connection,
-                        protocol_factory, sock, sslcontext, server)
+                        protocol_factory, sock, sslcontext, server,
+                        accept_batch)
 
     def _accept_connection(self, protocol_factory, sock,
-                           sslcontext=None, server=None):
-        try:
-            conn, addr = sock.accept()
-            conn.setblocking(False)
-        except (BlockingIOError, InterruptedError, ConnectionAbortedError):
-            pass  # False alarm.
-        except OSError as exc:
-            # There's nowhere to send the error, so just log it.
-            # TODO: Someone will want an error handler for this.
-            if exc.errno in (errno.EMFILE, errno.ENFILE,
-                             errno.ENOBUFS, errno.ENOMEM):
-                # Some platforms (e.g. Linux keep reporting the FD as
-                # ready, so we remove the read handler temporarily.
-                # We'll try again in a while.
-                logger.exception('Accept out of system resource (%s)', exc)
-                self.remove_reader(sock.fileno())
-                self.call_later(constants.ACCEPT_RETRY_DELAY,
-                                self._start_serving,
-                                protocol_factory, sock, sslcontext, server)
-            else:
-                raise  # The event loop will catch, log and ignore it.
-        else:
-            if sslcontext:
-                self._make_ssl_transport(
-                    conn, protocol_factory(), sslcontext, None,
-                    server_side=True, extra={'peername': addr}, server=server)
+                           sslcontext=None, server=None, accept_batch=1):
+        # Drain up to accept_batch pending connections per readiness
+        # notification instead of going back through the main loop for
+        # each of them.
+        for i in range(accept_batch):
+            try:
+                conn, addr = sock.accept()
+                conn.setblocking(False)
+            except (BlockingIOError, InterruptedError,
+                    ConnectionAbortedError):
+                return  # False alarm, or the backlog is empty.
+            except OSError as exc:
+                # There's nowhere to send the error, so just log it.
+                # TODO: Someone will want an error handler for this.
+                if exc.errno in (errno.EMFILE, errno.ENFILE,
+                                 errno.ENOBUFS, errno.ENOMEM):
+                    # Some platforms (e.g. Linux keep reporting the FD as
+                    # ready, so we remove the read handler temporarily.
+                    # We'll try again in a while.
+                    logger.exception('Accept out of system resource (%s)',
+                                     exc)
+                    self.remove_reader(sock.fileno())
+                    self.call_later(constants.ACCEPT_RETRY_DELAY,
+                                    self._start_serving,
+                                    protocol_factory, sock, sslcontext,
+                                    server, accept_batch)
+                    return
+                else:
+                    raise  # The event loop will catch, log and ignore it.
             else:
-                self._make_socket_transport(
-                    conn, protocol_factory(), extra={'peername': addr},
-                    server=server)
-        # It's now up to the protocol to handle the connection.
+                pool = getattr(server, '_worker_pool', None)
+                limiter = getattr(server, '_handshake_limiter', None)
+                if pool is not None:
+                    pool._dispatch(self, conn, addr, protocol_factory,
+                                   sslcontext, server)
+                elif sslcontext and limiter is not None:
+                    limiter.accept(conn, addr, protocol_factory, sslcontext,
+                                   server)
+                elif sslcontext:
+                    self._make_ssl_transport(
+                        conn, protocol_factory(), sslcontext, None,
+                        server_side=True, extra={'peername': addr},
+                        server=server)
+                else:
+                    self._make_socket_transport(
+                        conn, protocol_factory(), extra={'peername': addr},
+                        server=server)
+            # It's now up to the protocol to handle the connection.
 
 #    def add_reader(self, fd, callback, *args):
 #        """Add a reader callback."""
@@ -338,6 +404,160 @@ class BaseSelectorEventLoop(base_events.BaseEventLoop):
         self.remove_reader(sock.fileno())
         sock.close()
 
+    def _defer_flush(self, transport):
+        """Arrange for transport._flush() to be called once the callbacks
+        currently being dispatched have run.
+
+        Return False if no dispatch pass is in progress (the caller must then
+        send its data by itself).
+        """
+        return False
+
+
+class _QueuedConnection:
+    # A connection waiting for a handshake slot of an _SSLHandshakeLimiter.
+
+    def __init__(self, accepted, conn, addr, protocol_factory, sslcontext,
+                 server):
+        self.accepted = accepted
+        self.conn = conn
+        self.addr = addr
+        self.protocol_factory = protocol_factory
+        self.sslcontext = sslcontext
+        self.server = server
+
+
+class _SSLHandshakeLimiter:
+    """Bound the number and the duration of the SSL handshakes of a server.
+
+    At most max_concurrent handshakes run at once, further connections wait
+    in a FIFO queue.  Handshakes running for more than timeout seconds are
+    aborted, and queued connections which have waited that long are closed
+    without being started.  Either limit may be None.  The latency of a
+    handshake counts from the time the connection was accepted, queue wait
+    included.
+
+    The queue is ordered by accept time, so a single timer, armed for the
+    deadline of its oldest connection, expires the queued connections.
+    """
+
+    def __init__(self, loop, max_concurrent=None, timeout=None):
+        self._loop = loop
+        self._max_concurrent = max_concurrent
+        self._timeout = timeout
+        self._active = 0
+        self._queue = collections.deque()
+        self._expiry = None   # Timer for the deadline of self._queue[0].
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._dropped = 0
+        self._latency_total = 0.0
+        self._latency_min = None
+        self._latency_max = None
+
+    def accept(self, conn, addr, protocol_factory, sslcontext, server):
+        now = self._loop.time()
+        if self._max_concurrent is None or \
+                self._active < self._max_concurrent:
+            self._start(now, conn, addr, protocol_factory, sslcontext, server)
+        else:
+            self._queue.append(_QueuedConnection(
+                now, conn, addr, protocol_factory, sslcontext, server))
+            if self._expiry is None:
+                self._arm_expiry()
+
+    def _arm_expiry(self):
+        if self._timeout is not None and self._queue:
+            self._expiry = self._loop.call_at(
+                self._queue[0].accepted + self._timeout, self._expire)
+        else:
+            self._expiry = None
+
+    def _expire(self):
+        # The peers of these connections have most likely given up already.
+        queue = self._queue
+        limit = self._loop.time() - self._timeout
+        while queue and queue[0].accepted <= limit:
+            queue.popleft().conn.close()
+            self._dropped += 1
+        self._arm_expiry()
+
+    def close(self):
+        """Close the connections waiting for a handshake slot."""
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        queue = self._queue
+        self._queue = collections.deque()
+        for entry in queue:
+            entry.conn.close()
+
+    def _start(self, accepted, conn, addr, protocol_factory, sslcontext,
+               server):
+        self._active += 1
+        callback = functools.partial(self._handshake_done, accepted)
+        try:
+            self._loop._make_ssl_transport(
+                conn, protocol_factory(), sslcontext, None,
+                server_side=True, extra={'peername': addr}, server=server,
+                handshake_timeout=self._timeout, handshake_callback=callback)
+        except Exception:
+            logger.exception('Failed to start the SSL handshake of %r', addr)
+            conn.close()
+            self._active -= 1
+            self._failed += 1
+            self._start_queued()
+
+    def _handshake_done(self, accepted, exc):
+        self._active -= 1
+        if exc is None:
+            latency = self._loop.time() - accepted
+            self._completed += 1
+            self._latency_total += latency
+            if self._latency_min is None or latency < self._latency_min:
+                self._latency_min = latency
+            if self._latency_max is None or latency > self._latency_max:
+                self._latency_max = latency
+        elif isinstance(exc, TimeoutError):
+            self._timed_out += 1
+        else:
+            self._failed += 1
+        self._start_queued()
+
+    def _start_queued(self):
+        queue = self._queue
+        while queue and (self._max_concurrent is None or
+                         self._active < self._max_concurrent):
+            entry = queue.popleft()
+            if (self._timeout is not None and
+                    self._loop.time() - entry.accepted > self._timeout):
+                # The deadline is due but has not run yet.
+                entry.conn.close()
+                self._dropped += 1
+                continue
+            self._start(entry.accepted, entry.conn, entry.addr,
+                        entry.protocol_factory, entry.sslcontext,
+                        entry.server)
+        if not queue and self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+
+    def get_stats(self):
+        completed = self._completed
+        return {
+            'active': self._active,
+            'queued': len(self._queue),
+            'completed': completed,
+            'failed': self._failed,
+            'timed_out': self._timed_out,
+            'dropped': self._dropped,
+            'latency_min': self._latency_min,
+            'latency_mean': (self._latency_total / completed
+                             if completed else None),
+            'latency_max': self._latency_max,
+        }
+
 
 class _FlowControlMixin(transports.Transport):
     """All the logic for (write) flow control in a mix-in base class.
@@ -408,12 +628,8 @@ class _SelectorTransport(_FlowControlMixin, transports.Transport):
     def __init__(self, loop, sock, protocol, extra, server=None):
         super().__init__(extra)
         self._extra['socket'] = sock
-        self._extra['sockname'] = sock.getsockname()
-        if 'peername' not in self._extra:
-            try:
-                self._extra['peername'] = sock.getpeername()
-            except socket.error:
-                self._extra['peername'] = None
+        # 'sockname' and 'peername' are queried by get_extra_info() on
+        # first use, unless the caller already knows them.
         self._loop = loop
         self._sock = sock
         self._sock_fd = sock.fileno()
@@ -425,6 +641,26 @@ class _SelectorTransport(_FlowControlMixin, transports.Transport):
         if self._server is not None:
             self._server.attach(self)
 
+    def get_extra_info(self, name, default=None):
+        try:
+            return self._extra[name]
+        except KeyError:
+            pass
+        if name == 'sockname':
+            query = 'getsockname'
+        elif name == 'peername':
+            query = 'getpeername'
+        else:
+            return default
+        if self._sock is None:
+            return default
+        try:
+            value = getattr(self._sock, query)()
+        except socket.error:
+            value = None
+        self._extra[name] = value
+        return value
+
     def abort(self):
         self._force_close(None)
 
@@ -479,6 +715,9 @@ class _SelectorSocketTransport(_SelectorTransport):
         super().__init__(loop, sock, protocol, extra, server)
         self._eof = False
         self._paused = False
+        self._corked = False       # Set by cork(), cleared by uncork().
+        self._auto_cork = False    # Set by set_auto_cork().
+        self._flush_deferred = False  # Set while waiting for _flush().
 
         self._loop.add_reader(self._sock_fd, self._read_ready)
         self._loop.call_soon(self._protocol.connection_made, self)
@@ -501,9 +740,78 @@ class _SelectorSocketTransport(_SelectorTransport):
             return
         self._loop.add_reader(self._sock_fd, self._read_ready)
 
+    def set_nodelay(self, enabled=True):
+        """Enable or disable the Nagle algorithm (TCP_NODELAY).
+
+        This has no effect on non-TCP sockets.
+        """
+        if self._sock.family not in (socket.AF_INET,
+                                     getattr(socket, 'AF_INET6', None)):
+            return
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY,
+                              bool(enabled))
+
+    def cork(self):
+        """Hold back the data passed to write() until uncork() is called.
+
+        The data is kept in the transport buffer and sent with a single
+        send() call when the transport is uncorked, so that a header, a body
+        and a trailer written separately end up in the same packet.
+        """
+        self._corked = True
+
+    def uncork(self):
+        """Send the data held back since cork() was called."""
+        if not self._corked:
+            return
+        self._corked = False
+        if not self._flush_deferred:
+            self._flush()
+
+    def set_auto_cork(self, enabled=True):
+        """Enable or disable the auto-cork mode.
+
+        In auto-cork mode, the data written by the callbacks of a dispatch
+        pass of the event loop are coalesced and sent once the dispatch pass
+        ends.  Data written outside of a dispatch pass is sent immediately.
+        """
+        self._auto_cork = bool(enabled)
+
+    def _flush(self):
+        # Send the data held back by cork() or by the auto-cork mode.
+        self._flush_deferred = False
+        if not self._buffer or self._corked or self._conn_lost:
+            return
+        try:
+            n = self._send(self._buffer)
+        except (BlockingIOError, InterruptedError):
+            n = 0
+        except Exception as exc:
+            self._loop.remove_writer(self._sock_fd)
+            self._buffer.clear()
+            self._fatal_error(exc)
+            return
+        if n:
+            del self._buffer[:n]
+        self._maybe_resume_protocol()  # May append to buffer.
+        if self._buffer:
+            self._loop.add_writer(self._sock_fd, self._write_ready)
+        else:
+            self._loop.remove_writer(self._sock_fd)
+            if self._closing:
+                self._call_connection_lost(None)
+            elif self._eof:
+                self._sock.shutdown(socket.SHUT_WR)
+
+    def _recv(self):
+        return self._sock.recv(self.max_size)
+
+    def _send(self, data):
+        return self._sock.send(data)
+
     def _read_ready(self):
         try:
-            data = self._sock.recv(self.max_size)
+            data = self._recv()
         except (BlockingIOError, InterruptedError):
             pass
         except Exception as exc:
@@ -537,20 +845,27 @@ class _SelectorSocketTransport(_SelectorTransport):
             return
 
         if not self._buffer:
-            # Optimization: try to send now.
-            try:
-                n = self._sock.send(data)
-            except (BlockingIOError, InterruptedError):
+            if self._corked:
+                # Held back until uncork() is called.
                 pass
-            except Exception as exc:
-                self._fatal_error(exc)
-                return
+            elif self._auto_cork and self._loop._defer_flush(self):
+                # Sent by _flush() at the end of the dispatch pass.
+                self._flush_deferred = True
             else:
-                data = data[n:]
-                if not data:
+                # Optimization: try to send now.
+                try:
+                    n = self._send(data)
+                except (BlockingIOError, InterruptedError):
+                    pass
+                except Exception as exc:
+                    self._fatal_error(exc)
                     return
-            # Not all was written; register write handler.
-            self._loop.add_writer(self._sock_fd, self._write_ready)
+                else:
+                    data = data[n:]
+                    if not data:
+                        return
+                # Not all was written; register write handler.
+                self._loop.add_writer(self._sock_fd, self._write_ready)
 
         # Add it to the buffer.
         self._buffer.extend(data)
@@ -559,8 +874,13 @@ class _SelectorSocketTransport(_SelectorTransport):
     def _write_ready(self):
         assert self._buffer, 'Data should not be empty'
 
+        if self._corked:
+            # Sent by uncork(), which registers the writer again if needed.
+            self._loop.remove_writer(self._sock_fd)
+            return
+
         try:
-            n = self._sock.send(self._buffer)
+            n = self._send(self._buffer)
         except (BlockingIOError, InterruptedError):
             pass
         except Exception as exc:
@@ -581,6 +901,7 @@ class _SelectorSocketTransport(_SelectorTransport):
     def write_eof(self):
         if self._eof:
             return
+        self.uncork()
         self._eof = True
         if not self._buffer:
             self._sock.shutdown(socket.SHUT_WR)
@@ -588,8 +909,17 @@ class _SelectorSocketTransport(_SelectorTransport):
     def can_write_eof(self):
         return True
 
+    def close(self):
+        self.uncork()
+        super().close()
+
 
 class _SelectorSslTransport(_SelectorTransport):
+    """SSL transport based on a wrapped socket.
+
+    Only used when the ssl module lacks MemoryBIO (Python < 3.5), see
+    sslproto.SSLProtocol otherwise.
+    """
 
     _buffer_factory = bytearray
 
@@ -0,0 +1,573 @@
+"""Helpers to consume GObject signals from coroutines."""
+
+__all__ = ['wait_signal', 'wait_any_signal', 'signal_stream',
+           'throttle_signal', 'debounce_signal', 'watch_properties']
+
+import collections
+import weakref
+
+import asyncio
+from asyncio import events
+from asyncio import futures
+from asyncio import tasks
+
+
+# (hash(obj), signal name) -> _SignalMultiplexer; the hash of a GObject
+# wrapper is the address of the GObject, shared by all its wrappers.
+_multiplexers = {}
+
+
+class _SignalMultiplexer:
+    """Single connection to the signal name of obj, shared by the waiters
+    of its next emission.
+
+    A waiter is an object with a _signal_emitted(multiplexer, args) method,
+    called on the next emission, and a _signal_lost(multiplexer) method,
+    called if obj is finalized first.  While there is no waiter, the handler
+    is blocked instead of disconnected, to be reused by the next waiter.
+
+    Only a weak reference to the GObject is kept, so that pending waits do
+    not keep it alive, and the multiplexer is found again through any new
+    wrapper of the same GObject; it goes away when the GObject is finalized,
+    before its address can be reused.
+    """
+
+    @classmethod
+    def get(cls, obj, name):
+        key = (hash(obj), name)
+        mux = _multiplexers.get(key)
+        if mux is None:
+            mux = _multiplexers[key] = cls(obj, name, key)
+        return mux
+
+    def __init__(self, obj, name, key):
+        self._key = key
+        self._waiters = []
+        self._handler = obj.connect(name, self._emitted)
+        self._blocked = False
+        # Calling the GObject weak reference returns a wrapper of the
+        # GObject, or None once it is finalized.
+        self._ref = obj.weak_ref(self._finalized)
+
+    def add(self, waiter):
+        self._waiters.append(waiter)
+        if self._blocked:
+            obj = self._ref()
+            if obj is not None:
+                obj.handler_unblock(self._handler)
+            self._blocked = False
+
+    def discard(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            return
+        if not self._waiters:
+            self._block()
+
+    def _block(self):
+        obj = self._ref()
+        if obj is not None and not self._blocked:
+            obj.handler_block(self._handler)
+            self._blocked = True
+
+    def _emitted(self, *args):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            waiter._signal_emitted(self, args)
+        if not self._waiters:
+            self._block()
+
+    def _finalized(self):
+        if _multiplexers.get(self._key) is self:
+            del _multiplexers[self._key]
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            waiter._signal_lost(self)
+
+
+class wait_signal(futures.Future):
+    """Future for the next emission of the signal name of obj.
+
+    Its result is the tuple of the arguments of the emission, obj first.
+    The future is cancelled if obj is finalized first; it keeps no strong
+    reference to obj.  The waits for the same signal of the same object
+    share a single signal handler.
+    """
+
+    def __init__(self, obj, name, *, loop=None):
+        super().__init__(loop=loop)
+        self._mux = _SignalMultiplexer.get(obj, name)
+        self._mux.add(self)
+
+    def _signal_emitted(self, mux, args):
+        self._mux = None
+        if not self.done():
+            self.set_result(args)
+
+    def _signal_lost(self, mux):
+        self._mux = None
+        super().cancel()
+
+    def cancel(self):
+        mux, self._mux = self._mux, None
+        if mux is not None:
+            mux.discard(self)
+        return super().cancel()
+
+
+class wait_any_signal(futures.Future):
+    """Future for the first emission of any of the signals sources.
+
+    sources is an iterable of (obj, name) pairs.  The result is
+    (obj, name, args) for the first of them emitted, args being the tuple
+    of the arguments of the emission after obj.  All the handlers are then
+    released at once.  The future is cancelled if all the objects are
+    finalized first.  Like wait_signal, it shares the handlers of the
+    other waits on the same signals.
+    """
+
+    def __init__(self, sources, *, loop=None):
+        super().__init__(loop=loop)
+        self._muxes = {}  # _SignalMultiplexer -> signal name
+        try:
+            for obj, name in sources:
+                mux = _SignalMultiplexer.get(obj, name)
+                if mux not in self._muxes:
+                    self._muxes[mux] = name
+                    mux.add(self)
+        except BaseException:
+            # E.g. an unknown signal name: leave the signals already joined.
+            self._release()
+            raise
+        if not self._muxes:
+            raise ValueError('no signal to wait for')
+
+    def _release(self):
+        muxes, self._muxes = self._muxes, {}
+        for mux in muxes:
+            mux.discard(self)
+
+    def _signal_emitted(self, mux, args):
+        name = self._muxes.pop(mux)
+        self._release()
+        if not self.done():
+            self.set_result((args[0], name, args[1:]))
+
+    def _signal_lost(self, mux):
+        del self._muxes[mux]
+        if not self._muxes:
+            super().cancel()
+
+    def cancel(self):
+        self._release()
+        return super().cancel()
+
+
+class signal_stream:
+    """Stream of the emissions of the signal name of obj.
+
+    The signal is connected once, when the stream is created, and every
+    emission queues the tuple of its arguments (obj first, as for
+    wait_signal).  Read them with:
+
+        with gbulb.signal_stream(obj, 'name') as stream:
+            async for args in stream:
+                ...
+
+    or args = yield from stream.get().  Once the stream is closed, the
+    queued emissions are still delivered, then the iteration stops (get()
+    returns None).
+
+    maxsize bounds the queue (0 means unbounded).  When it is full, overflow
+    selects what happens to a new emission: 'drop-oldest' discards the
+    oldest queued one, 'drop-newest' discards the new one, 'block' blocks
+    the signal handler until an emission is read, the emissions happening
+    in between are not seen.
+    """
+
+    def __init__(self, obj, name, *, maxsize=0, overflow='drop-oldest',
+                 loop=None):
+        if maxsize < 0:
+            raise ValueError('maxsize should not be negative, got %r'
+                             % (maxsize,))
+        if overflow not in ('drop-oldest', 'drop-newest', 'block'):
+            raise ValueError('overflow should be drop-oldest, drop-newest '
+                             'or block, got %r' % (overflow,))
+        if loop is None:
+            loop = events.get_event_loop()
+        self._loop = loop
+        self._maxsize = maxsize
+        self._overflow = overflow
+        self._queue = collections.deque()
+        self._getters = collections.deque()
+        self._blocked = False
+        self._received = 0
+        self._dropped = 0
+        self._obj = obj
+        self._handler = obj.connect(name, self._emitted)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    @tasks.coroutine
+    def __anext__(self):
+        args = yield from self.get()
+        if args is None:
+            raise StopAsyncIteration
+        return args
+
+    def _emitted(self, *args):
+        self._received += 1
+        queue = self._queue
+        if self._maxsize and len(queue) >= self._maxsize:
+            self._dropped += 1
+            if self._overflow == 'drop-newest':
+                return
+            queue.popleft()
+        queue.append(args)
+        if (self._overflow == 'block' and self._maxsize and
+                len(queue) >= self._maxsize):
+            self._obj.handler_block(self._handler)
+            self._blocked = True
+        self._wakeup_next()
+
+    def _wakeup_next(self):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                return
+
+    @tasks.coroutine
+    def get(self):
+        """Return the arguments of the next emission, waiting for it.
+
+        Return None once the stream is closed and drained.
+        """
+        while not self._queue:
+            if self._obj is None:
+                return None
+            getter = futures.Future(loop=self._loop)
+            self._getters.append(getter)
+            try:
+                yield from getter
+            except futures.CancelledError:
+                # Let another getter have the emission it was woken for.
+                if not getter.cancelled():
+                    self._wakeup_next()
+                raise
+        return self.get_nowait()
+
+    def get_nowait(self):
+        """Return the arguments of the next queued emission.
+
+        Raise IndexError if there is none.
+        """
+        args = self._queue.popleft()
+        if self._blocked:
+            self._blocked = False
+            self._obj.handler_unblock(self._handler)
+        return args
+
+    def qsize(self):
+        """Number of emissions queued."""
+        return len(self._queue)
+
+    def close(self):
+        """Disconnect the signal.  The queued emissions can still be read."""
+        if self._obj is None:
+            return
+        self._obj.disconnect(self._handler)
+        self._obj = None
+        self._blocked = False
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+
+    def get_stats(self):
+        """Return the number of emissions received, dropped on overflow, and
+        queued."""
+        return {
+            'received': self._received,
+            'dropped': self._dropped,
+            'queued': len(self._queue),
+        }
+
+
+class _rate_limiter:
+    # Base class of throttle_signal and debounce_signal.
+
+    def __init__(self, obj, name, callback, interval, loop):
+        if interval <= 0:
+            raise ValueError('interval should be positive, got %r'
+                             % (interval,))
+        if loop is None:
+            loop = events.get_event_loop()
+        self._loop = loop
+        self._callback = callback
+        self._interval = interval
+        self._timer = None
+        self._args = None        # Arguments of the pending call.
+        self._emissions = 0
+        self._calls = 0
+        self._coalesced = 0
+        self._obj = obj
+        self._handler = obj.connect(name, self._emitted)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _call(self, args):
+        self._calls += 1
+        result = self._callback(*args)
+        if asyncio.iscoroutine(result):
+            self._loop.create_task(result)
+
+    def close(self):
+        """Disconnect the signal and drop the pending call, if any."""
+        if self._obj is None:
+            return
+        self._obj.disconnect(self._handler)
+        self._obj = None
+        self._args = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def get_stats(self):
+        """Return the number of emissions, of calls made, and of emissions
+        coalesced into the call of a later one (or dropped)."""
+        return {
+            'emissions': self._emissions,
+            'calls': self._calls,
+            'coalesced': self._coalesced,
+            'pending': self._args is not None,
+        }
+
+
+class throttle_signal(_rate_limiter):
+    """Call callback for the signal name of obj at most once per interval.
+
+    The first emission calls callback(obj, *args) at once (unless leading is
+    false) and opens an interval during which the emissions are coalesced:
+    the last one is passed to callback when the interval ends (unless
+    trailing is false), which opens the next interval.  A coroutine
+    returned by callback is run as a task.
+
+    There is a single timer per interval, however many emissions it
+    coalesces.
+    """
+
+    def __init__(self, obj, name, callback, interval, *, leading=True,
+                 trailing=True, loop=None):
+        super().__init__(obj, name, callback, interval, loop)
+        self._leading = leading
+        self._trailing = trailing
+
+    def _emitted(self, *args):
+        self._emissions += 1
+        if self._timer is None:
+            self._timer = self._loop.call_later(self._interval,
+                                                self._interval_end)
+            if self._leading:
+                self._call(args)
+                return
+        elif not self._trailing:
+            self._coalesced += 1
+            return
+        if self._args is not None:
+            self._coalesced += 1
+        self._args = args
+
+    def _interval_end(self):
+        self._timer = None
+        args, self._args = self._args, None
+        if args is not None:
+            self._timer = self._loop.call_later(self._interval,
+                                                self._interval_end)
+            self._call(args)
+
+
+class debounce_signal(_rate_limiter):
+    """Call callback for the signal name of obj once it stays quiet.
+
+    callback(obj, *args) is called with the arguments of the last emission
+    once interval seconds have passed without emission.  A coroutine
+    returned by callback is run as a task.
+
+    The emissions only record their arguments and time: the timer is only
+    moved when it fires before the end of the quiet period.
+    """
+
+    def __init__(self, obj, name, callback, interval, *, loop=None):
+        super().__init__(obj, name, callback, interval, loop)
+        self._deadline = None
+
+    def _emitted(self, *args):
+        self._emissions += 1
+        if self._args is not None:
+            self._coalesced += 1
+        self._args = args
+        self._deadline = self._loop.time() + self._interval
+        if self._timer is None:
+            self._timer = self._loop.call_at(self._deadline, self._expired)
+
+    def _expired(self):
+        if self._loop.time() < self._deadline:
+            self._timer = self._loop.call_at(self._deadline, self._expired)
+            return
+        self._timer = None
+        args, self._args = self._args, None
+        self._call(args)
+
+
+class watch_properties:
+    """Stream of the changes of the properties names of obj.
+
+    Each item is a dict mapping the names of the properties changed since
+    the previous item to their current value.  However many times a
+    property is set, a waiting reader is woken at most once per iteration
+    of the loop or, if widget is given, once per frame of widget; the values
+    are read from obj when the item is returned.  As the frame clock does
+    not tick for a widget which is not mapped, the changes are then
+    coalesced per iteration of the loop instead.  Read the items with
+    'async for' or yield from get().
+
+    Only weak references to obj are kept: the stream ends when obj is
+    finalized, or when it is closed.
+    """
+
+    def __init__(self, obj, names, *, widget=None, loop=None):
+        if loop is None:
+            loop = events.get_event_loop()
+        self._loop = loop
+        self._widget = widget
+        self._names = {}         # canonical name -> name as given
+        for name in names:
+            self._names[name.replace('_', '-')] = name
+        self._changed = set()
+        self._getter = None
+        self._scheduled = False
+        self._tick_id = None
+        self._notifications = 0
+        self._items = 0
+        self._ref = weakref.ref(obj)
+        self._handlers = [obj.connect('notify::' + name, self._notified)
+                          for name in self._names]
+        self._weak_ref = obj.weak_ref(self._finalized)
+        if widget is not None:
+            self._unmap_handler = widget.connect('unmap', self._unmapped)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    @tasks.coroutine
+    def __anext__(self):
+        values = yield from self.get()
+        if values is None:
+            raise StopAsyncIteration
+        return values
+
+    def _notified(self, obj, pspec):
+        self._notifications += 1
+        self._changed.add(pspec.name)
+        if self._getter is None or self._scheduled:
+            return
+        self._scheduled = True
+        if self._widget is not None and self._widget.get_mapped():
+            self._tick_id = self._widget.add_tick_callback(self._tick)
+        else:
+            self._loop.call_soon(self._wakeup)
+
+    def _tick(self, widget, frame_clock):
+        self._tick_id = None
+        self._wakeup()
+        return False
+
+    def _unmapped(self, widget):
+        # The pending tick callback would not run before the widget is
+        # mapped again.
+        if self._tick_id is not None:
+            widget.remove_tick_callback(self._tick_id)
+            self._tick_id = None
+            self._loop.call_soon(self._wakeup)
+
+    def _wakeup(self):
+        self._scheduled = False
+        getter = self._getter
+        if getter is not None and not getter.done():
+            getter.set_result(None)
+
+    @tasks.coroutine
+    def get(self):
+        """Return the properties changed since the previous call and their
+        values, waiting for a change.
+
+        Return None once the stream is closed.
+        """
+        if self._getter is not None:
+            raise RuntimeError('get() is already waiting for changes')
+        while not self._changed:
+            if self._handlers is None:
+                return None
+            self._getter = futures.Future(loop=self._loop)
+            try:
+                yield from self._getter
+            finally:
+                self._getter = None
+        obj = self._ref()
+        if obj is None:
+            return None
+        values = {}
+        for name in self._changed:
+            values[self._names[name]] = obj.get_property(name)
+        self._changed.clear()
+        self._items += 1
+        return values
+
+    def _finalized(self):
+        self._handlers = None
+        self._changed.clear()
+        widget, self._widget = self._widget, None
+        if widget is not None:
+            if self._tick_id is not None:
+                widget.remove_tick_callback(self._tick_id)
+                self._tick_id = None
+            widget.disconnect(self._unmap_handler)
+        self._wakeup()
+
+    def close(self):
+        """Disconnect from obj and end the stream."""
+        if self._handlers is None:
+            return
+        obj = self._ref()
+        if obj is not None:
+            for handler in self._handlers:
+                obj.disconnect(handler)
+        self._weak_ref.unref()
+        self._finalized()
+
+    def get_stats(self):
+        """Return the number of notifications received and of items
+        returned."""
+        return {
+            'notifications': self._notifications,
+            'items': self._items,
+        }
@@ -0,0 +1,808 @@
+"""SSL/TLS layer built on ssl.MemoryBIO.
+
+SSLProtocol sits between a plain transport and the application protocol.
+TLS records are encrypted and decrypted in memory, so the layer works over
+any transport (sockets, pipes...) and does not need to know when the
+underlying file descriptor is readable or writable.  The ciphertext produced
+by a batch of records is handed to the underlying transport with a single
+write() call.
+"""
+
+import collections
+try:
+    import ssl
+except ImportError:  # pragma: no cover
+    ssl = None
+
+from asyncio import protocols
+from asyncio import transports
+from asyncio.log import logger
+
+
+def _is_sslproto_available():
+    return hasattr(ssl, "MemoryBIO")
+
+
+def _create_transport_context(server_side, server_hostname):
+    if server_side:
+        raise ValueError('Server side ssl needs a valid SSLContext')
+
+    # Client side may pass ssl=True to use a default
+    # context; in that case the sslcontext passed is None.
+    # The default is the same as used by urllib with
+    # cadefault=True.
+    if hasattr(ssl, '_create_stdlib_context'):
+        sslcontext = ssl._create_stdlib_context(
+            cert_reqs=ssl.CERT_REQUIRED,
+            check_hostname=bool(server_hostname))
+    else:
+        # Fallback for Python 3.3.
+        sslcontext = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        sslcontext.options |= ssl.OP_NO_SSLv2
+        sslcontext.set_default_verify_paths()
+        sslcontext.verify_mode = ssl.CERT_REQUIRED
+    return sslcontext
+
+
+class SSLSessionCache:
+    """Cache of client side TLS sessions.
+
+    Sessions are keyed by (server_hostname, port, sslcontext) and are
+    offered again when a new connection is made with the same key, which
+    saves a full handshake (and a round trip) when the server accepts to
+    resume the session.  The least recently used sessions are dropped when
+    the cache holds more than maxsize sessions.
+
+    The cache also counts the resumed (hits) and full (misses) handshakes
+    on both the client and the server side.
+    """
+
+    def __init__(self, maxsize=256):
+        self._sessions = collections.OrderedDict()
+        self._maxsize = maxsize
+        self._client_hits = 0
+        self._client_misses = 0
+        self._server_hits = 0
+        self._server_misses = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, key):
+        """Return the session cached for key, or None."""
+        try:
+            session = self._sessions.pop(key)
+        except KeyError:
+            return None
+        self._sessions[key] = session
+        return session
+
+    def put(self, key, session):
+        """Store the session for key."""
+        self._sessions.pop(key, None)
+        self._sessions[key] = session
+        while len(self._sessions) > self._maxsize:
+            self._sessions.popitem(last=False)
+
+    def discard(self, key):
+        """Forget the session cached for key."""
+        self._sessions.pop(key, None)
+
+    def clear(self):
+        self._sessions.clear()
+
+    def _record_handshake(self, server_side, reused):
+        if server_side:
+            if reused:
+                self._server_hits += 1
+            else:
+                self._server_misses += 1
+        else:
+            if reused:
+                self._client_hits += 1
+            else:
+                self._client_misses += 1
+
+    def get_stats(self):
+        """Return a dict with the resumption counters."""
+        return {
+            'sessions': len(self._sessions),
+            'client_hits': self._client_hits,
+            'client_misses': self._client_misses,
+            'server_hits': self._server_hits,
+            'server_misses': self._server_misses,
+        }
+
+
+# States of an _SSLPipe.
+_UNWRAPPED = "UNWRAPPED"
+_DO_HANDSHAKE = "DO_HANDSHAKE"
+_WRAPPED = "WRAPPED"
+_SHUTDOWN = "SHUTDOWN"
+
+
+class _SSLPipe(object):
+    """An SSL "Pipe".
+
+    An SSL pipe allows you to communicate with an SSL/TLS protocol instance
+    through memory buffers.  It can be used to implement a security layer for
+    an existing connection where you don't have access to the connection's
+    file descriptor, or for some reason you don't want to use it.
+
+    An SSL pipe can be in "wrapped" and "unwrapped" mode.  In unwrapped mode,
+    data is passed through untransformed.  In wrapped mode, application level
+    data is encrypted to SSL record level data and vice versa.  The SSL record
+    level is the lowest level in the SSL protocol suite and is what travels
+    as-is over the wire.
+
+    An SslPipe initially is in "unwrapped" mode.  To start SSL, call
+    do_handshake().  To shutdown SSL again, call shutdown().
+    """
+
+    max_size = 256 * 1024   # Buffer size passed to read()
+
+    def __init__(self, context, server_side, server_hostname=None,
+                 session=None):
+        """
+        The *context* argument specifies the ssl.SSLContext to use.
+
+        The *server_side* argument indicates whether this is a server side or
+        client side transport.
+
+        The optional *server_hostname* argument can be used to specify the
+        hostname you are connecting to.  You may only specify this parameter
+        if the _ssl module supports Server Name Indication (SNI).
+
+        The optional *session* argument is an ssl.SSLSession to resume
+        (client side only).
+        """
+        self._context = context
+        self._server_side = server_side
+        self._server_hostname = server_hostname
+        self._session = session
+        self._state = _UNWRAPPED
+        self._incoming = ssl.MemoryBIO()
+        self._outgoing = ssl.MemoryBIO()
+        self._sslobj = None
+        self._need_ssldata = False
+        self._handshake_cb = None
+        self._shutdown_cb = None
+
+    @property
+    def context(self):
+        """The SSL context passed to the constructor."""
+        return self._context
+
+    @property
+    def ssl_object(self):
+        """The internal ssl.SSLObject instance.
+
+        Return None if the pipe is not wrapped.
+        """
+        return self._sslobj
+
+    @property
+    def need_ssldata(self):
+        """Whether more record level data is needed to complete a handshake
+        that is currently in progress."""
+        return self._need_ssldata
+
+    @property
+    def wrapped(self):
+        """Whether a security layer is currently in effect.
+
+        Return False during handshake.
+        """
+        return self._state == _WRAPPED
+
+    def do_handshake(self, callback=None):
+        """Start the SSL handshake.
+
+        Return a list of ssldata.  A ssldata element is a list of buffers
+
+        The optional *callback* argument can be used to install a callback
+        that will be called when the handshake is complete.  The callback will
+        be called with None if successful, else an exception instance.
+        """
+        if self._state != _UNWRAPPED:
+            raise RuntimeError('handshake in progress or completed')
+        self._sslobj = self._context.wrap_bio(
+            self._incoming, self._outgoing,
+            server_side=self._server_side,
+            server_hostname=self._server_hostname)
+        if self._session is not None:
+            try:
+                self._sslobj.session = self._session
+            except (AttributeError, ValueError):
+                # Not supported, or the session belongs to another context.
+                pass
+        self._state = _DO_HANDSHAKE
+        self._handshake_cb = callback
+        ssldata, appdata = self.feed_ssldata(b'', only_handshake=True)
+        assert len(appdata) == 0
+        return ssldata
+
+    def shutdown(self, callback=None):
+        """Start the SSL shutdown sequence.
+
+        Return a list of ssldata.  A ssldata element is a list of buffers
+
+        The optional *callback* argument can be used to install a callback
+        that will be called when the shutdown is complete.  The callback will
+        be called without arguments.
+        """
+        if self._state == _UNWRAPPED:
+            raise RuntimeError('no security layer present')
+        if self._state == _SHUTDOWN:
+            raise RuntimeError('shutdown in progress')
+        assert self._state in (_WRAPPED, _DO_HANDSHAKE)
+        self._state = _SHUTDOWN
+        self._shutdown_cb = callback
+        ssldata, appdata = self.feed_ssldata(b'')
+        assert appdata == [] or appdata == [b'']
+        return ssldata
+
+    def feed_eof(self):
+        """Send a potentially "ragged" EOF.
+
+        This method will raise an SSL_ERROR_EOF exception if the EOF is
+        unexpected.
+        """
+        self._incoming.write_eof()
+        ssldata, appdata = self.feed_ssldata(b'')
+        assert appdata == [] or appdata == [b'']
+
+    def feed_ssldata(self, data, only_handshake=False):
+        """Feed SSL record level data into the pipe.
+
+        The data must be a bytes instance. It is OK to send an empty bytes
+        instance. This can be used to get ssldata for a handshake initiated by
+        this endpoint.
+
+        Return a (ssldata, appdata) tuple. The ssldata element is a list of
+        buffers containing SSL data that needs to be sent to the remote SSL.
+
+        The appdata element is a list of buffers containing plaintext data that
+        needs to be forwarded to the application. The appdata list may contain
+        an empty buffer indicating an SSL "close_notify" alert. This alert must
+        be acknowledged by calling shutdown().
+        """
+        if self._state == _UNWRAPPED:
+            # If unwrapped, pass plaintext data straight through.
+            if data:
+                appdata = [data]
+            else:
+                appdata = []
+            return ([], appdata)
+
+        self._need_ssldata = False
+        if data:
+            self._incoming.write(data)
+
+        ssldata = []
+        appdata = []
+        try:
+            if self._state == _DO_HANDSHAKE:
+                # Call do_handshake() until it doesn't raise anymore.
+                self._sslobj.do_handshake()
+                self._state = _WRAPPED
+                if self._handshake_cb:
+                    self._handshake_cb(None)
+                if only_handshake:
+                    return (ssldata, appdata)
+                # Handshake done: execute the wrapped block
+
+            if self._state == _WRAPPED:
+                # Main state: read data from SSL until close_notify
+                while True:
+                    chunk = self._sslobj.read(self.max_size)
+                    appdata.append(chunk)
+                    if not chunk:  # close_notify
+                        break
+
+            elif self._state == _SHUTDOWN:
+                # Call shutdown() until it doesn't raise anymore.
+                self._sslobj.unwrap()
+                self._sslobj = None
+                self._state = _UNWRAPPED
+                if self._shutdown_cb:
+                    self._shutdown_cb()
+
+            elif self._state == _UNWRAPPED:
+                # Drain possible plaintext data after close_notify.
+                appdata.append(self._incoming.read())
+        except (ssl.SSLError, ssl.CertificateError) as exc:
+            if getattr(exc, 'errno', None) not in (
+                    ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE,
+                    ssl.SSL_ERROR_SYSCALL):
+                if self._state == _DO_HANDSHAKE and self._handshake_cb:
+                    self._handshake_cb(exc)
+                raise
+            self._need_ssldata = (exc.errno == ssl.SSL_ERROR_WANT_READ)
+
+        # Check for record level data that needs to be sent back.
+        # Happens for the initial handshake and renegotiations.
+        if self._outgoing.pending:
+            ssldata.append(self._outgoing.read())
+        return (ssldata, appdata)
+
+    def feed_appdata(self, data, offset=0):
+        """Feed plaintext data into the pipe.
+
+        Return an (ssldata, offset) tuple. The ssldata element is a list of
+        buffers containing record level data that needs to be sent to the
+        remote SSL instance. The offset is the number of plaintext bytes that
+        were processed, which may be less than the length of data.
+
+        NOTE: In case of short writes, this call MUST be retried with the SAME
+        buffer passed into the *data* argument (i.e. the id() must be the
+        same). This is an OpenSSL requirement. A further particularity is that
+        a short write will always have offset == 0, because the _ssl module
+        does not enable partial writes. And even though the offset is zero,
+        there will still be encrypted data in ssldata.
+        """
+        assert 0 <= offset <= len(data)
+        if self._state == _UNWRAPPED:
+            # pass through data in unwrapped mode
+            if offset < len(data):
+                ssldata = [data[offset:]]
+            else:
+                ssldata = []
+            return (ssldata, len(data))
+
+        ssldata = []
+        view = memoryview(data)
+        while True:
+            self._need_ssldata = False
+            try:
+                if offset < len(view):
+                    offset += self._sslobj.write(view[offset:])
+            except ssl.SSLError as exc:
+                # It is not allowed to call write() after unwrap() until the
+                # close_notify is acknowledged. We return the condition to the
+                # caller as a short write.
+                if exc.reason == 'PROTOCOL_IS_SHUTDOWN':
+                    exc.errno = ssl.SSL_ERROR_WANT_READ
+                if exc.errno not in (ssl.SSL_ERROR_WANT_READ,
+                                     ssl.SSL_ERROR_WANT_WRITE,
+                                     ssl.SSL_ERROR_SYSCALL):
+                    raise
+                self._need_ssldata = (exc.errno == ssl.SSL_ERROR_WANT_READ)
+
+            # See if there's any record level data back for us.
+            if self._outgoing.pending:
+                ssldata.append(self._outgoing.read())
+            if offset == len(view) or self._need_ssldata:
+                break
+        return (ssldata, offset)
+
+
+class _SSLProtocolTransport(transports.Transport):
+    """The transport handed to the application protocol by SSLProtocol."""
+
+    def __init__(self, loop, ssl_protocol, app_protocol):
+        super().__init__()
+        self._loop = loop
+        self._ssl_protocol = ssl_protocol
+        self._app_protocol = app_protocol
+
+    def get_extra_info(self, name, default=None):
+        """Get optional transport information."""
+        return self._ssl_protocol._get_extra_info(name, default)
+
+    def close(self):
+        """Close the transport.
+
+        Buffered data will be flushed asynchronously.  No more data
+        will be received.  After all buffered data is flushed, the
+        protocol's connection_lost() method will (eventually) called
+        with None as its argument.
+        """
+        self._ssl_protocol._start_shutdown()
+
+    def pause_reading(self):
+        self._ssl_protocol._transport.pause_reading()
+
+    def resume_reading(self):
+        self._ssl_protocol._transport.resume_reading()
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        self._ssl_protocol._transport.set_write_buffer_limits(high, low)
+
+    def get_write_buffer_size(self):
+        return self._ssl_protocol._transport.get_write_buffer_size()
+
+    def write(self, data):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError('data argument must be byte-ish (%r)',
+                            type(data))
+        if not data:
+            return
+        self._ssl_protocol._write_appdata((data,))
+
+    def writelines(self, list_of_data):
+        # All the buffers are encrypted in one go and the resulting records
+        # are sent with a single write() on the underlying transport.
+        list_of_data = [data for data in list_of_data if data]
+        if list_of_data:
+            self._ssl_protocol._write_appdata(list_of_data)
+
+    def can_write_eof(self):
+        return False
+
+    def abort(self):
+        """Close the transport immediately.
+
+        Buffered data will be lost.  No more data will be received.
+        The protocol's connection_lost() method will (eventually) be
+        called with None as its argument.
+        """
+        self._ssl_protocol._abort()
+
+
+class SSLProtocol(protocols.Protocol):
+    """SSL protocol.
+
+    Implementation of SSL on top of a plain transport using memory buffers.
+    """
+
+    def __init__(self, loop, app_protocol, sslcontext, waiter,
+                 server_side=False, server_hostname=None,
+                 session_cache=None, session_key=None,
+                 handshake_timeout=None, handshake_callback=None):
+        if ssl is None:
+            raise RuntimeError('stdlib ssl module not available')
+
+        if not sslcontext:
+            sslcontext = _create_transport_context(server_side,
+                                                   server_hostname)
+
+        self._server_side = server_side
+        if server_hostname and not server_side and ssl.HAS_SNI:
+            self._server_hostname = server_hostname
+        else:
+            self._server_hostname = None
+        self._sslcontext = sslcontext
+        self._session_cache = session_cache
+        if server_side:
+            session_key = None
+        self._session_key = session_key
+        # Set until the session is stored again after the first read
+        # (TLS 1.3 session tickets arrive after the handshake).
+        self._session_pending = False
+        # SSL-specific extra info. More info are set when the handshake
+        # completes.
+        self._extra = dict(sslcontext=sslcontext)
+
+        # App data write buffering
+        self._write_backlog = collections.deque()
+        self._write_buffer_size = 0
+
+        self._waiter = waiter
+        self._handshake_timeout = handshake_timeout
+        self._handshake_timeout_handle = None
+        # Called with None or an exception when the handshake ends.
+        self._handshake_callback = handshake_callback
+        self._loop = loop
+        self._app_protocol = app_protocol
+        self._app_transport = _SSLProtocolTransport(self._loop,
+                                                    self, self._app_protocol)
+        self._sslpipe = None
+        self._session_established = False
+        self._in_handshake = False
+        self._in_shutdown = False
+        self._transport = None
+
+    def _wakeup_waiter(self, exc=None):
+        if self._waiter is None:
+            return
+        if not self._waiter.cancelled():
+            if exc is not None:
+                self._waiter.set_exception(exc)
+            else:
+                self._waiter.set_result(None)
+        self._waiter = None
+
+    def _handshake_done(self, exc):
+        if self._handshake_timeout_handle is not None:
+            self._handshake_timeout_handle.cancel()
+            self._handshake_timeout_handle = None
+        callback = self._handshake_callback
+        if callback is not None:
+            self._handshake_callback = None
+            callback(exc)
+
+    def connection_made(self, transport):
+        """Called when the low-level connection is made.
+
+        Start the SSL handshake.
+        """
+        self._transport = transport
+        session = None
+        if self._session_key is not None:
+            session = self._session_cache.get(self._session_key)
+        self._sslpipe = _SSLPipe(self._sslcontext,
+                                 self._server_side,
+                                 self._server_hostname,
+                                 session)
+        self._start_handshake()
+
+    def connection_lost(self, exc):
+        """Called when the low-level connection is lost or closed.
+
+        The argument is an exception object or None (the latter
+        meaning a regular EOF is received or the connection was
+        aborted or closed).
+        """
+        if self._session_established:
+            self._session_established = False
+            if self._session_pending:
+                self._store_session()
+            self._loop.call_soon(self._app_protocol.connection_lost, exc)
+        elif self._in_handshake:
+            self._in_handshake = False
+            exc = exc or ConnectionResetError(
+                'Connection lost during the SSL handshake')
+            self._wakeup_waiter(exc)
+            self._handshake_done(exc)
+        self._transport = None
+        self._app_transport = None
+        self._sslpipe = None
+
+    def pause_writing(self):
+        """Called when the low-level transport's buffer goes over
+        the high-water mark.
+        """
+        self._app_protocol.pause_writing()
+
+    def resume_writing(self):
+        """Called when the low-level transport's buffer drains below
+        the low-water mark.
+        """
+        self._app_protocol.resume_writing()
+
+    def data_received(self, data):
+        """Called when some SSL data is received.
+
+        The argument is a bytes object.
+        """
+        if self._sslpipe is None:
+            # The connection was lost while the data was being read.
+            return
+
+        try:
+            ssldata, appdata = self._sslpipe.feed_ssldata(data)
+        except (ssl.SSLError, ssl.CertificateError) as exc:
+            if self._loop.get_debug():
+                logger.warning('%r: SSL error %s (reason %s)',
+                               self, getattr(exc, 'errno', None),
+                               getattr(exc, 'reason', None))
+            self._abort()
+            return
+
+        if ssldata:
+            self._transport.write(b''.join(ssldata))
+
+        if self._session_pending and self._session_established:
+            self._store_session()
+            self._session_pending = False
+
+        for chunk in appdata:
+            if chunk:
+                self._app_protocol.data_received(chunk)
+            else:
+                self._start_shutdown()
+                break
+
+    def eof_received(self):
+        """Called when the other end of the low-level stream
+        is half-closed.
+
+        If this returns a false value (including None), the transport
+        will close itself.  If it returns a true value, closing the
+        transport is up to the protocol.
+        """
+        try:
+            if self._loop.get_debug():
+                logger.debug("%r received EOF", self)
+
+            if self._in_handshake:
+                self._in_handshake = False
+                exc = ConnectionResetError(
+                    'EOF received during the SSL handshake')
+                self._wakeup_waiter(exc)
+                self._handshake_done(exc)
+            elif self._session_established:
+                keep_open = self._app_protocol.eof_received()
+                if keep_open:
+                    logger.warning('returning true from eof_received() '
+                                   'has no effect when using ssl')
+        finally:
+            if self._transport is not None:
+                self._transport.close()
+
+    def _get_extra_info(self, name, default=None):
+        if name in self._extra:
+            return self._extra[name]
+        elif self._transport is not None:
+            return self._transport.get_extra_info(name, default)
+        else:
+            return default
+
+    def _start_shutdown(self):
+        if self._in_shutdown:
+            return
+        self._in_shutdown = True
+        self._write_appdata((b'',))
+
+    def _write_appdata(self, list_of_data):
+        for data in list_of_data:
+            self._write_backlog.append((data, 0))
+            self._write_buffer_size += len(data)
+        self._process_write_backlog()
+
+    def _start_handshake(self):
+        if self._loop.get_debug():
+            logger.debug("%r starts SSL handshake", self)
+        self._in_handshake = True
+        if self._handshake_timeout is not None:
+            self._handshake_timeout_handle = self._loop.call_later(
+                self._handshake_timeout, self._check_handshake_timeout)
+        # (b'', 1) is a special value in _process_write_backlog() to do
+        # the SSL handshake
+        self._write_backlog.append((b'', 1))
+        self._loop.call_soon(self._process_write_backlog)
+
+    def _check_handshake_timeout(self):
+        self._handshake_timeout_handle = None
+        if not self._in_handshake:
+            return
+        self._in_handshake = False
+        exc = TimeoutError('SSL handshake took longer than %s seconds, '
+                           'aborting the connection'
+                           % self._handshake_timeout)
+        self._discard_session()
+        self._wakeup_waiter(exc)
+        self._handshake_done(exc)
+        self._abort()
+
+    def _on_handshake_complete(self, handshake_exc):
+        self._in_handshake = False
+
+        sslobj = self._sslpipe.ssl_object
+        try:
+            if handshake_exc is not None:
+                raise handshake_exc
+
+            peercert = sslobj.getpeercert()
+            if not hasattr(self._sslcontext, 'check_hostname'):
+                # Verify hostname if requested, Python 3.4+ uses check_hostname
+                # and checks the hostname in do_handshake()
+                if (self._server_hostname and
+                    self._sslcontext.verify_mode != ssl.CERT_NONE):
+                    ssl.match_hostname(peercert, self._server_hostname)
+        except BaseException as exc:
+            if self._loop.get_debug():
+                if isinstance(exc, ssl.CertificateError):
+                    logger.warning("%r: SSL handshake failed "
+                                   "on verifying the certificate",
+                                   self, exc_info=True)
+                else:
+                    logger.warning("%r: SSL handshake failed",
+                                   self, exc_info=True)
+            self._discard_session()
+            self._transport.close()
+            self._handshake_done(exc)
+            if isinstance(exc, Exception):
+                self._wakeup_waiter(exc)
+                return
+            else:
+                raise
+
+        if self._session_cache is not None:
+            self._session_cache._record_handshake(
+                self._server_side, getattr(sslobj, 'session_reused', False))
+            if self._session_key is not None:
+                self._session_pending = True
+                self._store_session()
+
+        # Add extra info that becomes available after handshake.
+        self._extra.update(peercert=peercert,
+                           cipher=sslobj.cipher(),
+                           compression=sslobj.compression(),
+                           ssl_object=sslobj,
+                           )
+        self._handshake_done(None)
+        self._app_protocol.connection_made(self._app_transport)
+        self._wakeup_waiter()
+        self._session_established = True
+        # In case transport.write() was already called. Don't call
+        # immediately _process_write_backlog(), but schedule it:
+        # _on_handshake_complete() can be called indirectly from
+        # _process_write_backlog(), and _process_write_backlog() is not
+        # reentrant.
+        self._loop.call_soon(self._process_write_backlog)
+
+    def _discard_session(self):
+        # The handshake failed: do not offer the same session to the next
+        # connections, the server may be the one rejecting it.
+        if self._session_key is not None:
+            self._session_cache.discard(self._session_key)
+            self._session_pending = False
+
+    def _store_session(self):
+        # Save the session of a client connection in the session cache.
+        sslobj = self._sslpipe.ssl_object if self._sslpipe else None
+        session = getattr(sslobj, 'session', None)
+        if session is not None:
+            self._session_cache.put(self._session_key, session)
+
+    def _process_write_backlog(self):
+        # Try to make progress on the write backlog.
+        if self._transport is None or self._sslpipe is None:
+            return
+
+        pending = []
+        try:
+            for i in range(len(self._write_backlog)):
+                data, offset = self._write_backlog[0]
+                if data:
+                    ssldata, offset = self._sslpipe.feed_appdata(data, offset)
+                elif offset:
+                    ssldata = self._sslpipe.do_handshake(
+                        self._on_handshake_complete)
+                    offset = 1
+                else:
+                    ssldata = self._sslpipe.shutdown(self._finalize)
+                    offset = 1
+
+                pending.extend(ssldata)
+
+                if offset < len(data):
+                    self._write_backlog[0] = (data, offset)
+                    # A short write means that a write is blocked on a read
+                    # We need to enable reading if it is paused!
+                    assert self._sslpipe.need_ssldata
+                    if getattr(self._transport, '_paused', False):
+                        self._transport.resume_reading()
+                    break
+
+                # An entire chunk from the backlog was processed. We can
+                # delete it and reduce the outstanding buffer size.
+                del self._write_backlog[0]
+                self._write_buffer_size -= len(data)
+        except BaseException as exc:
+            if self._in_handshake:
+                self._on_handshake_complete(exc)
+            else:
+                self._fatal_error(exc)
+            if not isinstance(exc, Exception):
+                # BaseException
+                raise
+            return
+
+        # All the records produced by this batch go out in a single write.
+        if pending and self._transport is not None:
+            self._transport.write(b''.join(pending))
+
+    def _fatal_error(self, exc):
+        # Should be called from exception handler only.
+        if not isinstance(exc, (BrokenPipeError, ConnectionResetError)):
+            logger.exception('Fatal error for %s', self)
+        if self._transport is not None:
+            force_close = getattr(self._transport, '_force_close', None)
+            if force_close is not None:
+                force_close(exc)
+            else:
+                self._transport.abort()
+
+    def _finalize(self):
+        if self._transport is not None:
+            self._transport.close()
+
+    def _abort(self):
+        if self._transport is not None:
+            try:
+                self._transport.abort()
+            finally:
+                self._finalize()
@@ -0,0 +1,56 @@
+"""Stream wrappers (asyncio.StreamReader/StreamWriter) of the transports."""
+
+__all__ = ['open_file_reader', 'open_file_writer']
+
+from asyncio import events
+from asyncio import streams
+from asyncio import tasks
+
+
+@tasks.coroutine
+def open_file_reader(file, *, loop=None, limit=streams._DEFAULT_LIMIT,
+                     **kwds):
+    """Return a StreamReader reading a regular file.
+
+    file is a file object or a path.  The keyword arguments are passed to
+    loop.connect_read_file(); reading from the file pauses while the reader
+    buffers more than twice limit bytes.
+    """
+    if loop is None:
+        loop = events.get_event_loop()
+    opened = isinstance(file, (str, bytes))
+    if opened:
+        file = open(file, 'rb', buffering=0)
+    reader = streams.StreamReader(limit=limit, loop=loop)
+    protocol = streams.StreamReaderProtocol(reader, loop=loop)
+    try:
+        yield from loop.connect_read_file(lambda: protocol, file, **kwds)
+    except:
+        if opened:
+            file.close()
+        raise
+    return reader
+
+
+@tasks.coroutine
+def open_file_writer(file, *, loop=None, **kwds):
+    """Return a StreamWriter writing a regular file.
+
+    file is a file object or a path, truncated if it exists.  The keyword
+    arguments are passed to loop.connect_write_file(); drain() waits while
+    the data not written yet exceeds the write buffer limits.
+    """
+    if loop is None:
+        loop = events.get_event_loop()
+    opened = isinstance(file, (str, bytes))
+    if opened:
+        file = open(file, 'wb', buffering=0)
+    protocol = streams.FlowControlMixin(loop=loop)
+    try:
+        transport, _ = yield from loop.connect_write_file(lambda: protocol,
+                                                          file, **kwds)
+    except:
+        if opened:
+            file.close()
+        raise
+    return streams.StreamWriter(transport, protocol, None, loop)
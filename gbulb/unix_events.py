@@ -1,7 +1,10 @@
 """Selector eventloop for Unix with signal handling."""
 
+import array
+import collections
 import errno
 import fcntl
+import mmap
 import os
 import signal
 import socket
@@ -14,7 +17,9 @@ import threading
 from asyncio import base_subprocess
 from asyncio import constants
 from asyncio import events
+from asyncio import futures
 from asyncio import protocols
+from .     import base_events
 from .     import selector_events
 from asyncio import tasks
 from asyncio import transports
@@ -145,6 +150,121 @@ class _UnixSelectorEventLoop(selector_events.BaseSelectorEventLoop):
             raise ValueError(
                 'sig {} out of range(1, {})'.format(sig, signal.NSIG))
 
+    def _make_socket_transport(self, sock, protocol, waiter=None, *,
+                               extra=None, server=None):
+        if sock.family == socket.AF_UNIX:
+            return _UnixSocketTransport(self, sock, protocol, waiter,
+                                        extra, server)
+        return super()._make_socket_transport(sock, protocol, waiter,
+                                              extra=extra, server=server)
+
+    @tasks.coroutine
+    def create_unix_connection(self, protocol_factory, path=None, *,
+                               ssl=None, sock=None, server_hostname=None):
+        """Connect to the Unix domain stream socket at path.
+
+        Alternatively, sock is an existing AF_UNIX socket, connected or
+        not.  The transport of a connection without ssl can pass file
+        descriptors, see _UnixSocketTransport.send_fds().
+        """
+        if ssl:
+            if server_hostname is None:
+                raise ValueError(
+                    'you have to pass server_hostname when using ssl')
+        elif server_hostname is not None:
+            raise ValueError('server_hostname is only meaningful with ssl')
+
+        if path is not None:
+            if sock is not None:
+                raise ValueError(
+                    'path and sock can not be specified at the same time')
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, 0)
+            try:
+                sock.setblocking(False)
+                yield from self.sock_connect(sock, path)
+            except:
+                sock.close()
+                raise
+        else:
+            if sock is None:
+                raise ValueError('no path and sock were specified')
+            if sock.family != socket.AF_UNIX:
+                raise ValueError(
+                    'A UNIX Domain Socket was expected, got {!r}'.format(sock))
+            sock.setblocking(False)
+
+        extra = {'peername': path} if path is not None else None
+        protocol = protocol_factory()
+        waiter = futures.Future(loop=self)
+        if ssl:
+            sslcontext = None if isinstance(ssl, bool) else ssl
+            transport = self._make_ssl_transport(
+                sock, protocol, sslcontext, waiter,
+                server_side=False, server_hostname=server_hostname,
+                extra=extra)
+        else:
+            transport = self._make_socket_transport(sock, protocol, waiter,
+                                                    extra=extra)
+        try:
+            yield from waiter
+        except:
+            transport.close()
+            raise
+        return transport, protocol
+
+    @tasks.coroutine
+    def create_unix_server(self, protocol_factory, path=None, *,
+                           sock=None, backlog=100, ssl=None,
+                           accept_batch=1):
+        """Listen on the Unix domain stream socket at path.
+
+        A stale socket file left at path by a previous server is removed;
+        any other kind of file there is an error.  Alternatively, sock is an
+        existing AF_UNIX socket, already bound.
+        """
+        if isinstance(ssl, bool):
+            raise TypeError('ssl argument must be an SSLContext or None')
+        if accept_batch < 1:
+            raise ValueError('accept_batch should be at least 1, got %r'
+                             % (accept_batch,))
+
+        if path is not None:
+            if sock is not None:
+                raise ValueError(
+                    'path and sock can not be specified at the same time')
+            try:
+                if stat.S_ISSOCK(os.stat(path).st_mode):
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.bind(path)
+            except OSError as exc:
+                sock.close()
+                if exc.errno == errno.EADDRINUSE:
+                    # Let's improve the error message by adding
+                    # with what exact address it occurs.
+                    msg = 'Address {!r} is already in use'.format(path)
+                    raise OSError(errno.EADDRINUSE, msg) from None
+                raise
+            except:
+                sock.close()
+                raise
+        else:
+            if sock is None:
+                raise ValueError(
+                    'path was not specified, and no sock specified')
+            if sock.family != socket.AF_UNIX:
+                raise ValueError(
+                    'A UNIX Domain Socket was expected, got {!r}'.format(sock))
+
+        server = base_events.Server(self, [sock])
+        sock.listen(backlog)
+        sock.setblocking(False)
+        self._start_serving(protocol_factory, sock, ssl, server, accept_batch)
+        return server
+
     def _make_read_pipe_transport(self, pipe, protocol, waiter=None,
                                   extra=None):
         return _UnixReadPipeTransport(self, pipe, protocol, waiter, extra)
@@ -153,6 +273,16 @@ class _UnixSelectorEventLoop(selector_events.BaseSelectorEventLoop):
                                    extra=None):
         return _UnixWritePipeTransport(self, pipe, protocol, waiter, extra)
 
+    def _make_read_file_transport(self, file, protocol, waiter=None,
+                                  extra=None, **kwargs):
+        return _UnixReadFileTransport(self, file, protocol, waiter, extra,
+                                      **kwargs)
+
+    def _make_write_file_transport(self, file, protocol, waiter=None,
+                                   extra=None, **kwargs):
+        return _UnixWriteFileTransport(self, file, protocol, waiter, extra,
+                                       **kwargs)
+
     @tasks.coroutine
     def _make_subprocess_transport(self, protocol, args, shell,
                                    stdin, stdout, stderr, bufsize,
@@ -177,6 +307,128 @@ def _set_nonblocking(fd):
     fcntl.fcntl(fd, fcntl.F_SETFL, flags)
 
 
+class _UnixSocketTransport(selector_events._SelectorSocketTransport):
+    """Transport of a Unix domain stream socket.
+
+    On top of the socket transport API, file descriptors can be passed to
+    the peer with send_fds().  The protocol receives the descriptors sent by
+    the peer through its fds_received(fds) method, called right before the
+    data_received() call delivering the bytes they were sent with; the
+    protocol then owns them and must close them.  Descriptors received by a
+    protocol without fds_received() are closed.
+    """
+
+    # Most descriptors accepted with a single recvmsg() call.
+    max_fds = 64
+
+    def __init__(self, loop, sock, protocol, waiter=None,
+                 extra=None, server=None):
+        super().__init__(loop, sock, protocol, waiter, extra, server)
+        self._written = 0  # Bytes accepted by write() so far.
+        self._sent = 0     # Bytes passed to the socket so far.
+        # (offset of the first byte, duplicated descriptors) of every
+        # send_fds() call not fully sent, in order.
+        self._fd_marks = collections.deque()
+        self._ancbufsize = socket.CMSG_SPACE(
+            self.max_fds * array.array('i').itemsize)
+
+    def write(self, data):
+        lost = self._conn_lost
+        super().write(data)
+        if not lost:
+            # Otherwise the data was dropped.
+            self._written += len(data)
+
+    def send_fds(self, data, fds):
+        """Write data, passing the file descriptors fds along.
+
+        data must not be empty: the descriptors are attached to its first
+        byte, which the peer cannot receive without them.  The descriptors
+        are duplicated, the caller may close them as soon as this method
+        returns.
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError('data argument must be byte-ish (%r)',
+                            type(data))
+        if not data:
+            raise ValueError('file descriptors must be sent with some data')
+        if self._eof:
+            raise RuntimeError('Cannot call send_fds() after write_eof()')
+        fds = list(fds)
+        if not fds or self._conn_lost:
+            self.write(data)
+            return
+        dups = []
+        try:
+            for fd in fds:
+                dups.append(os.dup(fd))
+        except:
+            for fd in dups:
+                os.close(fd)
+            raise
+        self._fd_marks.append((self._written, dups))
+        self.write(data)
+
+    def _send(self, data):
+        marks = self._fd_marks
+        if not marks:
+            n = self._sock.send(data)
+        else:
+            offset, fds = marks[0]
+            with memoryview(data) as view:
+                if offset > self._sent:
+                    # Stop right before the bytes the descriptors go with.
+                    n = self._sock.send(view[:offset - self._sent])
+                else:
+                    if len(marks) > 1:
+                        view = view[:marks[1][0] - offset]
+                    n = self._sock.sendmsg(
+                        [view], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                                  array.array('i', fds))])
+                    if n:
+                        # The kernel holds its own references now.
+                        marks.popleft()
+                        self._close_fds(fds)
+        self._sent += n
+        return n
+
+    def _recv(self):
+        data, ancdata, flags, addr = self._sock.recvmsg(
+            self.max_size, self._ancbufsize,
+            getattr(socket, 'MSG_CMSG_CLOEXEC', 0))
+        fds = array.array('i')
+        for level, type, cdata in ancdata:
+            if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+                fds.frombytes(cdata[:len(cdata) - len(cdata) % fds.itemsize])
+        if flags & socket.MSG_CTRUNC:
+            logger.warning('%r: file descriptors sent by the peer were '
+                           'dropped, more than %d in a single read',
+                           self, self.max_fds)
+        if fds:
+            fds_received = getattr(self._protocol, 'fds_received', None)
+            if fds_received is None:
+                logger.warning('%r: closing %d file descriptors received '
+                               'by %r', self, len(fds), self._protocol)
+                self._close_fds(fds)
+            else:
+                fds_received(fds.tolist())
+        return data
+
+    def _close_fds(self, fds):
+        for fd in fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _call_connection_lost(self, exc):
+        try:
+            super()._call_connection_lost(exc)
+        finally:
+            while self._fd_marks:
+                self._close_fds(self._fd_marks.popleft()[1])
+
+
 class _UnixReadPipeTransport(transports.ReadTransport):
 
     max_size = 256 * 1024  # max bytes we read in one eventloop iteration
@@ -397,6 +649,290 @@ class _UnixWritePipeTransport(selector_events._FlowControlMixin,
             self._loop = None
 
 
+def _check_regular_file(fileno):
+    if not stat.S_ISREG(os.fstat(fileno).st_mode):
+        raise ValueError("File transport is for regular files only.")
+
+
+def _pwrite_all(fd, data, offset):
+    written = 0
+    while written < len(data):
+        written += os.pwrite(fd, data[written:], offset + written)
+
+
+class _UnixReadFileTransport(transports.ReadTransport):
+    """Read transport of a regular file.
+
+    Regular files are always readable for poll(), reads are run by the
+    file I/O executor of the loop instead.
+    """
+
+    def __init__(self, loop, file, protocol, waiter=None, extra=None, *,
+                 offset=0, chunk_size=256 * 1024, use_mmap=False):
+        super().__init__(extra)
+        self._extra['file'] = file
+        self._loop = loop
+        self._file = file
+        self._fileno = file.fileno()
+        _check_regular_file(self._fileno)
+        if chunk_size < 1:
+            raise ValueError('chunk_size should be at least 1, got %r'
+                             % (chunk_size,))
+        if offset < 0:
+            raise ValueError('offset should not be negative, got %r'
+                             % (offset,))
+        # Read whole pages, starting on page boundaries after the first read.
+        pages = -(-chunk_size // mmap.PAGESIZE)
+        self._chunk_size = pages * mmap.PAGESIZE
+        self._offset = offset
+        self._mmap = None
+        if use_mmap:
+            try:
+                self._mmap = mmap.mmap(self._fileno, 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped: there is nothing to read.
+                pass
+        self._protocol = protocol
+        self._closing = False
+        self._lost = False       # Set once connection_lost() is scheduled.
+        self._paused = False
+        self._reading = None     # Future of the read in progress.
+        self._held = None        # Chunk read while paused.
+        self._loop.call_soon(self._protocol.connection_made, self)
+        self._loop.call_soon(self._read_more)
+        if waiter is not None:
+            self._loop.call_soon(waiter.set_result, None)
+
+    def _read_more(self):
+        if self._closing or self._paused or self._reading is not None:
+            return
+        start = self._offset
+        end = start + self._chunk_size - start % self._chunk_size
+        if self._mmap is not None:
+            # Copying out of the mapping may fault pages in: not on the
+            # loop thread either.
+            self._reading = self._loop._run_file_io(
+                self._mmap.__getitem__, slice(start, end))
+        else:
+            self._reading = self._loop._run_file_io(
+                os.pread, self._fileno, end - start, start)
+        self._reading.add_done_callback(self._read_done)
+
+    def _read_done(self, future):
+        self._reading = None
+        if self._lost:
+            if self._protocol is None:
+                self._close_file()
+            return
+        try:
+            data = future.result()
+        except Exception as exc:
+            self._fatal_error(exc)
+            return
+        if not data:
+            self._closing = True
+            try:
+                self._protocol.eof_received()
+            finally:
+                self._close(None)
+            return
+        self._offset += len(data)
+        if self._paused:
+            self._held = data
+            return
+        # Read the next chunk while the protocol handles this one.
+        self._read_more()
+        self._protocol.data_received(data)
+
+    def pause_reading(self):
+        self._paused = True
+
+    def resume_reading(self):
+        if not self._paused:
+            return
+        self._paused = False
+        self._loop.call_soon(self._resume)
+
+    def _resume(self):
+        if self._paused or self._lost:
+            return
+        data, self._held = self._held, None
+        self._read_more()
+        if data is not None:
+            self._protocol.data_received(data)
+
+    def close(self):
+        if not self._closing:
+            self._close(None)
+
+    def _fatal_error(self, exc):
+        # should be called by exception handler only
+        logger.exception('Fatal error for %s', self)
+        self._close(exc)
+
+    def _close(self, exc):
+        self._closing = True
+        if self._lost:
+            return
+        self._lost = True
+        self._held = None
+        self._loop.call_soon(self._call_connection_lost, exc)
+
+    def _call_connection_lost(self, exc):
+        try:
+            self._protocol.connection_lost(exc)
+        finally:
+            self._protocol = None
+            if self._reading is None:
+                self._close_file()
+
+    def _close_file(self):
+        # Only once no read uses the file any more.
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+        self._file = None
+        self._loop = None
+
+
+class _UnixWriteFileTransport(selector_events._FlowControlMixin,
+                              transports.WriteTransport):
+    """Write transport of a regular file.
+
+    Writes are run by the file I/O executor of the loop, one at a time;
+    the data written in the meantime is coalesced into the next one.
+    """
+
+    def __init__(self, loop, file, protocol, waiter=None, extra=None, *,
+                 offset=None):
+        super().__init__(extra)
+        self._extra['file'] = file
+        self._loop = loop
+        self._file = file
+        self._fileno = file.fileno()
+        _check_regular_file(self._fileno)
+        if offset is None:
+            offset = os.lseek(self._fileno, 0, os.SEEK_CUR)
+        self._offset = offset
+        self._protocol = protocol
+        self._buffer = []
+        self._buffer_size = 0
+        self._writing = None     # Future of the write in progress.
+        self._writing_size = 0
+        self._conn_lost = 0
+        self._closing = False    # Set when close() or write_eof() called.
+        self._lost = False       # Set once connection_lost() is scheduled.
+        self._loop.call_soon(self._protocol.connection_made, self)
+        if waiter is not None:
+            self._loop.call_soon(waiter.set_result, None)
+
+    def get_write_buffer_size(self):
+        return self._buffer_size + self._writing_size
+
+    def write(self, data):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError('data argument must be byte-ish (%r)',
+                            type(data))
+        if not data:
+            return
+
+        if self._conn_lost or self._closing:
+            if self._conn_lost >= constants.LOG_THRESHOLD_FOR_CONNLOST_WRITES:
+                logger.warning('file closed or os.pwrite(file, data) '
+                               'raised exception.')
+            self._conn_lost += 1
+            return
+
+        # The data is written later, from another thread: copy mutable
+        # buffers.
+        self._buffer.append(bytes(data))
+        self._buffer_size += len(data)
+        self._write_more()
+        self._maybe_pause_protocol()
+
+    def _write_more(self):
+        if self._writing is not None or not self._buffer:
+            return
+        if len(self._buffer) == 1:
+            data = self._buffer[0]
+        else:
+            data = b''.join(self._buffer)
+        self._buffer.clear()
+        self._buffer_size = 0
+        self._writing_size = len(data)
+        self._writing = self._loop._run_file_io(
+            _pwrite_all, self._fileno, data, self._offset)
+        self._writing.add_done_callback(self._write_done)
+
+    def _write_done(self, future):
+        self._writing = None
+        size, self._writing_size = self._writing_size, 0
+        if self._lost:
+            if self._protocol is None:
+                self._close_file()
+            return
+        try:
+            future.result()
+        except Exception as exc:
+            self._conn_lost += 1
+            self._fatal_error(exc)
+            return
+        self._offset += size
+        self._write_more()
+        self._maybe_resume_protocol()  # May append to buffer.
+        if self._closing and self._writing is None:
+            self._lost = True
+            self._call_connection_lost(None)
+
+    def can_write_eof(self):
+        return True
+
+    def write_eof(self):
+        if self._closing:
+            return
+        self._closing = True
+        if self._writing is None:
+            self._lost = True
+            self._loop.call_soon(self._call_connection_lost, None)
+
+    def close(self):
+        if not self._closing:
+            # write_eof is all what we needed to close the file
+            self.write_eof()
+
+    def abort(self):
+        self._close(None)
+
+    def _fatal_error(self, exc):
+        # should be called by exception handler only
+        logger.exception('Fatal error for %s', self)
+        self._close(exc)
+
+    def _close(self, exc=None):
+        self._closing = True
+        if self._lost:
+            return
+        self._lost = True
+        self._buffer.clear()
+        self._buffer_size = 0
+        self._loop.call_soon(self._call_connection_lost, exc)
+
+    def _call_connection_lost(self, exc):
+        try:
+            self._protocol.connection_lost(exc)
+        finally:
+            self._protocol = None
+            if self._writing is None:
+                self._close_file()
+
+    def _close_file(self):
+        # Only once no write uses the file any more.
+        self._file.close()
+        self._file = None
+        self._loop = None
+
+
 class _UnixSubprocessTransport(base_subprocess.BaseSubprocessTransport):
 
     def _start(self, args, shell, stdin, stdout, stderr, bufsize, **kwargs):
@@ -0,0 +1,192 @@
+"""Worker event loops for multi-threaded servers.
+
+A server created with create_server(..., worker_pool=pool) accepts
+connections on its own loop and hands each one to a loop of the pool.  Every
+worker loop runs in its own thread with its own GLib.MainContext, so a
+protocol blocking in a C extension which releases the GIL only stalls the
+connections of its worker.
+"""
+
+__all__ = ['WorkerLoopPool']
+
+import os
+import threading
+
+import asyncio
+from asyncio.log import logger
+from gi.repository import GLib
+
+from . import glib_events
+
+
+class _WorkerServer:
+    """Stand-in for the server of a connection handed to a worker loop.
+
+    Transports attach to and detach from their server on the loop which
+    runs them; this object moves the detach back to the loop of the real
+    server.  The attach is done by the pool at hand-off time, from the
+    server loop, so that the server cannot be seen idle in between: the
+    attach of the transport only records it, for WorkerLoopPool.close().
+    """
+
+    def __init__(self, pool, index, server, loop):
+        self._pool = pool
+        self._index = index
+        self._server = server
+        self._loop = loop
+        self._transport = None
+
+    def attach(self, transport):
+        self._transport = transport
+
+    def detach(self, transport):
+        self._transport = None
+        self._pool._release(self)
+        if self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.detach, transport)
+
+
+class WorkerLoopPool:
+    """A pool of event loops running in their own threads.
+
+    workers is the number of threads (the number of CPUs by default).
+    balance selects the worker loop of each new connection:
+    'round-robin', or 'least-loaded' for the loop with the fewest open
+    connections.
+
+    GLib threads must be enabled (see GLibEventLoopPolicy(threads=True)).
+    """
+
+    def __init__(self, workers=None, *, balance='round-robin'):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError('workers should be at least 1, got %r'
+                             % (workers,))
+        if balance not in ('round-robin', 'least-loaded'):
+            raise ValueError('balance should be round-robin or '
+                             'least-loaded, got %r' % (balance,))
+        self._size = workers
+        self._balance = balance
+        self._loops = []
+        self._threads = []
+        self._loads = [0] * workers
+        self._proxies = [set() for index in range(workers)]
+        self._dispatched = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def loops(self):
+        """The worker loops, empty until start() is called."""
+        return list(self._loops)
+
+    def start(self):
+        """Create the worker loops and start their threads."""
+        if self._loops:
+            raise RuntimeError('worker pool already started')
+        for index in range(self._size):
+            loop = glib_events.GLibEventLoop(GLib.MainContext())
+            thread = threading.Thread(target=self._run, args=(loop,),
+                                      name='gbulb-worker-%d' % index)
+            thread.daemon = True
+            self._loops.append(loop)
+            self._threads.append(thread)
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self, loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def close(self):
+        """Stop the worker loops, wait for their threads and close them.
+
+        The transports still open on the worker loops are aborted first, and
+        detached from their server, whose wait_closed() can then return.
+        """
+        for index, loop in enumerate(self._loops):
+            loop.call_soon_threadsafe(self._shutdown, loop, index)
+        for thread in self._threads:
+            thread.join()
+        for loop in self._loops:
+            loop.close()
+        self._loops = []
+        self._threads = []
+
+    def _shutdown(self, loop, index):
+        # Runs in the worker thread.
+        with self._lock:
+            proxies = list(self._proxies[index])
+        for proxy in proxies:
+            if proxy._transport is not None:
+                proxy._transport.abort()
+        # After the connection_lost() callbacks, which detach the
+        # transports from their server.
+        loop.call_soon(loop.stop)
+
+    def _pick(self):
+        with self._lock:
+            if self._balance == 'least-loaded':
+                loads = self._loads
+                index = loads.index(min(loads))
+            else:
+                index = self._next
+                self._next = (index + 1) % self._size
+            self._loads[index] += 1
+            self._dispatched += 1
+        return index
+
+    def _release(self, proxy):
+        with self._lock:
+            self._loads[proxy._index] -= 1
+            self._proxies[proxy._index].discard(proxy)
+
+    def _dispatch(self, loop, conn, addr, protocol_factory, sslcontext,
+                  server):
+        # Called by the server loop with a freshly accepted connection.
+        if not self._loops:
+            conn.close()
+            raise RuntimeError('worker pool not started')
+        index = self._pick()
+        proxy = _WorkerServer(self, index, server, loop)
+        with self._lock:
+            self._proxies[index].add(proxy)
+        if server is not None:
+            server.attach(proxy)
+        worker = self._loops[index]
+        worker.call_soon_threadsafe(self._start_connection, worker, proxy,
+                                    conn, addr, protocol_factory, sslcontext)
+
+    def _start_connection(self, loop, proxy, conn, addr, protocol_factory,
+                          sslcontext):
+        # Runs in the worker thread: the protocol is created there.
+        try:
+            if sslcontext:
+                loop._make_ssl_transport(
+                    conn, protocol_factory(), sslcontext, None,
+                    server_side=True, extra={'peername': addr},
+                    server=proxy)
+            else:
+                loop._make_socket_transport(
+                    conn, protocol_factory(), extra={'peername': addr},
+                    server=proxy)
+        except Exception:
+            logger.exception('Failed to start the connection of %r on a '
+                             'worker loop', addr)
+            conn.close()
+            proxy.detach(None)
+
+    def get_stats(self):
+        """Return the number of open connections of each worker loop and
+        the total number of connections handed to the pool."""
+        with self._lock:
+            return {'connections': list(self._loads),
+                    'dispatched': self._dispatched}
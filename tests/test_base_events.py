@@ -14,6 +14,7 @@ from asyncio import constants
 from asyncio import test_utils
 
 import gbulb
+from gbulb import base_events as gbulb_base_events
 from gi.repository import GLib
 from gi.repository import GObject
 
@@ -695,5 +696,235 @@ class BaseEventLoopWithSelectorTests(unittest.TestCase):
                                                 MyProto, sock, None, None)
 
 
+class GLibServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_create_server_handshake_limits_without_ssl(self):
+        fut = self.loop.create_server(
+            MyProto, sock=object(), ssl_handshake_timeout=1.0)
+        self.assertRaises(ValueError, self.loop.run_until_complete, fut)
+        fut = self.loop.create_server(
+            MyProto, sock=object(), max_concurrent_handshakes=10)
+        self.assertRaises(ValueError, self.loop.run_until_complete, fut)
+
+    @unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), 'no SO_REUSEPORT')
+    def test_create_server_reuse_port(self):
+        f = self.loop.create_server(MyProto, '127.0.0.1', 0)
+        server = self.loop.run_until_complete(f)
+        sock = server.sockets[0]
+        self.assertFalse(
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT))
+        server.close()
+
+        f = self.loop.create_server(MyProto, '127.0.0.1', 0, reuse_port=True)
+        server = self.loop.run_until_complete(f)
+        sock = server.sockets[0]
+        self.assertTrue(
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT))
+        server.close()
+
+    def test_accept_connection_batch(self):
+        sock = unittest.mock.Mock()
+        conn = unittest.mock.Mock()
+        sock.accept.side_effect = [(conn, ('127.0.0.1', 1)),
+                                   (conn, ('127.0.0.1', 2)),
+                                   BlockingIOError()]
+        self.loop._make_socket_transport = unittest.mock.Mock()
+
+        self.loop._accept_connection(MyProto, sock, accept_batch=10)
+        self.assertEqual(3, sock.accept.call_count)
+        self.assertEqual(2, self.loop._make_socket_transport.call_count)
+
+    def test_accept_connection_batch_limit(self):
+        sock = unittest.mock.Mock()
+        sock.accept.return_value = (unittest.mock.Mock(), ('127.0.0.1', 1))
+        self.loop._make_socket_transport = unittest.mock.Mock()
+
+        self.loop._accept_connection(MyProto, sock, accept_batch=4)
+        self.assertEqual(4, sock.accept.call_count)
+
+    @unittest.mock.patch('gbulb.selector_events.logger')
+    def test_accept_connection_retry_keeps_batch(self, m_log):
+        sock = unittest.mock.Mock()
+        sock.fileno.return_value = 10
+        sock.accept.side_effect = OSError(errno.EMFILE, 'Too many open files')
+        self.loop.remove_reader = unittest.mock.Mock()
+        self.loop.call_later = unittest.mock.Mock()
+
+        self.loop._accept_connection(MyProto, sock, accept_batch=16)
+        self.assertEqual(1, sock.accept.call_count)
+        self.loop.call_later.assert_called_with(constants.ACCEPT_RETRY_DELAY,
+                                                self.loop._start_serving,
+                                                MyProto, sock, None, None, 16)
+
+
+class GLibDebugTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.loop.slow_callback_duration = 0.01
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_briefly(self):
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+
+    def test_set_debug(self):
+        self.loop.set_debug(True)
+        self.assertTrue(self.loop.get_debug())
+        self.loop.set_debug(False)
+        self.assertFalse(self.loop.get_debug())
+
+    @unittest.mock.patch('gbulb.base_events.logger')
+    def test_slow_callback(self, m_log):
+        self.loop.set_debug(True)
+        self.loop.call_soon(time.sleep, 0.02)
+        self.loop.call_later(0.001, time.sleep, 0.02)
+        self.loop.call_soon(time.sleep, 0)
+        self.run_briefly()
+        self.assertEqual(m_log.warning.call_count, 2)
+        msg, handle, dt, label, tb = m_log.warning.call_args[0]
+        self.assertIn('sleep', handle)
+        self.assertGreaterEqual(dt, 0.02)
+        self.assertEqual(label, 'Handle created at')
+        self.assertIn('test_slow_callback', tb)
+
+    @unittest.mock.patch('gbulb.base_events.logger')
+    def test_slow_task(self, m_log):
+        @asyncio.coroutine
+        def block():
+            time.sleep(0.02)
+
+        self.loop.set_debug(True)
+        self.loop.run_until_complete(block())
+        self.assertEqual(m_log.warning.call_count, 1)
+        self.assertIn('block', m_log.warning.call_args[0][1])
+
+    @unittest.mock.patch('gbulb.base_events.logger')
+    def test_no_debug(self, m_log):
+        self.loop.set_debug(False)
+        self.loop.call_soon(time.sleep, 0.02)
+        self.run_briefly()
+        self.assertFalse(m_log.warning.called)
+
+
+def blackhole_listener(family, host):
+    # A listening socket whose accept queue is full: the kernel drops the
+    # SYNs of further connections, which then hang like on a dead route.
+    lsock = socket.socket(family)
+    lsock.bind((host, 0))
+    lsock.listen(0)
+    address = lsock.getsockname()
+    socks = [lsock]
+    for i in range(4):
+        sock = socket.socket(family)
+        sock.setblocking(False)
+        try:
+            sock.connect(address)
+        except BlockingIOError:
+            pass
+        socks.append(sock)
+    return socks, address
+
+
+class GLibHappyEyeballsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        self.loop.close()
+
+    def blackhole(self, family, host):
+        socks, address = blackhole_listener(family, host)
+        self.socks.extend(socks)
+        return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', address)
+
+    def listener(self, family, host):
+        lsock = socket.socket(family)
+        lsock.bind((host, 0))
+        lsock.listen(10)
+        self.socks.append(lsock)
+        return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+                lsock.getsockname())
+
+    def mock_getaddrinfo(self, infos):
+        def getaddrinfo(*args, **kwds):
+            f = asyncio.Future(loop=self.loop)
+            f.set_result(infos)
+            return f
+        self.loop.getaddrinfo = getaddrinfo
+
+    def test_interleave_addrinfos(self):
+        v6a = (socket.AF_INET6, 1, 6, '', ('::1', 1, 0, 0))
+        v6b = (socket.AF_INET6, 1, 6, '', ('::2', 1, 0, 0))
+        v6c = (socket.AF_INET6, 1, 6, '', ('::3', 1, 0, 0))
+        v4a = (socket.AF_INET, 1, 6, '', ('10.0.0.1', 1))
+        v4b = (socket.AF_INET, 1, 6, '', ('10.0.0.2', 1))
+        infos = [v6a, v6b, v6c, v4a, v4b]
+        self.assertEqual([v6a, v4a, v6b, v4b, v6c],
+                         gbulb_base_events._interleave_addrinfos(infos))
+        self.assertEqual([v6a, v6b, v4a, v6c, v4b],
+                         gbulb_base_events._interleave_addrinfos(infos, 2))
+
+    @unittest.skipUnless(IPV6_ENABLED, 'IPv6 not supported or enabled')
+    def test_dead_ipv6_falls_back_to_ipv4(self):
+        dead = self.blackhole(socket.AF_INET6, '::1')
+        alive = self.listener(socket.AF_INET, '127.0.0.1')
+        self.mock_getaddrinfo([dead, alive])
+
+        t0 = time.monotonic()
+        transport, protocol = self.loop.run_until_complete(
+            self.loop.create_connection(asyncio.Protocol, 'example.com', 80,
+                                        happy_eyeballs_delay=0.05))
+        self.assertLess(time.monotonic() - t0, 1.0)
+        self.assertEqual(alive[4], transport.get_extra_info('peername'))
+
+        # The IPv6 attempt has been cancelled and its socket unregistered.
+        test_utils.run_briefly(self.loop)
+        self.assertEqual({}, self.loop._writers)
+        transport.close()
+        test_utils.run_briefly(self.loop)
+
+    def test_sequential_without_delay(self):
+        alive = self.listener(socket.AF_INET, '127.0.0.1')
+        refused = list(alive)
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.socks.append(sock)
+        refused[4] = sock.getsockname()  # Bound but not listening.
+        self.mock_getaddrinfo([tuple(refused), alive])
+
+        transport, protocol = self.loop.run_until_complete(
+            self.loop.create_connection(asyncio.Protocol, 'example.com', 80))
+        self.assertEqual(alive[4], transport.get_extra_info('peername'))
+        transport.close()
+        test_utils.run_briefly(self.loop)
+
+    def test_all_dead_cancelled(self):
+        infos = [self.blackhole(socket.AF_INET, '127.0.0.1'),
+                 self.blackhole(socket.AF_INET, '127.0.0.1')]
+        self.mock_getaddrinfo(infos)
+        coro = self.loop.create_connection(asyncio.Protocol, 'example.com',
+                                           80, happy_eyeballs_delay=0.01)
+        self.assertRaises(
+            asyncio.TimeoutError, self.loop.run_until_complete,
+            asyncio.wait_for(coro, 0.2, loop=self.loop))
+        test_utils.run_briefly(self.loop)
+        self.assertEqual({}, self.loop._writers)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,188 @@
+"""Tests for gio.py"""
+
+import os
+import tempfile
+import unittest
+
+import asyncio
+
+import gbulb
+from gi.repository import GLib
+from gi.repository import Gio
+from gi.repository import GObject
+
+gbulb.BaseGLibEventLoop.init_class()
+GObject.threads_init()
+
+
+class StreamProtocol(asyncio.Protocol):
+
+    def __init__(self, loop, keep_open=False):
+        self.data = b''
+        self.eof = False
+        self.keep_open = keep_open
+        self.done = asyncio.Future(loop=loop)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.data += data
+
+    def eof_received(self):
+        self.eof = True
+        return self.keep_open
+
+    def connection_lost(self, exc):
+        self.done.set_result(exc)
+
+
+class GioStreamTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.payload = bytes(range(256)) * 4096
+
+    def tearDown(self):
+        self.loop.close()
+
+    def input_stream(self):
+        return Gio.MemoryInputStream.new_from_bytes(
+            GLib.Bytes.new(self.payload))
+
+    def connect(self, stream, **kwargs):
+        return self.loop.run_until_complete(self.loop.connect_gio_stream(
+            lambda: StreamProtocol(self.loop, **kwargs), stream))
+
+    def test_read(self):
+        stream = self.input_stream()
+        tr, pr = self.connect(stream)
+        self.assertIsNone(self.loop.run_until_complete(pr.done))
+        self.assertTrue(pr.eof)
+        self.assertEqual(pr.data, self.payload)
+        self.assertTrue(stream.is_closed())
+
+    def test_pause_reading(self):
+        tr, pr = self.connect(self.input_stream())
+        tr.pause_reading()
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+        # At most the read in flight when paused was done.
+        self.assertLessEqual(len(pr.data), tr.max_size)
+        tr.resume_reading()
+        self.loop.run_until_complete(pr.done)
+        self.assertEqual(pr.data, self.payload)
+
+    def test_write(self):
+        stream = Gio.MemoryOutputStream.new_resizable()
+        tr, pr = self.connect(stream)
+        for i in range(0, len(self.payload), 1000):
+            tr.write(self.payload[i:i + 1000])
+        self.assertGreater(tr.get_write_buffer_size(), 0)
+        self.assertFalse(tr.can_write_eof())
+        tr.close()
+        self.assertIsNone(self.loop.run_until_complete(pr.done))
+        self.assertTrue(stream.is_closed())
+        self.assertEqual(stream.steal_as_bytes().get_data(), self.payload)
+
+    def test_iostream(self):
+        output = Gio.MemoryOutputStream.new_resizable()
+        stream = Gio.SimpleIOStream.new(self.input_stream(), output)
+        tr, pr = self.connect(stream, keep_open=True)
+        self.assertTrue(tr.can_write_eof())
+        tr.write(b'request')
+        tr.write_eof()
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+        self.assertTrue(output.is_closed())
+        self.assertEqual(pr.data, self.payload)
+        self.assertTrue(pr.eof)
+        self.assertFalse(pr.done.done())
+        tr.close()
+        self.loop.run_until_complete(pr.done)
+        self.assertTrue(stream.is_closed())
+        self.assertEqual(output.steal_as_bytes().get_data(), b'request')
+
+    def test_close_cancels_read(self):
+        # Nothing is written to the pipe: the read never completes.
+        rfd, wfd = os.pipe()
+        self.addCleanup(os.close, wfd)
+        stream = Gio.UnixInputStream.new(rfd, True)
+        tr, pr = self.connect(stream)
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        tr.close()
+        self.assertIsNone(self.loop.run_until_complete(pr.done))
+        self.assertFalse(pr.eof)
+        self.assertTrue(stream.is_closed())
+
+    def test_not_a_stream(self):
+        self.assertRaises(
+            TypeError, self.loop.run_until_complete,
+            self.loop.connect_gio_stream(asyncio.Protocol, object()))
+
+
+class AsyncWrapperTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'file')
+        with open(self.path, 'wb') as f:
+            f.write(b'contents')
+
+    def tearDown(self):
+        self.loop.close()
+        self.tmpdir.cleanup()
+
+    def test_call_async(self):
+        gfile = Gio.File.new_for_path(self.path)
+        ok, contents, etag = self.loop.run_until_complete(
+            gbulb.call_async(gfile, 'load_contents', loop=self.loop))
+        self.assertTrue(ok)
+        self.assertEqual(contents, b'contents')
+
+    def test_error(self):
+        gfile = Gio.File.new_for_path(self.path + '.missing')
+        with self.assertRaises(GLib.Error) as cm:
+            self.loop.run_until_complete(
+                gbulb.call_async(gfile, 'load_contents', loop=self.loop))
+        self.assertTrue(cm.exception.matches(Gio.io_error_quark(),
+                                             Gio.IOErrorEnum.NOT_FOUND))
+
+    def test_cached(self):
+        load = gbulb.wrap_async(Gio.File, 'load_contents')
+        self.assertIs(gbulb.wrap_async(Gio.File, 'load_contents'), load)
+        self.assertRaises(AttributeError, gbulb.wrap_async, Gio.File, 'nope')
+
+    def test_cancel(self):
+        rfd, wfd = os.pipe()
+        self.addCleanup(os.close, wfd)
+        stream = Gio.UnixInputStream.new(rfd, True)
+        self.addCleanup(stream.close)
+        cancellable = Gio.Cancellable()
+        read = gbulb.call_async(stream, 'read_bytes', 10,
+                                GLib.PRIORITY_DEFAULT, loop=self.loop,
+                                cancellable=cancellable)
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        read.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertTrue(cancellable.is_cancelled())
+        # The stream is usable again: the read has completed.
+        self.assertFalse(stream.has_pending())
+
+    def test_cancelled_by_cancellable(self):
+        rfd, wfd = os.pipe()
+        self.addCleanup(os.close, wfd)
+        stream = Gio.UnixInputStream.new(rfd, True)
+        self.addCleanup(stream.close)
+        cancellable = Gio.Cancellable()
+        read = gbulb.call_async(stream, 'read_bytes', 10,
+                                GLib.PRIORITY_DEFAULT, loop=self.loop,
+                                cancellable=cancellable)
+        self.loop.call_later(0.01, cancellable.cancel)
+        self.assertRaises(asyncio.CancelledError,
+                          self.loop.run_until_complete, read)
+
+
+if __name__ == '__main__':
+    unittest.main()
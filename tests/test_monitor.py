@@ -0,0 +1,265 @@
+"""Tests for monitor.py"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import asyncio
+
+import gbulb
+from gbulb import monitor
+from gi.repository import Gio
+from gi.repository import GLib
+from gi.repository import GObject
+
+gbulb.BaseGLibEventLoop.init_class()
+GObject.threads_init()
+
+
+class SampleWindowTests(unittest.TestCase):
+
+    def test_percentiles(self):
+        window = monitor._SampleWindow(100)
+        self.assertEqual(window.get_stats(),
+                         {'count': 0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0})
+        for value in range(100, 0, -1):
+            window.add(value)
+        self.assertEqual(window.get_stats(),
+                         {'count': 100, 'p50': 50.0, 'p99': 99.0,
+                          'max': 100.0})
+
+    def test_rolling(self):
+        window = monitor._SampleWindow(10)
+        window.add(1000)
+        for i in range(10):
+            window.add(1)
+        self.assertEqual(window.get_stats(),
+                         {'count': 11, 'p50': 1.0, 'p99': 1.0, 'max': 1.0})
+
+    def test_bad_size(self):
+        self.assertRaises(ValueError, monitor._SampleWindow, 0)
+
+
+class LagMonitorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_briefly(self, delay=0.1):
+        self.loop.run_until_complete(asyncio.sleep(delay, loop=self.loop))
+
+    def test_not_started(self):
+        self.run_briefly(0)
+        stats = self.loop.get_stats()
+        self.assertIsNone(stats['timer_lag'])
+        self.assertIsNone(stats['ready_wait'])
+
+    def test_lag(self):
+        self.loop.start_lag_monitor(0.01)
+
+        def block():
+            # The callback queued here waits for the end of the pass.
+            self.loop.call_soon(lambda: None)
+            time.sleep(0.05)
+
+        self.loop.call_later(0.02, block)
+        self.run_briefly()
+        stats = self.loop.get_stats()
+        self.assertGreater(stats['timer_lag']['count'], 3)
+        self.assertGreaterEqual(stats['timer_lag']['max'], 0.03)
+        self.assertLess(stats['timer_lag']['p50'], 0.03)
+        self.assertGreater(stats['ready_wait']['count'], 0)
+        self.assertGreaterEqual(stats['ready_wait']['max'], 0.05)
+
+    def test_stop(self):
+        self.loop.start_lag_monitor(0.01)
+        self.run_briefly(0.05)
+        self.loop.stop_lag_monitor()
+        self.assertIsNone(self.loop.get_stats()['timer_lag'])
+        self.assertRaises(ValueError, self.loop.start_lag_monitor, 0)
+
+
+class LoopStatsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_gauges(self):
+        rfd, wfd = os.pipe()
+        self.addCleanup(os.close, rfd)
+        self.addCleanup(os.close, wfd)
+        base = self.loop.get_stats()
+        self.loop.add_reader(rfd, lambda: None)
+        self.loop.add_writer(wfd, lambda: None)
+        self.loop.call_later(10, lambda: None)
+        self.loop.call_soon(lambda: None)
+        stats = self.loop.get_stats()
+        self.assertEqual(stats['readers'], base['readers'] + 1)
+        self.assertEqual(stats['writers'], base['writers'] + 1)
+        self.assertEqual(stats['handlers'], base['handlers'] + 3)
+        self.assertEqual(stats['ready'], 1)
+        self.assertEqual(stats['sources'], stats['handlers'] + 1)
+        self.assertEqual(stats['fd_registrations'],
+                         base['fd_registrations'] + 2)
+        self.assertEqual(stats['executor_queue'], 0)
+
+    def test_gio_pending(self):
+        base = self.loop.get_stats()
+        load = gbulb.call_async(Gio.File.new_for_path(__file__),
+                                'load_contents', loop=self.loop)
+        stats = self.loop.get_stats()
+        self.assertEqual(stats['gio_pending'], 1)
+        self.assertEqual(stats['sources'], base['sources'] + 1)
+        self.loop.run_until_complete(load)
+        self.assertEqual(self.loop.get_stats()['gio_pending'], 0)
+
+    def test_counters(self):
+        base = self.loop.get_stats()
+        self.loop.call_later(0.01, lambda: None)
+        self.loop.call_later(10, lambda: None).cancel()
+        self.loop.call_soon(lambda: None)
+        self.loop.call_soon(lambda: None).cancel()
+        self.loop.call_soon_threadsafe(lambda: None)
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+        stats = self.loop.get_stats()
+        self.assertEqual(stats['timers_scheduled'] - base['timers_scheduled'],
+                         3)  # One for asyncio.sleep().
+        self.assertEqual(stats['timers_cancelled'],
+                         base['timers_cancelled'] + 1)
+        self.assertEqual(stats['timers_fired'], base['timers_fired'] + 2)
+        self.assertEqual(stats['threadsafe_calls'],
+                         base['threadsafe_calls'] + 1)
+        self.assertGreater(stats['dispatches'], base['dispatches'])
+        self.assertGreaterEqual(stats['callbacks_run'],
+                                base['callbacks_run'] + 4)
+
+
+class PollTimingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_poll_timing(self):
+        self.assertIsNone(self.loop.get_stats()['poll'])
+        self.loop.start_poll_timing()
+        rfd, wfd = os.pipe()
+        self.addCleanup(os.close, rfd)
+        self.addCleanup(os.close, wfd)
+
+        def read():
+            self.loop.remove_reader(rfd)
+            os.read(rfd, 1)
+            time.sleep(0.01)
+
+        self.loop.add_reader(rfd, read)
+        self.loop.call_later(0.02, os.write, wfd, b'x')
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+        stats = self.loop.get_stats()['poll']
+        self.assertGreater(stats['iterations'], 1)
+        self.assertEqual(sum(stats['poll_us']), stats['iterations'])
+        self.assertEqual(sum(stats['fds']), stats['iterations'])
+        self.assertGreater(stats['wakeups']['fd'], 0)
+        self.assertGreater(stats['wakeups']['timeout'], 0)
+        self.assertGreaterEqual(stats['poll_time'], 0.02)
+        self.assertGreaterEqual(stats['dispatch_time'], 0.01)
+        # The 10 ms spent in read().
+        self.assertGreater(sum(stats['dispatch_us'][14:]), 0)
+
+        self.loop.stop_poll_timing()
+        self.assertIsNone(self.loop.get_stats()['poll'])
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+
+    def test_shared_context(self):
+        other = gbulb.GLibEventLoop(GLib.main_context_default())
+        self.addCleanup(other.close)
+        self.loop.start_poll_timing()
+        self.assertRaises(RuntimeError, other.start_poll_timing)
+        self.assertIsNone(other.get_stats()['poll'])
+        self.loop.stop_poll_timing()
+        other.start_poll_timing()
+        other.run_until_complete(asyncio.sleep(0.01, loop=other))
+        self.assertGreater(other.get_stats()['poll']['iterations'], 0)
+        other.stop_poll_timing()
+
+
+class TraceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'trace.json')
+
+    def tearDown(self):
+        self.loop.close()
+        self.tmpdir.cleanup()
+
+    def load(self):
+        self.loop.dump_trace(self.path)
+        with open(self.path) as f:
+            return json.load(f)['traceEvents']
+
+    def test_events(self):
+        self.loop.start_trace()
+        rfd, wfd = os.pipe()
+        self.addCleanup(os.close, rfd)
+        self.addCleanup(os.close, wfd)
+
+        def read():
+            self.loop.remove_reader(rfd)
+            os.read(rfd, 1)
+
+        self.loop.add_reader(rfd, read)
+        self.loop.call_later(0.01, os.write, wfd, b'x')
+        thread = threading.Thread(target=self.loop.call_soon_threadsafe,
+                                  args=(time.sleep, 0))
+        thread.start()
+        thread.join()
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))
+
+        events = self.load()
+        names = [event['name'] for event in events]
+        self.assertIn('dispatch', names)
+        self.assertIn('timer', names)
+        self.assertIn('read', [name.rsplit('.', 1)[-1] for name in names])
+        self.assertIn({'fd': rfd}, [event.get('args') for event in events
+                                    if event['name'] == 'readable'])
+        submission, = [event for event in events
+                       if event['cat'] == 'thread']
+        self.assertEqual(submission['args'], {'callback': 'sleep'})
+        self.assertEqual(submission['tid'], thread.ident)
+        for event in events:
+            if event['ph'] == 'X':
+                self.assertGreaterEqual(event['dur'], 0)
+
+    def test_ring(self):
+        self.loop.start_trace(10)
+        for i in range(100):
+            self.loop.call_soon(lambda: None)
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        self.assertEqual(len(self.load()), 10)
+
+    def test_not_started(self):
+        self.assertRaises(RuntimeError, self.loop.dump_trace, self.path)
+        self.loop.start_trace()
+        self.loop.stop_trace()
+        self.assertRaises(RuntimeError, self.loop.dump_trace, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
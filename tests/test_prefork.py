@@ -0,0 +1,77 @@
+"""Tests for prefork.py"""
+
+import os
+import unittest
+import unittest.mock
+
+from gbulb import prefork
+
+
+class PreforkSupervisorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        self.addCleanup(os.close, self.rfd)
+        self.addCleanup(os.close, self.wfd)
+
+    def read_all(self):
+        os.close(self.wfd)
+        self.wfd = os.open(os.devnull, os.O_WRONLY)
+        data = b''
+        while True:
+            chunk = os.read(self.rfd, 1024)
+            if not chunk:
+                return data
+            data += chunk
+
+    def test_invalid_workers(self):
+        self.assertRaises(ValueError, prefork.PreforkSupervisor, id, 0)
+
+    @unittest.mock.patch('gbulb.prefork.logger')
+    def test_restart_dead_workers(self, m_log):
+        wfd = self.wfd
+
+        def target(index):
+            os.write(wfd, str(index).encode('ascii'))
+
+        class Supervisor(prefork.PreforkSupervisor):
+            def _spawn(self, index):
+                if self.restarts >= 3:
+                    self.stop()
+                else:
+                    super()._spawn(index)
+
+        supervisor = Supervisor(target, 2, min_uptime=0)
+        supervisor.run()
+        self.assertEqual(3, supervisor.restarts)
+        self.assertEqual([], supervisor.get_pids())
+        data = self.read_all()
+        self.assertEqual(4, len(data))
+        self.assertEqual({b'0'[0], b'1'[0]}, set(data))
+
+    def test_stop(self):
+        rfd = self.rfd
+
+        def target(index):
+            # Block until killed.
+            os.read(rfd, 1)
+
+        supervisor = prefork.PreforkSupervisor(target, 2)
+        supervisor._spawn(0)
+        supervisor._spawn(1)
+        self.assertEqual(2, len(supervisor.get_pids()))
+        supervisor.stop()
+        for pid in supervisor.get_pids():
+            pid, status = os.waitpid(pid, 0)
+            self.assertTrue(os.WIFSIGNALED(status))
+
+    def test_run_prefork_needs_port(self):
+        self.assertRaises(ValueError, prefork.run_prefork, object, '', 0)
+
+    def test_run_prefork_needs_reuse_port(self):
+        self.assertRaises(ValueError, prefork.run_prefork, object, '', 8000,
+                          reuse_port=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,290 @@
+"""Tests for resolver.py"""
+
+import socket
+import unittest
+import unittest.mock
+
+import asyncio
+from asyncio import test_utils
+
+import gbulb
+from gbulb import resolver
+from gi.repository import GLib
+from gi.repository import Gio
+from gi.repository import GObject
+
+gbulb.BaseGLibEventLoop.init_class()
+GObject.threads_init()
+
+INFO = [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+         ('127.0.0.1', 80))]
+
+
+class ResolverCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        self.now = 1000.0
+        self.loop.time = lambda: self.now
+        self.resolutions = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def resolve(self):
+        future = asyncio.Future(loop=self.loop)
+        self.resolutions.append(future)
+        return future
+
+    def lookup(self, cache, key='example.com'):
+        return cache.lookup(self.loop, key, self.resolve)
+
+    def test_coalesce_in_flight(self):
+        cache = resolver.ResolverCache()
+        waiters = [self.lookup(cache) for i in range(200)]
+        self.assertEqual(1, len(self.resolutions))
+        self.resolutions[0].set_result(INFO)
+        test_utils.run_briefly(self.loop)
+        self.assertTrue(all(waiter.result() == INFO for waiter in waiters))
+        # Each caller gets its own list.
+        self.assertIsNot(waiters[0].result(), waiters[1].result())
+        stats = cache.get_stats()
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(199, stats['coalesced'])
+        self.assertEqual(0, stats['in_flight'])
+
+    def test_ttl(self):
+        cache = resolver.ResolverCache(ttl=10.0)
+        self.lookup(cache)
+        self.resolutions[0].set_result(INFO)
+        test_utils.run_briefly(self.loop)
+
+        self.now += 5
+        self.assertEqual(INFO, self.lookup(cache).result())
+        self.assertEqual(1, len(self.resolutions))
+        self.now += 10
+        self.assertFalse(self.lookup(cache).done())
+        self.assertEqual(2, len(self.resolutions))
+        self.assertEqual(1, cache.get_stats()['hits'])
+
+    def test_negative_caching(self):
+        cache = resolver.ResolverCache(negative_ttl=2.0)
+        waiter = self.lookup(cache)
+        self.resolutions[0].set_exception(socket.gaierror(-2, 'Not found'))
+        test_utils.run_briefly(self.loop)
+        self.assertIsInstance(waiter.exception(), socket.gaierror)
+
+        first = self.lookup(cache).exception()
+        second = self.lookup(cache).exception()
+        self.assertIsInstance(first, socket.gaierror)
+        self.assertEqual((-2, 'Not found'), (first.errno, first.strerror))
+        # Each caller gets its own exception.
+        self.assertIsNot(first, second)
+        self.assertIsNot(waiter.exception(), first)
+        self.assertEqual(2, cache.get_stats()['negative_hits'])
+        self.now += 3
+        self.lookup(cache)
+        self.assertEqual(2, len(self.resolutions))
+
+    def test_other_errors_not_cached(self):
+        cache = resolver.ResolverCache()
+        self.lookup(cache)
+        self.resolutions[0].set_exception(OSError())
+        test_utils.run_briefly(self.loop)
+        self.lookup(cache)
+        self.assertEqual(2, len(self.resolutions))
+
+    def test_lru_eviction(self):
+        cache = resolver.ResolverCache(maxsize=2)
+        for key in ('a', 'b', 'a', 'c'):
+            self.lookup(cache, key)
+            if not self.resolutions[-1].done():
+                self.resolutions[-1].set_result(INFO)
+            test_utils.run_briefly(self.loop)
+        self.assertEqual(2, len(cache))
+        self.assertTrue(self.lookup(cache, 'a').done())
+        self.assertFalse(self.lookup(cache, 'b').done())
+        self.assertEqual(1, cache.get_stats()['evictions'])
+
+    def test_cancel_one_caller(self):
+        cache = resolver.ResolverCache()
+        first = self.lookup(cache)
+        second = self.lookup(cache)
+        first.cancel()
+        test_utils.run_briefly(self.loop)
+        self.assertFalse(self.resolutions[0].cancelled())
+        self.resolutions[0].set_result(INFO)
+        test_utils.run_briefly(self.loop)
+        self.assertEqual(INFO, second.result())
+
+    def test_cancel_all_callers(self):
+        cache = resolver.ResolverCache()
+        first = self.lookup(cache)
+        second = self.lookup(cache)
+        first.cancel()
+        second.cancel()
+        test_utils.run_briefly(self.loop)
+        self.assertTrue(self.resolutions[0].cancelled())
+        self.assertFalse(self.lookup(cache).done())
+        self.assertEqual(2, len(self.resolutions))
+
+    def test_loop_getaddrinfo(self):
+        self.loop._getaddrinfo = unittest.mock.Mock(
+            side_effect=lambda *args: self.resolve())
+        self.assertIsNone(self.loop.get_resolver_stats())
+        self.loop.set_resolver_cache(resolver.ResolverCache())
+        f1 = self.loop.getaddrinfo('example.com', 80)
+        f2 = self.loop.getaddrinfo('example.com', 80)
+        f3 = self.loop.getaddrinfo('example.com', 443)
+        self.assertEqual(2, self.loop._getaddrinfo.call_count)
+        self.loop._getaddrinfo.assert_called_with(
+            'example.com', 443, 0, 0, 0, 0)
+        self.assertEqual(1, self.loop.get_resolver_stats()['coalesced'])
+        for future in (f1, f2, f3):
+            future.cancel()
+
+
+HOSTS = """
+# /etc/hosts style table for HostsResolver
+127.0.0.1   localhost-test www.example.test
+::1         www.example.test
+"""
+
+
+class HostsResolver:
+    """GResolver stand-in answering from an /etc/hosts style table."""
+
+    def __init__(self, text):
+        self.names = {}
+        self.addresses = {}
+        self.cancellables = []
+        for line in text.splitlines():
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+            self.addresses.setdefault(fields[0], fields[1])
+            for name in fields[1:]:
+                self.names.setdefault(name, []).append(fields[0])
+
+    def _complete(self, callback, result):
+        callback(self, result, None)
+        return False
+
+    def _start(self, key, cancellable, callback):
+        # Like GIO, complete in the thread-default context of the caller.
+        self.cancellables.append(cancellable)
+        source = GLib.Idle()
+        source.set_callback(self._complete, callback, (key, cancellable))
+        source.attach(GLib.MainContext.ref_thread_default())
+
+    def _error(self, code, message):
+        return GLib.Error.new_literal(Gio.resolver_error_quark(),
+                                      message, code)
+
+    def lookup_by_name_async(self, name, cancellable, callback, user_data):
+        self._start(name, cancellable, callback)
+
+    def lookup_by_name_finish(self, result):
+        name, cancellable = result
+        if name not in self.names:
+            raise self._error(Gio.ResolverError.NOT_FOUND, 'Unknown host')
+        return [Gio.InetAddress.new_from_string(address)
+                for address in self.names[name]]
+
+    def lookup_by_address_async(self, address, cancellable, callback,
+                                user_data):
+        self._start(address.to_string(), cancellable, callback)
+
+    def lookup_by_address_finish(self, result):
+        address, cancellable = result
+        if address not in self.addresses:
+            raise self._error(Gio.ResolverError.NOT_FOUND, 'No PTR record')
+        return self.addresses[address]
+
+
+class GioResolverTests(unittest.TestCase):
+
+    def new_loop(self):
+        return gbulb.GLibEventLoop(GLib.main_context_default())
+
+    def setUp(self):
+        self.loop = self.new_loop()
+        self.loop.run_in_executor = unittest.mock.Mock(
+            side_effect=AssertionError('executor used'))
+        self.hosts = HostsResolver(HOSTS)
+        self.loop.set_resolver(resolver.GioResolver(self.hosts))
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_getaddrinfo(self):
+        infos = self.loop.run_until_complete(self.loop.getaddrinfo(
+            'www.example.test', 80, type=socket.SOCK_STREAM))
+        self.assertEqual(
+            [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+              ('127.0.0.1', 80)),
+             (socket.AF_INET6, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+              ('::1', 80, 0, 0))],
+            infos)
+
+    def test_getaddrinfo_family(self):
+        infos = self.loop.run_until_complete(self.loop.getaddrinfo(
+            'www.example.test', 80, family=socket.AF_INET6))
+        self.assertEqual({socket.AF_INET6}, {info[0] for info in infos})
+        self.assertEqual({socket.SOCK_STREAM, socket.SOCK_DGRAM},
+                         {info[1] for info in infos})
+
+    def test_getaddrinfo_not_found(self):
+        with self.assertRaises(socket.gaierror) as cm:
+            self.loop.run_until_complete(
+                self.loop.getaddrinfo('missing.example.test', 80))
+        self.assertEqual(socket.EAI_NONAME, cm.exception.errno)
+
+    def test_getaddrinfo_numeric(self):
+        infos = self.loop.run_until_complete(self.loop.getaddrinfo(
+            '127.0.0.1', 80, type=socket.SOCK_STREAM))
+        self.assertEqual(('127.0.0.1', 80), infos[0][4])
+        self.assertEqual([], self.hosts.cancellables)
+
+    def test_getaddrinfo_cancel(self):
+        future = self.loop.getaddrinfo('www.example.test', 80)
+        future.cancel()
+        test_utils.run_briefly(self.loop)
+        self.assertTrue(self.hosts.cancellables[0].is_cancelled())
+
+    def test_getnameinfo(self):
+        name = self.loop.run_until_complete(self.loop.getnameinfo(
+            ('127.0.0.1', 80), socket.NI_NUMERICSERV))
+        self.assertEqual(('localhost-test', '80'), name)
+
+    def test_getnameinfo_unknown(self):
+        name = self.loop.run_until_complete(self.loop.getnameinfo(
+            ('10.1.2.3', 80), socket.NI_NUMERICSERV))
+        self.assertEqual(('10.1.2.3', '80'), name)
+        with self.assertRaises(socket.gaierror):
+            self.loop.run_until_complete(self.loop.getnameinfo(
+                ('10.1.2.3', 80),
+                socket.NI_NUMERICSERV | socket.NI_NAMEREQD))
+
+
+class GioResolverPrivateContextTests(GioResolverTests):
+    # Lookups complete in the context of the loop, not the default one.
+
+    def new_loop(self):
+        return gbulb.GLibEventLoop(GLib.MainContext())
+
+    def test_real_resolver(self):
+        # Uses the resolver of the system.
+        self.loop.set_resolver(resolver.GioResolver())
+        try:
+            infos = self.loop.run_until_complete(asyncio.wait_for(
+                self.loop.getaddrinfo('localhost', 80,
+                                      type=socket.SOCK_STREAM),
+                5, loop=self.loop))
+        except (socket.gaierror, asyncio.TimeoutError) as exc:
+            self.skipTest('localhost cannot be resolved: %s' % (exc,))
+        self.assertTrue(infos)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,6 +24,8 @@ from asyncio.selector_events import _SelectorSocketTransport
 from asyncio.selector_events import _SelectorDatagramTransport
 
 import gbulb
+from gbulb import selector_events as gbulb_selector_events
+from gbulb import sslproto as gbulb_sslproto
 from gi.repository import GLib
 from gi.repository import GObject
 
@@ -79,8 +81,12 @@ class BaseSelectorEventLoopTests(unittest.TestCase):
         self.loop.add_writer = unittest.mock.Mock()
         self.loop.remove_reader = unittest.mock.Mock()
         self.loop.remove_writer = unittest.mock.Mock()
+        if gbulb_sslproto._is_sslproto_available():
+            expected = gbulb_sslproto._SSLProtocolTransport
+        else:
+            expected = gbulb_selector_events._SelectorSslTransport
         self.assertIsInstance(
-            self.loop._make_ssl_transport(m, m, m, m), _SelectorSslTransport)
+            self.loop._make_ssl_transport(m, m, m, m), expected)
 
     @unittest.mock.patch('asyncio.selector_events.ssl', None)
     def test_make_ssl_transport_without_ssl_error(self):
@@ -1685,5 +1691,270 @@ class SelectorDatagramTransportTests(unittest.TestCase):
         m_exc.assert_called_with('Fatal error for %s', transport)
 
 
+class GLibSocketTransportCorkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = GLibTestLoop(GLib.main_context_default())
+        self.protocol = test_utils.make_test_protocol(asyncio.Protocol)
+        self.sock = unittest.mock.Mock(socket.socket)
+        self.sock.fileno.return_value = 7
+        self.sock.family = socket.AF_INET
+        self.sent = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def send(self, data):
+        self.sent.append(bytes(data))
+        return len(data)
+
+    def transport(self):
+        return gbulb_selector_events._SelectorSocketTransport(
+            self.loop, self.sock, self.protocol)
+
+    def test_set_nodelay(self):
+        tr = self.transport()
+        tr.set_nodelay()
+        self.sock.setsockopt.assert_called_with(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, True)
+        tr.set_nodelay(False)
+        self.sock.setsockopt.assert_called_with(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, False)
+
+    def test_set_nodelay_unix(self):
+        self.sock.family = socket.AF_UNIX
+        self.transport().set_nodelay()
+        self.assertFalse(self.sock.setsockopt.called)
+
+    def test_cork(self):
+        self.sock.send.side_effect = self.send
+        tr = self.transport()
+        tr.cork()
+        tr.write(b'header')
+        tr.write(b'body')
+        self.assertFalse(self.sock.send.called)
+        self.assertEqual(list_to_buffer([b'header', b'body']), tr._buffer)
+
+        tr.uncork()
+        self.assertEqual([b'headerbody'], self.sent)
+        self.assertFalse(tr._buffer)
+        self.assertNotIn(7, self.loop._writers)
+
+    def test_uncork_partial(self):
+        self.sock.send.return_value = 2
+        tr = self.transport()
+        tr.cork()
+        tr.write(b'data')
+        tr.uncork()
+        self.assertEqual(list_to_buffer([b'ta']), tr._buffer)
+        self.assertIn(7, self.loop._writers)
+
+    def test_cork_during_backpressure(self):
+        self.sock.send.return_value = 2
+        tr = self.transport()
+        tr.write(b'data')
+        self.assertIn(7, self.loop._writers)
+        tr.cork()
+        tr.write(b'more')
+        self.sock.send.reset_mock()
+        tr._write_ready()
+        self.assertFalse(self.sock.send.called)
+        self.assertNotIn(7, self.loop._writers)
+
+        self.sock.send.side_effect = self.send
+        tr.uncork()
+        self.assertEqual([b'tamore'], self.sent)
+        self.assertFalse(tr._buffer)
+
+    def test_close_uncorks(self):
+        self.sock.send.side_effect = self.send
+        tr = self.transport()
+        tr.cork()
+        tr.write(b'data')
+        tr.close()
+        self.assertEqual([b'data'], self.sent)
+        self.assertTrue(tr._closing)
+
+    def test_auto_cork(self):
+        self.sock.send.side_effect = self.send
+        tr = self.transport()
+        tr.set_auto_cork()
+
+        def respond():
+            tr.write(b'header')
+            tr.write(b'body')
+            tr.write(b'trailer')
+            self.assertFalse(self.sock.send.called)
+
+        self.loop.call_soon(respond)
+        self.loop._dispatch()
+        self.assertEqual([b'headerbodytrailer'], self.sent)
+        self.assertFalse(tr._buffer)
+
+    def test_auto_cork_outside_dispatch(self):
+        self.sock.send.return_value = 4
+        tr = self.transport()
+        tr.set_auto_cork()
+        tr.write(b'data')
+        self.sock.send.assert_called_once_with(b'data')
+        self.assertFalse(tr._flush_deferred)
+
+
+class GLibTransportExtraInfoTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = unittest.mock.Mock()
+        self.sock = unittest.mock.Mock(socket.socket)
+        self.sock.getsockname.return_value = ('127.0.0.1', 8000)
+        self.sock.getpeername.return_value = ('127.0.0.1', 12345)
+
+    def transport(self, extra=None):
+        return gbulb_selector_events._SelectorSocketTransport(
+            self.loop, self.sock, unittest.mock.Mock(), extra=extra)
+
+    def test_setup_does_not_query_socket(self):
+        tr = self.transport({'peername': ('127.0.0.1', 12345)})
+        self.assertFalse(self.sock.getsockname.called)
+        self.assertFalse(self.sock.getpeername.called)
+        self.assertEqual(('127.0.0.1', 12345), tr.get_extra_info('peername'))
+        self.assertFalse(self.sock.getpeername.called)
+        self.assertIs(self.sock, tr.get_extra_info('socket'))
+
+    def test_lazy_sockname_cached(self):
+        tr = self.transport()
+        self.assertEqual(('127.0.0.1', 8000), tr.get_extra_info('sockname'))
+        self.assertEqual(('127.0.0.1', 8000), tr.get_extra_info('sockname'))
+        self.assertEqual(1, self.sock.getsockname.call_count)
+
+    def test_lazy_peername_not_connected(self):
+        self.sock.getpeername.side_effect = OSError
+        tr = self.transport()
+        self.assertIsNone(tr.get_extra_info('peername'))
+
+    def test_unknown_and_closed(self):
+        tr = self.transport()
+        self.assertEqual('x', tr.get_extra_info('unknown', 'x'))
+        tr._sock = None
+        self.assertEqual('x', tr.get_extra_info('sockname', 'x'))
+
+    def test_addresses_looked_up_on_demand(self):
+        tr = self.transport()
+        self.assertFalse(self.sock.getsockname.called)
+        self.assertFalse(self.sock.getpeername.called)
+        self.assertEqual(('127.0.0.1', 12345), tr.get_extra_info('peername'))
+        self.assertFalse(self.sock.getsockname.called)
+        self.assertEqual(1, self.sock.getpeername.call_count)
+
+
+class SSLHandshakeLimiterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = unittest.mock.Mock()
+        self.loop.time.return_value = 100.0
+        self.callbacks = []
+        self.loop._make_ssl_transport.side_effect = (
+            lambda *args, handshake_callback, **kw:
+            self.callbacks.append(handshake_callback))
+
+    def accept(self, limiter):
+        conn = unittest.mock.Mock(socket.socket)
+        limiter.accept(conn, ('127.0.0.1', 12345), asyncio.Protocol,
+                       unittest.mock.Mock(), None)
+        return conn
+
+    def test_max_concurrent(self):
+        limiter = gbulb_selector_events._SSLHandshakeLimiter(self.loop, 2)
+        for i in range(3):
+            self.accept(limiter)
+        self.assertEqual(2, len(self.callbacks))
+        self.assertEqual(1, limiter.get_stats()['queued'])
+
+        self.loop.time.return_value = 100.5
+        self.callbacks[0](None)
+        self.assertEqual(3, len(self.callbacks))
+        stats = limiter.get_stats()
+        self.assertEqual(2, stats['active'])
+        self.assertEqual(0, stats['queued'])
+        self.assertEqual(1, stats['completed'])
+        self.assertEqual(0.5, stats['latency_max'])
+
+    def test_stalled_queued_connection_dropped(self):
+        limiter = gbulb_selector_events._SSLHandshakeLimiter(
+            self.loop, 1, timeout=10.0)
+        self.accept(limiter)
+        conn = self.accept(limiter)
+        self.loop.time.return_value = 111.0
+        self.callbacks[0](TimeoutError())
+        self.assertTrue(conn.close.called)
+        self.assertEqual(1, len(self.callbacks))
+        stats = limiter.get_stats()
+        self.assertEqual(1, stats['timed_out'])
+        self.assertEqual(1, stats['dropped'])
+        self.assertEqual(0, stats['active'])
+        self.assertIsNone(stats['latency_mean'])
+
+    def test_queue_deadline(self):
+        limiter = gbulb_selector_events._SSLHandshakeLimiter(
+            self.loop, 1, timeout=10.0)
+        self.accept(limiter)
+        first = self.accept(limiter)
+        self.loop.time.return_value = 104.0
+        second = self.accept(limiter)
+        # A single timer, for the deadline of the oldest connection.
+        self.assertEqual(1, self.loop.call_at.call_count)
+        when, expire = self.loop.call_at.call_args[0]
+        self.assertEqual(110.0, when)
+
+        # Nothing frees a slot: the deadline alone drops the connection.
+        self.loop.time.return_value = 110.0
+        expire()
+        self.assertTrue(first.close.called)
+        self.assertFalse(second.close.called)
+        self.assertEqual(2, self.loop.call_at.call_count)
+        when, expire = self.loop.call_at.call_args[0]
+        self.assertEqual(114.0, when)
+
+        self.loop.time.return_value = 114.0
+        expire()
+        self.assertTrue(second.close.called)
+        self.assertEqual(2, self.loop.call_at.call_count)
+        stats = limiter.get_stats()
+        self.assertEqual(0, stats['queued'])
+        self.assertEqual(2, stats['dropped'])
+
+    def test_latency_includes_queue_wait(self):
+        limiter = gbulb_selector_events._SSLHandshakeLimiter(self.loop, 1)
+        self.accept(limiter)
+        self.accept(limiter)
+        self.loop.time.return_value = 101.0
+        self.callbacks[0](None)
+        self.loop.time.return_value = 101.5
+        self.callbacks[1](None)
+        stats = limiter.get_stats()
+        self.assertEqual(1.0, stats['latency_min'])
+        self.assertEqual(1.5, stats['latency_max'])
+
+    def test_close(self):
+        limiter = gbulb_selector_events._SSLHandshakeLimiter(
+            self.loop, 1, timeout=10.0)
+        self.accept(limiter)
+        conns = [self.accept(limiter) for i in range(3)]
+        limiter.close()
+        for conn in conns:
+            self.assertTrue(conn.close.called)
+        self.assertEqual(1, self.loop.call_at.call_count)
+        expiry = self.loop.call_at.return_value
+        self.assertEqual(1, expiry.cancel.call_count)
+        self.assertEqual(0, limiter.get_stats()['queued'])
+
+    def test_handshake_timeout_passed(self):
+        limiter = gbulb_selector_events._SSLHandshakeLimiter(
+            self.loop, timeout=5.0)
+        self.accept(limiter)
+        self.assertEqual(
+            5.0,
+            self.loop._make_ssl_transport.call_args[1]['handshake_timeout'])
+
+
 if __name__ == '__main__':
     unittest.main()
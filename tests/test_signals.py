@@ -0,0 +1,405 @@
+"""Tests for signals.py"""
+
+import unittest
+import unittest.mock
+import weakref
+
+import asyncio
+
+import gbulb
+from gbulb import signals
+from gi.repository import Gio
+from gi.repository import GLib
+from gi.repository import GObject
+
+gbulb.BaseGLibEventLoop.init_class()
+GObject.threads_init()
+
+
+class Emitter(GObject.Object):
+    __gsignals__ = {
+        'ping': (GObject.SIGNAL_RUN_FIRST, None, (int,)),
+    }
+
+
+class Model(GObject.Object):
+    value = GObject.Property(type=int, default=0)
+    other_value = GObject.Property(type=str, default='')
+    ignored = GObject.Property(type=int, default=0)
+
+
+class WaitSignalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.obj = Emitter()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_result(self):
+        waiter = gbulb.wait_signal(self.obj, 'ping', loop=self.loop)
+        self.loop.call_soon(self.obj.emit, 'ping', 3)
+        self.assertEqual(self.loop.run_until_complete(waiter), (self.obj, 3))
+
+    def test_shared_handler(self):
+        with unittest.mock.patch.object(
+                self.obj, 'connect', wraps=self.obj.connect) as connect:
+            waiters = [gbulb.wait_signal(self.obj, 'ping', loop=self.loop)
+                       for i in range(10)]
+            self.assertEqual(connect.call_count, 1)
+            waiters[0].cancel()
+            self.obj.emit('ping', 1)
+            self.assertTrue(waiters[0].cancelled())
+            for waiter in waiters[1:]:
+                self.assertEqual(waiter.result(), (self.obj, 1))
+
+            # The handler is kept, blocked, for the next waits.
+            self.obj.emit('ping', 2)
+            waiter = gbulb.wait_signal(self.obj, 'ping', loop=self.loop)
+            self.obj.emit('ping', 3)
+            self.assertEqual(waiter.result(), (self.obj, 3))
+            self.assertEqual(connect.call_count, 1)
+
+    def test_new_wrapper(self):
+        # Only the action group keeps the action alive: its wrapper is
+        # dropped and a new one is created by lookup_action().
+        group = Gio.SimpleActionGroup()
+        group.add_action(Gio.SimpleAction.new('go', None))
+        first = gbulb.wait_signal(group.lookup_action('go'), 'activate',
+                                  loop=self.loop)
+        mux = first._mux
+        action = group.lookup_action('go')
+        second = gbulb.wait_signal(action, 'activate', loop=self.loop)
+        self.assertIs(second._mux, mux)
+        self.assertIs(signals._multiplexers[(hash(action), 'activate')], mux)
+
+        action.activate(None)
+        self.assertEqual(first.result(), (action, None))
+        self.assertEqual(second.result(), (action, None))
+
+    def test_weak(self):
+        waiter = gbulb.wait_signal(self.obj, 'ping', loop=self.loop)
+        ref = weakref.ref(self.obj)
+        self.obj = None
+        self.assertIsNone(ref())
+        self.assertTrue(waiter.cancelled())
+
+
+class WaitAnySignalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.objs = [Emitter() for i in range(20)]
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_first(self):
+        waiter = gbulb.wait_any_signal([(obj, 'ping') for obj in self.objs],
+                                       loop=self.loop)
+        self.loop.call_soon(self.objs[5].emit, 'ping', 1)
+        self.loop.call_soon(self.objs[6].emit, 'ping', 2)
+        self.assertEqual(self.loop.run_until_complete(waiter),
+                         (self.objs[5], 'ping', (1,)))
+
+    def test_released(self):
+        waiter = gbulb.wait_any_signal([(obj, 'ping') for obj in self.objs],
+                                       loop=self.loop)
+        other = gbulb.wait_signal(self.objs[1], 'ping', loop=self.loop)
+        self.objs[0].emit('ping', 1)
+        self.assertTrue(waiter.done())
+        self.assertFalse(other.done())
+        self.objs[1].emit('ping', 2)
+        self.assertEqual(other.result(), (self.objs[1], 2))
+        self.assertEqual(waiter.result(), (self.objs[0], 'ping', (1,)))
+
+    def test_bad_source(self):
+        self.assertRaises(TypeError, gbulb.wait_any_signal,
+                          [(self.objs[0], 'ping'), (self.objs[1], 'pong')],
+                          loop=self.loop)
+        mux = signals._multiplexers[(hash(self.objs[0]), 'ping')]
+        self.assertEqual(mux._waiters, [])
+        self.assertTrue(mux._blocked)
+
+    def test_cancel(self):
+        waiter = gbulb.wait_any_signal([(obj, 'ping') for obj in self.objs],
+                                       loop=self.loop)
+        self.assertTrue(waiter.cancel())
+        self.objs[0].emit('ping', 1)
+        self.assertTrue(waiter.cancelled())
+
+    def test_all_finalized(self):
+        waiter = gbulb.wait_any_signal([(obj, 'ping') for obj in self.objs],
+                                       loop=self.loop)
+        del self.objs[:-1]
+        self.assertFalse(waiter.done())
+        self.objs = None
+        self.assertTrue(waiter.cancelled())
+
+    def test_no_source(self):
+        self.assertRaises(ValueError, gbulb.wait_any_signal, [],
+                          loop=self.loop)
+
+
+class SignalStreamTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.obj = Emitter()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def emit(self, *values):
+        for value in values:
+            self.obj.emit('ping', value)
+
+    def drain(self, stream):
+        values = []
+        while stream.qsize():
+            values.append(stream.get_nowait()[1])
+        return values
+
+    def test_get(self):
+        stream = gbulb.signal_stream(self.obj, 'ping', loop=self.loop)
+        self.loop.call_soon(self.emit, 1, 2)
+        args = self.loop.run_until_complete(stream.get())
+        self.assertEqual(args, (self.obj, 1))
+        self.assertEqual(self.loop.run_until_complete(stream.get())[1], 2)
+        stream.close()
+        self.assertIsNone(self.loop.run_until_complete(stream.get()))
+
+    def test_close_wakes_getter(self):
+        stream = gbulb.signal_stream(self.obj, 'ping', loop=self.loop)
+        self.loop.call_soon(self.emit, 1)
+        self.loop.call_soon(stream.close)
+        self.assertEqual(self.loop.run_until_complete(stream.get())[1], 1)
+        self.assertIsNone(self.loop.run_until_complete(stream.get()))
+        # Disconnected.
+        self.emit(2)
+        self.assertEqual(stream.qsize(), 0)
+
+    def test_drop_oldest(self):
+        stream = gbulb.signal_stream(self.obj, 'ping', maxsize=3,
+                                     loop=self.loop)
+        self.emit(*range(5))
+        self.assertEqual(self.drain(stream), [2, 3, 4])
+        self.assertEqual(stream.get_stats(),
+                         {'received': 5, 'dropped': 2, 'queued': 0})
+
+    def test_drop_newest(self):
+        stream = gbulb.signal_stream(self.obj, 'ping', maxsize=3,
+                                     overflow='drop-newest', loop=self.loop)
+        self.emit(*range(5))
+        self.assertEqual(self.drain(stream), [0, 1, 2])
+        self.assertEqual(stream.get_stats()['dropped'], 2)
+
+    def test_block(self):
+        stream = gbulb.signal_stream(self.obj, 'ping', maxsize=2,
+                                     overflow='block', loop=self.loop)
+        self.emit(*range(4))
+        self.assertEqual(stream.get_stats(),
+                         {'received': 2, 'dropped': 0, 'queued': 2})
+        self.assertEqual(stream.get_nowait()[1], 0)
+        self.emit(4)
+        self.assertEqual(self.drain(stream), [1, 4])
+
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, gbulb.signal_stream, self.obj, 'ping',
+                          maxsize=-1, loop=self.loop)
+        self.assertRaises(ValueError, gbulb.signal_stream, self.obj, 'ping',
+                          overflow='drop', loop=self.loop)
+
+
+class RateLimiterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.obj = Emitter()
+        self.calls = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def callback(self, obj, value):
+        self.assertIs(obj, self.obj)
+        self.calls.append(value)
+
+    def burst(self, count=100):
+        for value in range(count):
+            self.obj.emit('ping', value)
+
+    def sleep(self, delay):
+        self.loop.run_until_complete(asyncio.sleep(delay, loop=self.loop))
+
+    def test_throttle(self):
+        limiter = gbulb.throttle_signal(self.obj, 'ping', self.callback, 0.02,
+                                        loop=self.loop)
+        self.burst()
+        self.assertEqual(self.calls, [0])
+        self.sleep(0.1)
+        self.assertEqual(self.calls, [0, 99])
+        self.assertEqual(limiter.get_stats(),
+                         {'emissions': 100, 'calls': 2, 'coalesced': 98,
+                          'pending': False})
+        limiter.close()
+        self.burst(1)
+        self.assertEqual(self.calls, [0, 99])
+
+    def test_throttle_no_trailing(self):
+        limiter = gbulb.throttle_signal(self.obj, 'ping', self.callback, 0.02,
+                                        trailing=False, loop=self.loop)
+        self.burst()
+        self.sleep(0.1)
+        self.burst(1)
+        self.assertEqual(self.calls, [0, 0])
+        self.assertEqual(limiter.get_stats()['coalesced'], 99)
+
+    def test_throttle_no_leading(self):
+        gbulb.throttle_signal(self.obj, 'ping', self.callback, 0.02,
+                              leading=False, loop=self.loop)
+        self.burst()
+        self.assertEqual(self.calls, [])
+        self.sleep(0.1)
+        self.assertEqual(self.calls, [99])
+
+    def test_debounce(self):
+        limiter = gbulb.debounce_signal(self.obj, 'ping', self.callback, 0.05,
+                                        loop=self.loop)
+        self.burst()
+        self.sleep(0.03)
+        self.burst(10)
+        self.sleep(0.03)
+        self.assertEqual(self.calls, [])
+        self.assertTrue(limiter.get_stats()['pending'])
+        self.sleep(0.1)
+        self.assertEqual(self.calls, [9])
+        self.assertEqual(limiter.get_stats(),
+                         {'emissions': 110, 'calls': 1, 'coalesced': 109,
+                          'pending': False})
+
+    def test_close_cancels_pending_call(self):
+        limiter = gbulb.debounce_signal(self.obj, 'ping', self.callback, 0.01,
+                                        loop=self.loop)
+        self.burst()
+        limiter.close()
+        self.sleep(0.05)
+        self.assertEqual(self.calls, [])
+
+    def test_coroutine_callback(self):
+        @asyncio.coroutine
+        def callback(obj, value):
+            self.calls.append(value)
+
+        gbulb.debounce_signal(self.obj, 'ping', callback, 0.01,
+                              loop=self.loop)
+        self.burst()
+        self.sleep(0.05)
+        self.assertEqual(self.calls, [99])
+
+    def test_bad_interval(self):
+        self.assertRaises(ValueError, gbulb.throttle_signal, self.obj, 'ping',
+                          self.callback, 0, loop=self.loop)
+
+
+class WatchPropertiesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.model = Model()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_coalesced(self):
+        watch = gbulb.watch_properties(self.model, ['value', 'other_value'],
+                                       loop=self.loop)
+
+        def update():
+            for i in range(1000):
+                self.model.value = i
+                self.model.ignored = i
+            self.model.other_value = 'done'
+
+        self.loop.call_soon(update)
+        values = self.loop.run_until_complete(watch.get())
+        self.assertEqual(values, {'value': 999, 'other_value': 'done'})
+        self.assertEqual(watch.get_stats(),
+                         {'notifications': 1001, 'items': 1})
+
+        self.model.value = 5
+        self.assertEqual(self.loop.run_until_complete(watch.get()),
+                         {'value': 5})
+        watch.close()
+        self.model.value = 6
+        self.assertIsNone(self.loop.run_until_complete(watch.get()))
+
+    def test_widget(self):
+        widget = unittest.mock.Mock()
+        widget.get_mapped.return_value = True
+        watch = gbulb.watch_properties(self.model, ['value'], widget=widget,
+                                       loop=self.loop)
+        get = asyncio.async(watch.get(), loop=self.loop)
+        self.loop.call_soon(setattr, self.model, 'value', 1)
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertFalse(get.done())
+        tick = widget.add_tick_callback.call_args[0][0]
+        tick(widget, None)
+        self.assertEqual(self.loop.run_until_complete(get), {'value': 1})
+
+        watch.close()
+        widget.disconnect.assert_called_with(
+            widget.connect.return_value)
+
+    def test_widget_not_mapped(self):
+        widget = unittest.mock.Mock()
+        widget.get_mapped.return_value = False
+        watch = gbulb.watch_properties(self.model, ['value'], widget=widget,
+                                       loop=self.loop)
+        self.loop.call_soon(setattr, self.model, 'value', 1)
+        self.assertEqual(self.loop.run_until_complete(watch.get()),
+                         {'value': 1})
+        self.assertFalse(widget.add_tick_callback.called)
+
+    def test_widget_unmapped(self):
+        widget = unittest.mock.Mock()
+        widget.get_mapped.return_value = True
+        watch = gbulb.watch_properties(self.model, ['value'], widget=widget,
+                                       loop=self.loop)
+        name, unmapped = widget.connect.call_args[0]
+        self.assertEqual(name, 'unmap')
+        get = asyncio.async(watch.get(), loop=self.loop)
+        self.loop.call_soon(setattr, self.model, 'value', 1)
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertFalse(get.done())
+
+        # The frame clock stops with the widget: the tick never comes.
+        widget.get_mapped.return_value = False
+        unmapped(widget)
+        widget.remove_tick_callback.assert_called_with(
+            widget.add_tick_callback.return_value)
+        self.assertEqual(self.loop.run_until_complete(get), {'value': 1})
+
+    def test_finalized(self):
+        watch = gbulb.watch_properties(self.model, ['value'], loop=self.loop)
+        get = asyncio.async(watch.get(), loop=self.loop)
+        self.loop.call_soon(self.model.run_dispose)
+        self.loop.call_soon(setattr, self, 'model', None)
+        self.assertIsNone(self.loop.run_until_complete(get))
+
+    def test_weak(self):
+        watch = gbulb.watch_properties(self.model, ['value'], loop=self.loop)
+        ref = weakref.ref(self.model)
+        self.model = None
+        self.assertIsNone(ref())
+        self.assertIsNone(self.loop.run_until_complete(watch.get()))
+
+
+if __name__ == '__main__':
+    unittest.main()
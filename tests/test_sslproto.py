@@ -0,0 +1,248 @@
+"""Tests for sslproto.py"""
+
+import os
+import unittest
+import unittest.mock
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+import asyncio
+from asyncio import test_utils
+
+import gbulb
+from gbulb import sslproto
+from gi.repository import GLib
+from gi.repository import GObject
+
+gbulb.BaseGLibEventLoop.init_class()
+GObject.threads_init()
+
+ONLYCERT = os.path.join(os.path.dirname(__file__), 'ssl_cert.pem')
+ONLYKEY = os.path.join(os.path.dirname(__file__), 'ssl_key.pem')
+
+
+def make_contexts():
+    server_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    server_context.load_cert_chain(ONLYCERT, ONLYKEY)
+    client_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    return server_context, client_context
+
+
+def exchange(client, server, ssldata):
+    # Shuttle records between two pipes until both sides are quiet.
+    to_server, to_client = ssldata, []
+    while to_server or to_client:
+        for data in to_server:
+            to_client.extend(server.feed_ssldata(data)[0])
+        to_server = []
+        for data in to_client:
+            to_server.extend(client.feed_ssldata(data)[0])
+        to_client = []
+
+
+@unittest.skipIf(not sslproto._is_sslproto_available(), 'No ssl.MemoryBIO')
+class SSLPipeTests(unittest.TestCase):
+
+    def test_handshake_and_data(self):
+        server_context, client_context = make_contexts()
+        client = sslproto._SSLPipe(client_context, False)
+        server = sslproto._SSLPipe(server_context, True)
+        done = []
+
+        server.do_handshake(lambda exc: done.append(('server', exc)))
+        ssldata = client.do_handshake(lambda exc: done.append(('client', exc)))
+        exchange(client, server, ssldata)
+
+        self.assertEqual([('client', None), ('server', None)], sorted(done))
+        self.assertTrue(client.wrapped)
+        self.assertTrue(server.wrapped)
+
+        ssldata, offset = client.feed_appdata(b'ping')
+        self.assertEqual(4, offset)
+        appdata = [server.feed_ssldata(data)[1] for data in ssldata]
+        self.assertEqual([[b'ping']], appdata)
+
+    def test_unwrapped_passthrough(self):
+        server_context, client_context = make_contexts()
+        pipe = sslproto._SSLPipe(client_context, False)
+        self.assertEqual(([], [b'data']), pipe.feed_ssldata(b'data'))
+        self.assertEqual(([b'data'], 4), pipe.feed_appdata(b'data'))
+
+
+@unittest.skipIf(not sslproto._is_sslproto_available(), 'No ssl.MemoryBIO')
+class SSLProtocolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        self.app_protocol = test_utils.make_test_protocol(asyncio.Protocol)
+        self.transport = unittest.mock.Mock(asyncio.Transport)
+        self.transport._paused = False
+
+    def tearDown(self):
+        self.loop.close()
+
+    def ssl_protocol(self, waiter=None):
+        server_context, client_context = make_contexts()
+        return sslproto.SSLProtocol(self.loop, self.app_protocol,
+                                    client_context, waiter)
+
+    def test_handshake_sends_client_hello(self):
+        proto = self.ssl_protocol()
+        proto.connection_made(self.transport)
+        test_utils.run_briefly(self.loop)
+        self.assertEqual(1, self.transport.write.call_count)
+        self.assertTrue(proto._in_handshake)
+
+    def test_connection_lost_during_handshake(self):
+        waiter = asyncio.Future(loop=self.loop)
+        proto = self.ssl_protocol(waiter)
+        proto.connection_made(self.transport)
+        test_utils.run_briefly(self.loop)
+        proto.connection_lost(None)
+        self.assertIsInstance(waiter.exception(), ConnectionResetError)
+        self.assertFalse(self.app_protocol.connection_lost.called)
+
+    def test_garbage_aborts(self):
+        waiter = asyncio.Future(loop=self.loop)
+        proto = self.ssl_protocol(waiter)
+        proto.connection_made(self.transport)
+        test_utils.run_briefly(self.loop)
+        proto.data_received(b'\x00' * 64)
+        self.assertTrue(self.transport.abort.called)
+        self.assertIsInstance(waiter.exception(), ssl.SSLError)
+
+    def test_handshake_timeout(self):
+        waiter = asyncio.Future(loop=self.loop)
+        done = []
+        server_context, client_context = make_contexts()
+        proto = sslproto.SSLProtocol(self.loop, self.app_protocol,
+                                     client_context, waiter,
+                                     handshake_timeout=0.01,
+                                     handshake_callback=done.append)
+        proto.connection_made(self.transport)
+        self.assertRaises(TimeoutError,
+                          self.loop.run_until_complete, waiter)
+        self.assertTrue(self.transport.abort.called)
+        self.assertEqual(1, len(done))
+        self.assertIsInstance(done[0], TimeoutError)
+        proto.connection_lost(None)
+        self.assertEqual(1, len(done))
+
+    def test_handshake_callback(self):
+        done = []
+        server_context, client_context = make_contexts()
+        client = sslproto.SSLProtocol(self.loop, self.app_protocol,
+                                      client_context, None,
+                                      handshake_timeout=60.0,
+                                      handshake_callback=done.append)
+        self.handshake(client, server_context)
+        self.assertEqual([None], done)
+        self.assertIsNone(client._handshake_timeout_handle)
+
+    def handshake(self, client, server_context):
+        # Run the handshake of client against an in-memory server.
+        server = sslproto._SSLPipe(server_context, True)
+        server.do_handshake()
+        client.connection_made(self.transport)
+        test_utils.run_briefly(self.loop)
+
+        def feed_server(data):
+            for ssldata in server.feed_ssldata(data)[0]:
+                client.data_received(ssldata)
+        self.transport.write.side_effect = feed_server
+        feed_server(self.transport.write.call_args[0][0])
+        test_utils.run_briefly(self.loop)
+        self.transport.write.side_effect = None
+        return server
+
+    def test_writelines_batches_records(self):
+        server_context, client_context = make_contexts()
+        client = self.ssl_protocol()
+        server = self.handshake(client, server_context)
+        self.assertTrue(self.app_protocol.connection_made.called)
+
+        self.transport.write.reset_mock()
+        client._app_transport.writelines([b'header', b'body', b'trailer'])
+        self.assertEqual(1, self.transport.write.call_count)
+        ssldata = self.transport.write.call_args[0][0]
+        self.assertEqual([b'headerbodytrailer'],
+                         [b''.join(server.feed_ssldata(ssldata)[1])])
+
+    @unittest.skipIf(not hasattr(ssl, 'SSLSession'), 'No ssl.SSLSession')
+    def test_session_cache(self):
+        server_context, client_context = make_contexts()
+        cache = sslproto.SSLSessionCache()
+        key = ('localhost', 443, client_context)
+
+        client = sslproto.SSLProtocol(
+            self.loop, self.app_protocol, client_context, None,
+            server_hostname='localhost',
+            session_cache=cache, session_key=key)
+        self.handshake(client, server_context)
+        self.assertIsNotNone(cache.get(key))
+        self.assertEqual(1, cache.get_stats()['client_misses'])
+
+        client = sslproto.SSLProtocol(
+            self.loop, self.app_protocol, client_context, None,
+            server_hostname='localhost',
+            session_cache=cache, session_key=key)
+        client.connection_made(self.transport)
+        self.assertIs(cache.get(key), client._sslpipe._session)
+
+    def test_failed_handshake_discards_session(self):
+        server_context, client_context = make_contexts()
+        cache = sslproto.SSLSessionCache()
+        key = ('localhost', 443, client_context)
+        waiter = asyncio.Future(loop=self.loop)
+        client = sslproto.SSLProtocol(
+            self.loop, self.app_protocol, client_context, waiter,
+            server_hostname='localhost',
+            session_cache=cache, session_key=key)
+        client.connection_made(self.transport)
+        test_utils.run_briefly(self.loop)
+        cache.put(key, object())
+        other_key = ('example.com', 443, client_context)
+        cache.put(other_key, object())
+
+        client.data_received(b'\x00' * 64)
+        self.assertIsInstance(waiter.exception(), ssl.SSLError)
+        self.assertIsNone(cache.get(key))
+        self.assertIsNotNone(cache.get(other_key))
+
+    def test_server_side_has_no_session_key(self):
+        server_context, client_context = make_contexts()
+        proto = sslproto.SSLProtocol(
+            self.loop, self.app_protocol, server_context, None,
+            server_side=True, session_cache=sslproto.SSLSessionCache(),
+            session_key=('localhost', 443, server_context))
+        self.assertIsNone(proto._session_key)
+
+
+class SSLSessionCacheTests(unittest.TestCase):
+
+    def test_lru(self):
+        cache = sslproto.SSLSessionCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(2, len(cache))
+
+    def test_stats(self):
+        cache = sslproto.SSLSessionCache()
+        cache._record_handshake(False, True)
+        cache._record_handshake(False, False)
+        cache._record_handshake(True, True)
+        self.assertEqual({'sessions': 0,
+                          'client_hits': 1, 'client_misses': 1,
+                          'server_hits': 1, 'server_misses': 0},
+                         cache.get_stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
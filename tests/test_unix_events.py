@@ -1,14 +1,18 @@
 """Tests for unix_events.py."""
 
+import array
 import collections
 import gc
 import errno
 import io
+import mmap
 import os
 import pprint
 import signal
+import socket
 import stat
 import sys
+import tempfile
 import threading
 import unittest
 import unittest.mock
@@ -1623,5 +1627,283 @@ class PolicyTests(unittest.TestCase):
         new_loop.close()
 
 
+class FdProtocol(asyncio.Protocol):
+
+    def __init__(self, loop):
+        self.data = b''
+        self.fds = []
+        self.received = asyncio.Event(loop=loop)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.data += data
+        self.received.set()
+
+    def fds_received(self, fds):
+        self.fds.extend(fds)
+
+
+class UnixSocketTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'sock')
+
+    def tearDown(self):
+        self.loop.close()
+        self.tmpdir.cleanup()
+
+    def connect(self, proto):
+        server = self.loop.run_until_complete(
+            self.loop.create_unix_server(lambda: proto, self.path))
+        self.addCleanup(server.close)
+        tr, pr = self.loop.run_until_complete(
+            self.loop.create_unix_connection(
+                lambda: FdProtocol(self.loop), self.path))
+        self.addCleanup(tr.close)
+        return tr
+
+    def receive(self, proto, size):
+        @asyncio.coroutine
+        def wait():
+            while len(proto.data) < size:
+                proto.received.clear()
+                yield from proto.received.wait()
+        self.loop.run_until_complete(
+            asyncio.wait_for(wait(), 5, loop=self.loop))
+
+    def test_send_fds(self):
+        proto = FdProtocol(self.loop)
+        tr = self.connect(proto)
+        self.assertEqual(tr.get_extra_info('peername'), self.path)
+
+        rfd, wfd = os.pipe()
+        tr.write(b'head')
+        tr.send_fds(b'fd', [rfd])
+        os.close(rfd)
+        tr.write(b'tail')
+        self.receive(proto, 10)
+        self.assertEqual(proto.data, b'headfdtail')
+        self.assertEqual(len(proto.fds), 1)
+        try:
+            os.write(wfd, b'through')
+            self.assertEqual(os.read(proto.fds[0], 7), b'through')
+        finally:
+            os.close(wfd)
+            os.close(proto.fds[0])
+        self.assertFalse(tr._fd_marks)
+
+    def test_send_fds_corked(self):
+        proto = FdProtocol(self.loop)
+        tr = self.connect(proto)
+
+        rfd, wfd = os.pipe()
+        self.addCleanup(os.close, rfd)
+        self.addCleanup(os.close, wfd)
+        tr.cork()
+        tr.write(b'x' * 1000)
+        tr.send_fds(b'a', [rfd])
+        tr.send_fds(b'b', [wfd, rfd])
+        tr.uncork()
+        self.receive(proto, 1002)
+        self.assertEqual(len(proto.fds), 3)
+        for fd in proto.fds:
+            os.close(fd)
+
+    def test_send_fds_without_data(self):
+        tr = self.connect(FdProtocol(self.loop))
+        self.assertRaises(ValueError, tr.send_fds, b'', [0])
+
+    def test_write_after_connection_lost(self):
+        tr = self.connect(FdProtocol(self.loop))
+        tr.write(b'abc')
+        tr._conn_lost = 1
+        tr.write(b'dropped')
+        self.assertEqual(tr._written, 3)
+
+    def test_fds_closed_without_handler(self):
+        proto = asyncio.Protocol()
+        proto.data_received = unittest.mock.Mock()
+        rsock, wsock = socket.socketpair()
+        self.addCleanup(wsock.close)
+        tr = self.loop._make_socket_transport(rsock, proto)
+        self.addCleanup(tr.close)
+        self.assertIsInstance(tr, gbulb.unix_events._UnixSocketTransport)
+
+        wsock.sendmsg([b'x'], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                                array.array('i', [0]))])
+        with unittest.mock.patch.object(tr, '_close_fds',
+                                        wraps=tr._close_fds) as close_fds:
+            tr._read_ready()
+        proto.data_received.assert_called_with(b'x')
+        fds, = close_fds.call_args[0]
+        self.assertEqual(len(fds), 1)
+        self.assertNotEqual(fds[0], 0)
+
+    def test_create_unix_server_stale_socket(self):
+        sock = socket.socket(socket.AF_UNIX)
+        sock.bind(self.path)
+        sock.close()
+        server = self.loop.run_until_complete(
+            self.loop.create_unix_server(asyncio.Protocol, self.path))
+        server.close()
+
+    def test_create_unix_server_existing_file(self):
+        open(self.path, 'w').close()
+        self.assertRaises(
+            OSError, self.loop.run_until_complete,
+            self.loop.create_unix_server(asyncio.Protocol, self.path))
+
+    def test_create_unix_connection_path_and_sock(self):
+        sock = socket.socket(socket.AF_UNIX)
+        self.addCleanup(sock.close)
+        self.assertRaises(
+            ValueError, self.loop.run_until_complete,
+            self.loop.create_unix_connection(asyncio.Protocol, self.path,
+                                             sock=sock))
+
+
+class FileProtocol(asyncio.Protocol):
+
+    def __init__(self, loop):
+        self.chunks = []
+        self.eof = False
+        self.done = asyncio.Future(loop=loop)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.chunks.append(data)
+
+    def eof_received(self):
+        self.eof = True
+
+    def connection_lost(self, exc):
+        self.done.set_result(exc)
+
+
+class UnixFileTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'file')
+        self.payload = os.urandom(1024 * 1024 + 123)
+        with open(self.path, 'wb') as f:
+            f.write(self.payload)
+
+    def tearDown(self):
+        self.loop.close()
+        self.tmpdir.cleanup()
+
+    def read_file(self, **kwargs):
+        tr, pr = self.loop.run_until_complete(self.loop.connect_read_file(
+            lambda: FileProtocol(self.loop), open(self.path, 'rb'),
+            **kwargs))
+        self.assertIsNone(self.loop.run_until_complete(pr.done))
+        self.assertTrue(pr.eof)
+        return pr
+
+    def test_read(self):
+        pr = self.read_file(offset=100, chunk_size=100000)
+        self.assertEqual(b''.join(pr.chunks), self.payload[100:])
+        # Chunks are rounded up to whole pages and aligned after the first.
+        size = len(pr.chunks[1])
+        self.assertEqual(size % mmap.PAGESIZE, 0)
+        self.assertEqual((100 + len(pr.chunks[0])) % size, 0)
+
+    def test_read_mmap(self):
+        pr = self.read_file(use_mmap=True)
+        self.assertEqual(b''.join(pr.chunks), self.payload)
+
+    def test_read_empty_mmap(self):
+        open(self.path, 'wb').close()
+        pr = self.read_file(use_mmap=True)
+        self.assertEqual(pr.chunks, [])
+
+    def test_pause_reading(self):
+        class Proto(FileProtocol):
+            def data_received(self, data):
+                super().data_received(data)
+                if len(self.chunks) == 1:
+                    self.transport.pause_reading()
+                    loop.call_later(0.05, self.transport.resume_reading)
+
+        loop = self.loop
+        f = open(self.path, 'rb')
+        tr, pr = loop.run_until_complete(loop.connect_read_file(
+            lambda: Proto(loop), f, chunk_size=65536))
+        loop.run_until_complete(asyncio.sleep(0.02, loop=loop))
+        self.assertEqual(len(pr.chunks), 1)
+        loop.run_until_complete(pr.done)
+        self.assertEqual(b''.join(pr.chunks), self.payload)
+        self.assertTrue(f.closed)
+
+    def test_close_while_reading(self):
+        f = open(self.path, 'rb')
+        tr, pr = self.loop.run_until_complete(self.loop.connect_read_file(
+            lambda: FileProtocol(self.loop), f))
+        tr.close()
+        self.loop.run_until_complete(pr.done)
+        self.assertFalse(pr.eof)
+        self.loop.run_until_complete(asyncio.sleep(0.1, loop=self.loop))
+        self.assertTrue(f.closed)
+
+    def test_write(self):
+        class Proto(FileProtocol):
+            paused = 0
+
+            def pause_writing(self):
+                self.paused += 1
+
+        f = open(self.path, 'r+b')
+        f.seek(10)
+        tr, pr = self.loop.run_until_complete(self.loop.connect_write_file(
+            lambda: Proto(self.loop), f))
+        data = os.urandom(512 * 1024)
+        for i in range(0, len(data), 4096):
+            tr.write(data[i:i + 4096])
+        self.assertGreater(pr.paused, 0)
+        tr.close()
+        self.assertIsNone(self.loop.run_until_complete(pr.done))
+        self.assertTrue(f.closed)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(),
+                             self.payload[:10] + data +
+                             self.payload[10 + len(data):])
+
+    def test_not_regular_file(self):
+        with open(os.devnull, 'rb') as f:
+            self.assertRaises(
+                ValueError, self.loop.run_until_complete,
+                self.loop.connect_read_file(asyncio.Protocol, f))
+
+    def test_streams(self):
+        @asyncio.coroutine
+        def copy():
+            reader = yield from gbulb.open_file_reader(self.path,
+                                                       loop=self.loop)
+            writer = yield from gbulb.open_file_writer(self.path + '.copy',
+                                                       loop=self.loop)
+            while True:
+                data = yield from reader.read(50000)
+                if not data:
+                    break
+                writer.write(data)
+                yield from writer.drain()
+            writer.close()
+
+        self.loop.run_until_complete(copy())
+        self.loop.run_until_complete(asyncio.sleep(0.1, loop=self.loop))
+        with open(self.path + '.copy', 'rb') as f:
+            self.assertEqual(f.read(), self.payload)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,150 @@
+"""Tests for workers.py"""
+
+import threading
+import unittest
+import unittest.mock
+
+import asyncio
+
+import gbulb
+from gbulb import workers
+from gi.repository import GLib
+from gi.repository import GObject
+
+gbulb.BaseGLibEventLoop.init_class()
+GObject.threads_init()
+
+
+class WorkerLoopPoolBalanceTests(unittest.TestCase):
+
+    def pool(self, balance):
+        pool = workers.WorkerLoopPool(3, balance=balance)
+        pool._loops = [unittest.mock.Mock() for i in range(3)]
+        return pool
+
+    def dispatch(self, pool):
+        pool._dispatch(unittest.mock.Mock(), unittest.mock.Mock(),
+                       ('127.0.0.1', 1), asyncio.Protocol, None,
+                       unittest.mock.Mock())
+        return [loop.call_soon_threadsafe.call_count for loop in pool._loops]
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, workers.WorkerLoopPool, 0)
+        self.assertRaises(ValueError, workers.WorkerLoopPool, 2,
+                          balance='random')
+
+    def test_round_robin(self):
+        pool = self.pool('round-robin')
+        for i in range(4):
+            counts = self.dispatch(pool)
+        self.assertEqual([2, 1, 1], counts)
+        self.assertEqual({'connections': [2, 1, 1], 'dispatched': 4},
+                         pool.get_stats())
+
+    def test_least_loaded(self):
+        pool = self.pool('least-loaded')
+        for i in range(4):
+            counts = self.dispatch(pool)
+        self.assertEqual([2, 1, 1], counts)
+        pool._release(next(iter(pool._proxies[1])))
+        self.assertEqual([2, 2, 1], self.dispatch(pool))
+        self.assertEqual([2, 1, 1], pool.get_stats()['connections'])
+
+    def test_detach_forwarded_to_server_loop(self):
+        pool = self.pool('round-robin')
+        loop = unittest.mock.Mock()
+        server = unittest.mock.Mock()
+        pool._dispatch(loop, unittest.mock.Mock(), ('127.0.0.1', 1),
+                       asyncio.Protocol, None, server)
+        self.assertTrue(server.attach.called)
+        proxy = server.attach.call_args[0][0]
+        transport = object()
+        proxy.detach(transport)
+        loop.call_soon_threadsafe.assert_called_with(server.detach, transport)
+        self.assertEqual([0, 0, 0], pool.get_stats()['connections'])
+
+    def test_not_started(self):
+        pool = workers.WorkerLoopPool(2)
+        conn = unittest.mock.Mock()
+        self.assertRaises(RuntimeError, pool._dispatch, unittest.mock.Mock(),
+                          conn, ('127.0.0.1', 1), asyncio.Protocol, None,
+                          None)
+        self.assertTrue(conn.close.called)
+
+
+class WorkerLoopPoolServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = gbulb.GLibEventLoop(GLib.main_context_default())
+        asyncio.set_event_loop(None)
+        self.pool = workers.WorkerLoopPool(2)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.close()
+        self.loop.close()
+
+    def test_connections_run_in_worker_threads(self):
+        threads = []
+        main_loop = self.loop
+
+        class Echo(asyncio.Protocol):
+            def connection_made(self, transport):
+                threads.append(threading.current_thread())
+                self.transport = transport
+
+            def data_received(self, data):
+                self.transport.write(data)
+                self.transport.close()
+
+        server = self.loop.run_until_complete(self.loop.create_server(
+            Echo, '127.0.0.1', 0, worker_pool=self.pool))
+        port = server.sockets[0].getsockname()[1]
+
+        @asyncio.coroutine
+        def client():
+            reader, writer = yield from asyncio.open_connection(
+                '127.0.0.1', port, loop=main_loop)
+            writer.write(b'ping')
+            data = yield from reader.read()
+            writer.close()
+            return data
+
+        for i in range(4):
+            self.assertEqual(b'ping', self.loop.run_until_complete(client()))
+
+        server.close()
+        self.loop.run_until_complete(server.wait_closed())
+        self.assertEqual(4, len(threads))
+        self.assertEqual({thread.name for thread in threads},
+                         {'gbulb-worker-0', 'gbulb-worker-1'})
+        self.assertEqual({'connections': [0, 0], 'dispatched': 4},
+                         self.pool.get_stats())
+
+    def test_close_detaches_open_connections(self):
+        main_loop = self.loop
+        server = self.loop.run_until_complete(self.loop.create_server(
+            asyncio.Protocol, '127.0.0.1', 0, worker_pool=self.pool))
+        port = server.sockets[0].getsockname()[1]
+
+        @asyncio.coroutine
+        def connect():
+            reader, writer = yield from asyncio.open_connection(
+                '127.0.0.1', port, loop=main_loop)
+            while not self.pool.get_stats()['dispatched']:
+                yield from asyncio.sleep(0.01, loop=main_loop)
+            return reader, writer
+
+        reader, writer = self.loop.run_until_complete(connect())
+        self.pool.close()
+        self.assertEqual(b'', self.loop.run_until_complete(reader.read()))
+        writer.close()
+
+        server.close()
+        self.loop.run_until_complete(asyncio.wait_for(
+            server.wait_closed(), 5, loop=self.loop))
+        self.assertEqual([0, 0], self.pool.get_stats()['connections'])
+
+
+if __name__ == '__main__':
+    unittest.main()